@@ -0,0 +1,170 @@
+"""
+Compresión del contexto recuperado antes de armar el prompt.
+
+Los chunks de la base de conocimiento tienen 1000 caracteres con 200 de
+solapamiento, así que unir los tres recuperados repite texto y arrastra
+oraciones que no tienen que ver con la pregunta. El compresor parte los chunks
+en oraciones, las puntúa por similitud con el embedding de la consulta, elige
+con MMR (relevancia menos redundancia con lo ya elegido, lo que descarta los
+solapamientos) y las empaqueta dentro de un presupuesto de tokens, en el orden
+en que aparecían en los documentos.
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from agent.memory import estimate_tokens
+from utils.text import normalize_text
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?:;])\s+|\n+")
+MIN_SENTENCE_CHARS = 12
+
+
+def split_sentences(text):
+    """Oraciones de un chunk; los fragmentos muy cortos se pegan a la oración anterior"""
+    sentences = []
+    for part in SENTENCE_BOUNDARY.split(text):
+        part = part.strip()
+        if not part:
+            continue
+        if sentences and len(part) < MIN_SENTENCE_CHARS:
+            sentences[-1] = f"{sentences[-1]} {part}"
+        else:
+            sentences.append(part)
+    return sentences
+
+
+class ContextCompressor:
+    """
+    Selecciona las oraciones más relevantes de los documentos recuperados
+    dentro de un presupuesto de tokens.
+
+    Los embeddings de las oraciones se guardan en una caché LRU: los mismos
+    chunks vuelven a recuperarse en muchas consultas y no hace falta embeberlos
+    otra vez.
+    """
+
+    def __init__(self, embeddings, max_tokens=256, mmr_lambda=0.7, cache_size=4096,
+                 token_counter=estimate_tokens):
+        self.embeddings = embeddings
+        self.max_tokens = max_tokens
+        self.mmr_lambda = mmr_lambda
+        self.cache_size = cache_size
+        self.count_tokens = token_counter
+        self._cache = OrderedDict()  # oración -> vector normalizado
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _sentence_vectors(self, sentences):
+        unique = list(dict.fromkeys(sentences))
+        with self._lock:
+            # Copia local: otra consulta puede descartar estas entradas de la caché
+            found = {s: self._cache[s] for s in unique if s in self._cache}
+            for sentence in found:
+                self._cache.move_to_end(sentence)
+        missing = [s for s in unique if s not in found]
+        if missing:
+            # Embeber fuera del lock: otra consulta puede usar la caché mientras tanto
+            vectors = np.asarray(self.embeddings.embed_documents(missing), dtype=np.float32)
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            found.update(zip(missing, vectors))
+        with self._lock:
+            self.cache_hits += len(sentences) - len(missing)
+            self.cache_misses += len(missing)
+            for sentence in missing:
+                self._cache[sentence] = found[sentence]
+                self._cache.move_to_end(sentence)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return np.stack([found[s] for s in sentences])
+
+    @staticmethod
+    def _candidates(documents):
+        """Oraciones únicas en orden de aparición; descarta las repetidas por el solapamiento"""
+        entries = [
+            (sentence, normalize_text(sentence))
+            for document in documents
+            for sentence in split_sentences(document.page_content)
+        ]
+        sentences = []
+        for i, (sentence, key) in enumerate(entries):
+            # Repetida, o fragmento cortado en el borde del chunk contenido en la oración completa
+            if any(key in other and (key != other or j < i) for j, (_, other) in enumerate(entries) if j != i):
+                continue
+            sentences.append(sentence)
+        return sentences
+
+    def select(self, query_vector, sentences):
+        """Índices de las oraciones elegidas con MMR que caben en el presupuesto"""
+        vectors = self._sentence_vectors(sentences)
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        relevance = vectors @ query
+        tokens = [self.count_tokens(s) for s in sentences]
+
+        selected = []
+        # Máxima similitud de cada oración con las ya elegidas
+        redundancy = np.zeros(len(sentences), dtype=np.float32)
+        remaining = set(range(len(sentences)))
+        budget = self.max_tokens
+        while remaining and budget > 0:
+            scores = self.mmr_lambda * relevance - (1 - self.mmr_lambda) * redundancy
+            best = max((i for i in remaining if tokens[i] <= budget), key=scores.__getitem__, default=None)
+            if best is None:
+                break
+            selected.append(best)
+            remaining.discard(best)
+            budget -= tokens[best]
+            redundancy = np.maximum(redundancy, vectors @ vectors[best])
+        return sorted(selected)
+
+    def compress(self, query_vector, documents):
+        """
+        Devuelve (contexto comprimido, tokens ahorrados) para los documentos
+        recuperados. Si el contexto completo ya cabe en el presupuesto se
+        devuelve sin cambios.
+        """
+        full_context = "\n".join(document.page_content for document in documents)
+        tokens_before = self.count_tokens(full_context)
+        if tokens_before <= self.max_tokens:
+            context = full_context
+        else:
+            sentences = self._candidates(documents)
+            context = " ".join(sentences[i] for i in self.select(query_vector, sentences)) if sentences else ""
+        tokens_after = self.count_tokens(context)
+
+        with self._lock:
+            self.queries += 1
+            self.tokens_before += tokens_before
+            self.tokens_after += tokens_after
+        return context, tokens_before - tokens_after
+
+    def stats(self):
+        return {
+            "queries": self.queries,
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "tokens_saved": self.tokens_before - self.tokens_after,
+            "avg_tokens_saved": (self.tokens_before - self.tokens_after) / self.queries if self.queries else 0.0,
+            "sentence_cache_size": len(self._cache),
+            "sentence_cache_hits": self.cache_hits,
+            "sentence_cache_misses": self.cache_misses,
+        }
+
+
+def create_context_compressor(embeddings):
+    """Crea el compresor de contexto salvo que esté desactivado (MEDICHAT_CONTEXT_COMPRESSION=0)"""
+    if os.environ.get("MEDICHAT_CONTEXT_COMPRESSION", "1") == "0":
+        return None
+    return ContextCompressor(
+        embeddings,
+        max_tokens=int(os.environ.get("MEDICHAT_CONTEXT_MAX_TOKENS", "256")),
+        mmr_lambda=float(os.environ.get("MEDICHAT_CONTEXT_MMR_LAMBDA", "0.7")),
+    )
@@ -1,40 +1,95 @@
-from langchain.memory import ConversationBufferMemory
-from langchain.chains import ConversationChain
 from agent.medical_qa import MedicalQASystem
+from agent.memory import create_memory
 from agent.recommender import SpecialistRecommender
+from agent.symptom_lexicon import (
+    COMMON_SYMPTOM_MATCHER,
+    CONDITION_MATCHER,
+    DEFAULT_FALLBACK_CONDITIONS,
+    FALLBACK_MATCHER,
+    match_conditions,
+)
+from utils.metrics import metrics
+from utils.scheduler import PRIORITY_BACKGROUND
+import asyncio
 import re
 
+# Palabras que siguen a un síntoma y describen su contexto ("dolor de cabeza")
+SYMPTOM_CONTEXT_PATTERN = re.compile(r"\s+\w+\s*\w*")
+
+# Preguntas de seguimiento que se responden con la base de conocimiento
+QUESTION_PATTERN = re.compile(r"(?i)\?|^\s*¿?\s*(qu[ée]|c[óo]mo|por\s?qu[ée]|cu[áa]l|cu[áa]ndo|cu[áa]nto|es grave|debo|puedo)\b")
+# Preguntas que piden información médica por sí mismas ("¿Es grave?", "¿Qué puedo tomar?");
+# "¿Cuáles?" o "¿Sí?" siguen en el flujo de recomendaciones
+MEDICAL_QUESTION_PATTERN = re.compile(
+    r"(?i)^\s*¿?\s*(qu[ée]|c[óo]mo|por\s?qu[ée]|cu[áa]ndo|cu[áa]nto|es (grave|normal|peligroso|contagioso)|debo|puedo|tengo que|hay que)\b"
+)
+# Pedidos de más especialistas o de alternativas en la etapa de recomendación
+MORE_OPTIONS_PATTERN = re.compile(r"(?i)otro|más|alternativa|diferente|adicional|distinto")
+# Menciones de especialistas que siempre van al flujo de recomendaciones
+SPECIALIST_PATTERN = re.compile(r"(?i)recomien|especialista|m[ée]dico")
+
 class MedicalConversationAgent:
     def __init__(self):
-        self.memory = ConversationBufferMemory(return_messages=True)
+        # Memoria con presupuesto de tokens (configurable con MEDICHAT_MEMORY)
+        self.memory = create_memory()
         self.qa_system = MedicalQASystem()
         self.recommender = SpecialistRecommender()
         self.conversation_stage = "greeting"
         self.previous_recommendation_request = False
         self.collected_symptoms = []  # Lista de síntomas acumulados durante la conversación
         self.symptom_confidence = {}  # Diccionario para rastrear confianza en cada síntoma reportado
+        # Recuperación especulativa lanzada al describir síntomas: las preguntas
+        # de seguimiento usan ese contexto en lugar de volver a consultar la base
+        self.prefetched_context = None
         
     async def process_message(self, message: str):
+        # Acumular la respuesta completa a partir del streaming
+        tokens = []
+        async for token in self.stream_message(message):
+            tokens.append(token)
+        return "".join(tokens)
+    
+    async def stream_message(self, message: str):
+        """Procesa el mensaje y emite la respuesta por fragmentos a medida que está disponible"""
         # Actualizar memoria
         self.memory.chat_memory.add_user_message(message)
         
         # Verificar si el mensaje es una despedida
-        if self._is_farewell(message):
+        with metrics.span("stage_seconds", stage="farewell_check"):
+            is_farewell = self._is_farewell(message)
+        
+        if is_farewell:
+            stage = "farewell"
             response = self._handle_farewell()
         # Determinar etapa de conversación
         elif self.conversation_stage == "greeting":
+            stage = "greeting"
             response = self._handle_greeting(message)
         elif self.conversation_stage == "symptom_collection":
-            response = await self._handle_symptoms(message)
-        elif self.conversation_stage == "recommendation":
-            response = self._handle_recommendation(message)
+            stage = "symptoms"
+            with metrics.span("stage_seconds", stage=stage):
+                response = await self._handle_symptoms(message)
+        elif self.conversation_stage == "recommendation" and not self._is_follow_up_question(message):
+            stage = "recommendation"
+            with metrics.span("stage_seconds", stage=stage):
+                response = self._handle_recommendation(message)
         else:
-            # Manejar conversación general
-            response = await self.qa_system.answer_medical_question(message, self.memory)
+            # Manejar conversación general: los tokens del LLM se reenvían según llegan
+            metrics.increment("turns_total", stage="qa")
+            documents = await self._take_prefetched_context()
+            metrics.increment("prefetch_total", result="reused" if documents is not None else "none")
+            tokens = []
+            async for token in self.qa_system.stream_medical_answer(message, self.memory, documents):
+                tokens.append(token)
+                yield token
+            self.memory.chat_memory.add_ai_message("".join(tokens))
+            return
+        
+        metrics.increment("turns_total", stage=stage)
+        yield response
         
         # Actualizar memoria con la respuesta
         self.memory.chat_memory.add_ai_message(response)
-        return response
     
     def _is_farewell(self, message: str):
         """Detecta si el mensaje es una despedida o agradecimiento final"""
@@ -63,9 +118,57 @@ class MedicalConversationAgent:
         """Maneja las despedidas del usuario"""
         self.conversation_stage = "greeting"  # Reiniciar para próxima conversación
         self.recommender.reset_recommendations()  # Limpiar recomendaciones previas
+        self.cancel_prefetch()
         
         return "Ha sido un placer ayudarte. Recuerda que siempre es importante consultar con un profesional médico para un diagnóstico adecuado. ¡Cuídate y hasta pronto!"
     
+    def _is_follow_up_question(self, message: str):
+        """
+        Pregunta médica clara después del diagnóstico: empieza como consulta
+        ("¿Es grave?", "¿Qué puedo tomar?") o menciona un síntoma o condición,
+        y no pide especialistas ni más opciones.
+        """
+        if QUESTION_PATTERN.search(message) is None:
+            return False
+        if MORE_OPTIONS_PATTERN.search(message) or SPECIALIST_PATTERN.search(message):
+            return False
+        message_lower = message.lower()
+        return (MEDICAL_QUESTION_PATTERN.search(message) is not None
+                or bool(CONDITION_MATCHER.find_all(message_lower))
+                or bool(COMMON_SYMPTOM_MATCHER.find_all(message_lower)))
+    
+    def _prefetch_context(self, message: str):
+        self.cancel_prefetch()
+        # Prioridad baja: la recuperación especulativa no debe retrasar respuestas en curso
+        self.prefetched_context = asyncio.ensure_future(
+            self.qa_system.retrieve_documents(message, priority=PRIORITY_BACKGROUND)
+        )
+        # Si nadie llega a usar el contexto, su error no debe quedar como excepción sin recuperar
+        self.prefetched_context.add_done_callback(lambda task: task.cancelled() or task.exception())
+    
+    def cancel_prefetch(self):
+        """Cancela la recuperación especulativa pendiente y descarta su contexto"""
+        if self.prefetched_context is not None:
+            self.prefetched_context.cancel()
+            self.prefetched_context = None
+    
+    async def _take_prefetched_context(self):
+        """
+        Documentos de la recuperación especulativa, o None si no hay, falló o
+        el servidor estaba saturado. Se usan una sola vez: las preguntas
+        siguientes recuperan su propio contexto.
+        """
+        task, self.prefetched_context = self.prefetched_context, None
+        if task is None or task.cancelled():
+            return None
+        try:
+            documents, query_vector = await task
+        except Exception:
+            return None
+        if not documents or query_vector is None:
+            return None
+        return documents
+    
     def _handle_greeting(self, message: str):
         self.conversation_stage = "symptom_collection"
         return "Para ayudarte mejor, necesito saber tus síntomas. ¿Podrías describir cómo te sientes? Por ejemplo, ¿tienes dolor, fiebre, u otros síntomas?"
@@ -75,8 +178,16 @@ class MedicalConversationAgent:
         if re.match(r"(?i)^no\.?$", message.strip()) and not self.qa_system.last_conditions:
             return "Entiendo. Si en algún momento necesitas asistencia con síntomas o tienes preguntas médicas, estoy aquí para ayudarte."
             
+        # Recuperar el contexto del mensaje en paralelo con la extracción de síntomas;
+        # la respuesta no lo espera, queda en la sesión para la siguiente pregunta
+        self._prefetch_context(message)
+        
         # Extraer síntomas del mensaje
-        symptoms = await self.qa_system.extract_symptoms(message)
+        try:
+            symptoms = await self.qa_system.extract_symptoms(message)
+        except BaseException:
+            self.cancel_prefetch()
+            raise
         
         # Verificación explícita para detectar texto del prompt en los síntomas
         # y filtrarlo para evitar respuestas inconsistentes
@@ -90,16 +201,14 @@ class MedicalConversationAgent:
         # Si no se detectaron síntomas válidos pero el mensaje parece contener información médica
         # intentar extraer manualmente algunos síntomas comunes
         if not cleaned_symptoms and len(message) > 10:
-            common_symptoms = ["dolor", "fiebre", "tos", "mareo", "náusea", "fatiga", 
-                               "cansancio", "picazón", "vómito", "diarrea"]
-            for symptom in common_symptoms:
-                if symptom in message.lower():
-                    # Intentar extraer el contexto alrededor del síntoma
-                    match = re.search(f"\\b{symptom}\\s+\\w+\\s*\\w*", message.lower())
-                    if match:
-                        cleaned_symptoms.append(match.group(0))
-                    else:
-                        cleaned_symptoms.append(symptom)
+            message_lower = message.lower()
+            for match in COMMON_SYMPTOM_MATCHER.find_all(message_lower):
+                # Intentar extraer el contexto alrededor del síntoma
+                context = SYMPTOM_CONTEXT_PATTERN.match(message_lower, match.end)
+                if context:
+                    cleaned_symptoms.append(message_lower[match.start:context.end()])
+                else:
+                    cleaned_symptoms.append(message_lower[match.start:match.end])
         
         if len(cleaned_symptoms) > 0:
             # Si tenemos síntomas suficientes, pasar a recomendaciones
@@ -123,31 +232,12 @@ class MedicalConversationAgent:
     
     def _get_fallback_conditions(self, symptoms):
         """Proporciona condiciones de respaldo basadas en síntomas comunes"""
-        symptom_conditions = {
-            "dolor de cabeza": ["Migraña", "Cefalea tensional", "Sinusitis"],
-            "dolor": ["Inflamación muscular", "Artritis", "Fibromialgia"],
-            "pecho": ["Angina de pecho", "Bronquitis", "Ansiedad"],
-            "fiebre": ["Gripe", "Infección viral", "COVID-19"],
-            "tos": ["Resfriado común", "Bronquitis", "Asma"],
-            "mareo": ["Vértigo", "Hipotensión", "Anemia"],
-            "náusea": ["Gastroenteritis", "Migraña", "Intoxicación alimentaria"],
-            "cansancio": ["Anemia", "Hipotiroidismo", "Depresión"],
-            "abdominal": ["Gastritis", "Síndrome de intestino irritable", "Indigestión"]
-        }
-        
-        matched_conditions = []
-        for symptom in symptoms:
-            symptom_lower = symptom.lower()
-            for key, conditions in symptom_conditions.items():
-                if key in symptom_lower:
-                    matched_conditions.extend(conditions)
-        
-        # Eliminar duplicados y limitar a 3
-        unique_conditions = list(dict.fromkeys(matched_conditions))
+        # Una sola pasada del léxico de respaldo sobre todos los síntomas
+        unique_conditions = match_conditions(symptoms, matcher=FALLBACK_MATCHER)
         if unique_conditions:
-            return unique_conditions[:3]
+            return unique_conditions
         else:
-            return ["Posible afección temporal", "Estrés", "Condición leve"]
+            return list(DEFAULT_FALLBACK_CONDITIONS)
     
     def _handle_recommendation(self, message: str):
         # Primero verificar si el usuario quiere terminar
@@ -174,7 +264,7 @@ class MedicalConversationAgent:
                 return "Para tus síntomas, te recomendaría inicialmente consultar con un médico general que pueda evaluarte y referirte al especialista adecuado si es necesario."
                 
         # Detectar si el usuario está pidiendo alternativas o más opciones
-        elif re.search(r"(?i)otro|más|alternativa|diferente|adicional|distinto", message):
+        elif MORE_OPTIONS_PATTERN.search(message):
             self.previous_recommendation_request = True  # Mantener activo el contexto de recomendación
             
             # Obtener especialistas excluyendo los anteriores
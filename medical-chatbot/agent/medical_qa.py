@@ -1,44 +1,93 @@
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
-from models.qa_model import get_medical_qa_model
-from utils.vector_store import get_vector_store
+import time
+
+from agent.symptom_lexicon import match_conditions
+from models.resilience import LLMUnavailableError
+from utils.executor import ExecutorBusyError
+from utils.ingest import document_chunk_id
+from utils.metrics import metrics
+from utils.resources import (
+    get_shared_answer_cache,
+    get_shared_chains,
+    get_shared_context_compressor,
+    get_shared_llm,
+    get_shared_retriever,
+    get_shared_scheduler,
+    get_shared_symptom_extractor,
+    get_shared_vector_store,
+)
+from utils.scheduler import (
+    PRIORITY_QA,
+    PRIORITY_SYMPTOMS,
+    SchedulerBusyError,
+    new_session_id,
+)
+from utils.semantic_cache import context_fingerprint
+
+# Respuestas cuando el LLM no está disponible
+FALLBACK_ANSWER = (
+    "En este momento no puedo generar una respuesta detallada. Si tus síntomas persisten o "
+    "empeoran, consulta con un profesional de la salud."
+)
+FALLBACK_ANSWER_WITH_CONTEXT = (
+    "En este momento no puedo generar una respuesta detallada, pero esta información de mi "
+    "base de conocimiento puede servirte. Recuerda consultar con un profesional de la salud."
+)
+FALLBACK_CONTEXT_CHARS = 600
+# Respuesta inmediata cuando el servidor no admite más trabajo
+BUSY_ANSWER = (
+    "En este momento estoy atendiendo muchas consultas. Por favor, intenta de nuevo "
+    "en unos segundos."
+)
 
 class MedicalQASystem:
     def __init__(self):
-        self.llm = get_medical_qa_model()
-        self.vector_store = get_vector_store()
+        # El LLM y la base vectorial se comparten entre todas las sesiones
+        self.llm = get_shared_llm()
+        self.vector_store = get_shared_vector_store()
+        # Búsquedas asíncronas ejecutadas fuera del event loop
+        self.retriever = get_shared_retriever()
+        # Caché semántica de respuestas (opcional, None si está desactivada)
+        self.answer_cache = get_shared_answer_cache()
+        # Extracción de síntomas por léxico (opcional, None si está desactivada)
+        self.symptom_extractor = get_shared_symptom_extractor()
+        # Compresión del contexto recuperado (opcional, None si está desactivada)
+        self.context_compressor = get_shared_context_compressor()
+        # Límites de concurrencia por recurso, con turnos justos entre sesiones
+        self.scheduler = get_shared_scheduler()
+        self.session_id = new_session_id()
         self.last_conditions = []
         
-        # Prompts para diferentes tareas
-        self.symptom_extraction_prompt = PromptTemplate(
-            input_variables=["patient_message"],
-            template="""
-            Extrae los síntomas mencionados en el siguiente mensaje del paciente:
-            
-            Mensaje: {patient_message}
-            
-            Lista de síntomas (separados por coma):
-            """
-        )
-        
-        self.condition_analysis_prompt = PromptTemplate(
-            input_variables=["symptoms", "context"],
-            template="""
-            Basado en los siguientes síntomas y la información médica proporcionada,
-            lista hasta 3 posibles condiciones médicas que podrían estar relacionadas.
-            Escribe solo el nombre de cada condición, una por línea, sin numeración ni prefijos.
-            
-            Síntomas: {symptoms}
-            
-            Información médica: {context}
-            
-            Posibles condiciones médicas:
-            """
-        )
+        # Prompts y cadenas compilados una vez por proceso
+        self.chains = get_shared_chains()
+        self.symptom_extraction_prompt = self.chains.symptom_extraction_prompt
+        self.condition_analysis_prompt = self.chains.condition_analysis_prompt
         
     async def extract_symptoms(self, message):
-        chain = LLMChain(llm=self.llm, prompt=self.symptom_extraction_prompt)
-        result = await chain.arun(patient_message=message)
+        # Si el léxico reconoce el mensaje con suficiente cobertura no hace falta el LLM
+        if self.symptom_extractor is not None:
+            with metrics.span("stage_seconds", stage="extract_symptoms_lexicon"):
+                symptoms = self.symptom_extractor.try_extract(message)
+            if symptoms is not None:
+                metrics.increment("symptom_extractor_total", result="hit")
+                return symptoms
+            metrics.increment("symptom_extractor_total", result="miss")
+        
+        metrics.increment("llm_calls_total", task="symptom_extraction")
+        try:
+            async with self.scheduler.slot("llm", self.session_id, PRIORITY_SYMPTOMS):
+                start = time.perf_counter()
+                result = await self.chains.symptom_extraction.arun(patient_message=message)
+                elapsed = time.perf_counter() - start
+        except (LLMUnavailableError, SchedulerBusyError):
+            # LLM saturado, lento, caído o con el circuito abierto: lo que reconozca el
+            # léxico; si no hay nada, la conversación busca los síntomas por palabras clave
+            metrics.increment("llm_fallback_total", task="symptom_extraction")
+            if self.symptom_extractor is not None:
+                return self.symptom_extractor.extract(message)[0]
+            return []
+        metrics.observe("stage_seconds", elapsed, stage="extract_symptoms_llm")
+        if self.symptom_extractor is not None:
+            self.symptom_extractor.record_llm_latency(elapsed)
         
         # Limpiar el resultado para eliminar cualquier texto de instrucción
         if "lista de síntomas" in result.lower() or "list of symptoms" in result.lower():
@@ -63,182 +112,13 @@ class MedicalQASystem:
         return filtered_symptoms
     
     async def get_possible_conditions(self, symptoms):
-        # Sistema de respaldo con condiciones predefinidas para síntomas comunes
-        predefined_conditions = {
-            # Síntomas generales
-            "fiebre": ["Gripe", "Infección viral", "COVID-19", "Infección bacteriana", "Neumonía"],
-            "escalofríos": ["Gripe", "Infección", "Malaria", "Septicemia", "Neumonía"],
-            "fatiga": ["Anemia", "Hipotiroidismo", "Depresión", "Mononucleosis", "Apnea del sueño"],
-            "cansancio": ["Anemia", "Hipotiroidismo", "Depresión", "Deficiencia de vitaminas", "Enfermedad cardíaca"],
-            "debilidad": ["Anemia", "Hipoglucemia", "Miastenia gravis", "Enfermedad de Parkinson", "Esclerosis múltiple"],
-            "pérdida de peso": ["Hipertiroidismo", "Diabetes", "Cáncer", "Enfermedad inflamatoria intestinal", "Depresión"],
-            "aumento de peso": ["Hipotiroidismo", "Síndrome de Cushing", "Efecto secundario de medicamentos", "Retención de líquidos", "Obesidad"],
-            "sudoración nocturna": ["Tuberculosis", "Linfoma", "Infección", "Menopausia", "Apnea del sueño"],
-            "malestar general": ["Infección viral", "Gripe", "Reacción a medicamentos", "Estrés", "Fatiga crónica"],
-            
-            # Síntomas respiratorios
-            "tos": ["Resfriado común", "Bronquitis", "Asma", "Neumonía", "COVID-19"],
-            "tos seca": ["COVID-19", "Asma", "Alergias", "Reflujo gastroesofágico", "Infección viral"],
-            "tos con flema": ["Bronquitis", "Neumonía", "EPOC", "Infección sinusal", "Tuberculosis"],
-            "tos con sangre": ["Tuberculosis", "Neumonía", "Cáncer de pulmón", "Embolia pulmonar", "Bronquiectasia"],
-            "dificultad para respirar": ["Asma", "Neumonía", "Insuficiencia cardíaca", "EPOC", "Ansiedad"],
-            "respiración rápida": ["Asma", "Neumonía", "Ansiedad", "Acidosis metabólica", "Embolia pulmonar"],
-            "dolor al respirar": ["Neumonía", "Pleuresía", "Costocondritis", "Embolia pulmonar", "Neumotórax"],
-            "congestión nasal": ["Resfriado común", "Sinusitis", "Rinitis alérgica", "Pólipos nasales", "Desviación del tabique"],
-            "secreción nasal": ["Resfriado común", "Rinitis alérgica", "Sinusitis", "Cambios de temperatura", "Exposición a irritantes"],
-            "estornudos": ["Alergia", "Resfriado común", "Rinitis", "Irritantes ambientales", "Infección viral"],
-            "dolor de garganta": ["Faringitis", "Resfriado común", "Amigdalitis", "Laringitis", "Reflujo gastroesofágico"],
-            "ronquera": ["Laringitis", "Nódulos vocales", "Cáncer de laringe", "Reflujo", "Hipotiroidismo"],
-            "sibilancias": ["Asma", "Bronquitis", "EPOC", "Reacción alérgica", "Insuficiencia cardíaca"],
-            
-            # Síntomas cardíacos
-            "dolor de pecho": ["Angina de pecho", "Infarto de miocardio", "Ansiedad", "Costocondritis", "Reflujo gastroesofágico"],
-            "dolor en el pecho": ["Angina de pecho", "Infarto de miocardio", "Ansiedad", "Costocondritis", "Embolia pulmonar"],
-            "palpitaciones": ["Arritmia cardíaca", "Ansiedad", "Hipertiroidismo", "Anemia", "Efectos de cafeína"],
-            "ritmo cardíaco irregular": ["Fibrilación auricular", "Aleteo auricular", "Extrasístoles", "Enfermedad de la válvula cardíaca", "Cardiomiopatía"],
-            "presión arterial alta": ["Hipertensión esencial", "Enfermedad renal", "Apnea del sueño", "Síndrome de Cushing", "Feocromocitoma"],
-            "presión arterial baja": ["Deshidratación", "Hemorragia", "Septicemia", "Medicamentos", "Insuficiencia suprarrenal"],
-            "desmayo": ["Síncope vasovagal", "Hipotensión ortostática", "Arritmia cardíaca", "Hipoglucemia", "Anemia"],
-            "hinchazón de piernas": ["Insuficiencia cardíaca", "Insuficiencia venosa", "Trombosis venosa profunda", "Insuficiencia renal", "Cirrosis"],
-            
-            # Síntomas digestivos
-            "dolor abdominal": ["Gastritis", "Apendicitis", "Cólico biliar", "Pancreatitis", "Enfermedad inflamatoria intestinal"],
-            "dolor estomacal": ["Gastritis", "Úlcera péptica", "Reflujo gastroesofágico", "Dispepsia funcional", "Cáncer gástrico"],
-            "náuseas": ["Gastroenteritis", "Migraña", "Embarazo", "Intoxicación alimentaria", "Efectos secundarios de medicamentos"],
-            "vómitos": ["Gastroenteritis", "Intoxicación alimentaria", "Obstrucción intestinal", "Migraña", "Apendicitis"],
-            "diarrea": ["Gastroenteritis", "Intoxicación alimentaria", "Síndrome de intestino irritable", "Enfermedad de Crohn", "Colitis ulcerosa"],
-            "estreñimiento": ["Dieta baja en fibra", "Deshidratación", "Síndrome de intestino irritable", "Hipotiroidismo", "Efectos secundarios de medicamentos"],
-            "heces negras": ["Sangrado gastrointestinal superior", "Uso de hierro oral", "Bismuto", "Cáncer colorrectal", "Úlcera péptica"],
-            "sangre en las heces": ["Hemorroides", "Fisuras anales", "Enfermedad inflamatoria intestinal", "Pólipos colorectales", "Cáncer colorrectal"],
-            "acidez": ["Reflujo gastroesofágico", "Hernia hiatal", "Gastritis", "Úlcera péptica", "Embarazo"],
-            "distensión abdominal": ["Síndrome de intestino irritable", "Intolerancia a lactosa", "Enfermedad celíaca", "Ascitis", "Obstrucción intestinal"],
-            "ictericia": ["Hepatitis", "Cirrosis", "Obstrucción biliar", "Anemia hemolítica", "Cáncer de páncreas"],
-            "dificultad para tragar": ["Enfermedad por reflujo gastroesofágico", "Acalasia", "Cáncer de esófago", "Ansiedad", "Esclerosis lateral amiotrófica"],
-            
-            # Síntomas neurológicos
-            "dolor de cabeza": ["Migraña", "Cefalea tensional", "Sinusitis", "Hipertensión", "Tumor cerebral"],
-            "cefalea": ["Migraña", "Cefalea tensional", "Cefalea en racimos", "Meningitis", "Aneurisma cerebral"],
-            "mareo": ["Vértigo", "Hipotensión", "Anemia", "Deshidratación", "Ansiedad"],
-            "vértigo": ["Vértigo posicional paroxístico benigno", "Enfermedad de Ménière", "Neuritis vestibular", "Laberintitis", "Tumor cerebral"],
-            "entumecimiento": ["Neuropatía periférica", "Compresión nerviosa", "Esclerosis múltiple", "Accidente cerebrovascular", "Diabetes"],
-            "hormigueo": ["Neuropatía periférica", "Deficiencia de vitamina B12", "Síndrome del túnel carpiano", "Esclerosis múltiple", "Migraña con aura"],
-            "debilidad muscular": ["Esclerosis múltiple", "Miastenia gravis", "Polimiositis", "Enfermedad de Parkinson", "Esclerosis lateral amiotrófica"],
-            "temblores": ["Enfermedad de Parkinson", "Temblor esencial", "Efectos secundarios de medicamentos", "Abstinencia de alcohol", "Hipertiroidismo"],
-            "confusión": ["Delirium", "Demencia", "Infección", "Efectos secundarios de medicamentos", "Encefalopatía metabólica"],
-            "problemas de memoria": ["Enfermedad de Alzheimer", "Demencia vascular", "Depresión", "Hipotiroidismo", "Deficiencia de vitamina B12"],
-            "convulsiones": ["Epilepsia", "Abstinencia de alcohol", "Hipoglucemia", "Fiebre alta", "Tumor cerebral"],
-            "dificultad para hablar": ["Accidente cerebrovascular", "Esclerosis lateral amiotrófica", "Enfermedad de Parkinson", "Distonía", "Ansiedad"],
-            "parálisis facial": ["Parálisis de Bell", "Accidente cerebrovascular", "Síndrome de Guillain-Barré", "Enfermedad de Lyme", "Tumor cerebral"],
-            
-            # Síntomas musculoesqueléticos
-            "dolor articular": ["Artritis", "Artrosis", "Gota", "Lupus", "Enfermedad de Lyme"],
-            "dolor muscular": ["Fibromialgia", "Polimialgia reumática", "Rabdomiólisis", "Infección viral", "Efectos secundarios de estatinas"],
-            "dolor de espalda": ["Hernia de disco", "Estenosis espinal", "Osteoartritis", "Fibromialgia", "Enfermedad renal"],
-            "dolor lumbar": ["Tensión muscular", "Hernia de disco", "Estenosis espinal", "Enfermedad degenerativa de disco", "Espondilolistesis"],
-            "rigidez articular": ["Artritis reumatoide", "Artrosis", "Fibromialgia", "Lupus", "Polimialgia reumática"],
-            "hinchazón articular": ["Artritis", "Gota", "Bursitis", "Lupus", "Lesión traumática"],
-            "dolor de cuello": ["Tensión muscular", "Hernia de disco cervical", "Espondilosis cervical", "Fibromialgia", "Meningitis"],
-            "dolor en extremidades": ["Neuropatía periférica", "Enfermedad arterial periférica", "Trombosis venosa profunda", "Fibromialgia", "Poliomiositis"],
-            
-            # Síntomas de la piel
-            "erupción cutánea": ["Dermatitis", "Urticaria", "Psoriasis", "Infección fúngica", "Reacción alérgica"],
-            "picazón": ["Dermatitis", "Urticaria", "Psoriasis", "Escabiosis", "Reacción alérgica"],
-            "enrojecimiento de la piel": ["Dermatitis", "Rosácea", "Quemadura solar", "Celulitis", "Lupus"],
-            "ampollas": ["Herpes", "Impétigo", "Quemaduras", "Dermatitis de contacto", "Reacciones medicamentosas"],
-            "cambios en lunares": ["Melanoma", "Carcinoma basocelular", "Carcinoma epidermoide", "Queratosis seborreica", "Nevus displásico"],
-            "urticaria": ["Alergia alimentaria", "Alergia a medicamentos", "Infección", "Estrés", "Exposición al calor o frío"],
-            "piel seca": ["Dermatitis atópica", "Psoriasis", "Hipotiroidismo", "Deshidratación", "Deficiencia nutricional"],
-            "sudoración excesiva": ["Hipertiroidismo", "Ansiedad", "Infección", "Obesidad", "Medicamentos"],
-            
-            # Síntomas oculares
-            "visión borrosa": ["Error refractivo", "Cataratas", "Glaucoma", "Retinopatía diabética", "Degeneración macular"],
-            "ojos rojos": ["Conjuntivitis", "Uveítis", "Glaucoma", "Ojo seco", "Blefaritis"],
-            "dolor ocular": ["Glaucoma", "Uveítis", "Sinusitis", "Migraña", "Conjuntivitis"],
-            "sensibilidad a la luz": ["Migraña", "Meningitis", "Uveítis", "Quemadura corneal", "Ojo seco"],
-            "visión doble": ["Miastenia gravis", "Esclerosis múltiple", "Accidente cerebrovascular", "Trauma craneal", "Aneurisma"],
-            "pérdida de visión": ["Glaucoma", "Accidente cerebrovascular", "Desprendimiento de retina", "Neuritis óptica", "Oclusión arterial retiniana"],
-            "ojos secos": ["Síndrome de ojo seco", "Síndrome de Sjögren", "Blefaritis", "Deficiencia de vitamina A", "Efectos secundarios de medicamentos"],
-            "ceguera nocturna": ["Deficiencia de vitamina A", "Retinitis pigmentosa", "Degeneración macular", "Cataratas", "Glaucoma"],
-            
-            # Síntomas auditivos
-            "pérdida de audición": ["Presbiacusia", "Otosclerosis", "Enfermedad de Ménière", "Trauma acústico", "Infección del oído"],
-            "tinnitus": ["Pérdida de audición inducida por ruido", "Enfermedad de Ménière", "Otosclerosis", "Efectos secundarios de medicamentos", "Tumor del nervio acústico"],
-            "dolor de oído": ["Otitis media", "Otitis externa", "Infección del oído", "Disfunción de la articulación temporomandibular", "Absceso dental"],
-            "secreción del oído": ["Otitis media", "Otitis externa", "Perforación del tímpano", "Colesteatoma", "Trauma"],
-            "sensación de oído tapado": ["Disfunción tubárica", "Tapón de cerumen", "Otitis media", "Barotrauma", "Otosclerosis"],
-            
-            # Síntomas urinarios
-            "dolor al orinar": ["Infección urinaria", "Uretritis", "Prostatitis", "Cálculos renales", "Cistitis intersticial"],
-            "micción frecuente": ["Infección urinaria", "Diabetes", "Hiperplasia prostática benigna", "Embarazo", "Vejiga hiperactiva"],
-            "micción urgente": ["Infección urinaria", "Vejiga hiperactiva", "Cistitis intersticial", "Hiperplasia prostática", "Cáncer de vejiga"],
-            "sangre en la orina": ["Infección urinaria", "Cálculos renales", "Cistitis", "Cáncer de vejiga", "Glomerulonefritis"],
-            "incontinencia urinaria": ["Hiperplasia prostática benigna", "Vejiga hiperactiva", "Prolapso pélvico", "Efectos secundarios de medicamentos", "Esclerosis múltiple"],
-            "disminución del flujo urinario": ["Hiperplasia prostática benigna", "Estenosis uretral", "Cáncer de próstata", "Vejiga neurogénica", "Infección urinaria"],
-            "orina oscura": ["Deshidratación", "Hepatitis", "Rabdomiólisis", "Anemia hemolítica", "Porfiria"],
-            
-            # Síntomas psicológicos
-            "ansiedad": ["Trastorno de ansiedad generalizada", "Trastorno de pánico", "Fobia social", "Estrés postraumático", "Hipertiroidismo"],
-            "depresión": ["Trastorno depresivo mayor", "Trastorno bipolar", "Distimia", "Hipotiroidismo", "Trastorno afectivo estacional"],
-            "insomnio": ["Ansiedad", "Depresión", "Apnea del sueño", "Síndrome de piernas inquietas", "Efectos secundarios de medicamentos"],
-            "cambios de humor": ["Trastorno bipolar", "Trastorno premenstrual", "Depresión", "Menopausia", "Trastorno de personalidad límite"],
-            "irritabilidad": ["Ansiedad", "Depresión", "Trastorno bipolar", "Hipertiroidismo", "Síndrome premenstrual"],
-            "pensamientos suicidas": ["Depresión mayor", "Trastorno bipolar", "Esquizofrenia", "Trastorno de estrés postraumático", "Trastorno de personalidad límite"],
-            "alucinaciones": ["Esquizofrenia", "Trastorno bipolar", "Demencia", "Intoxicación por drogas", "Delirium"],
-            "paranoia": ["Esquizofrenia", "Trastorno delirante", "Demencia", "Intoxicación por drogas", "Trastorno de personalidad paranoide"],
-            "ataques de pánico": ["Trastorno de pánico", "Fobia específica", "Trastorno de ansiedad social", "Hipertiroidismo", "Prolapso de la válvula mitral"],
-            
-            # Síntomas endocrinos
-            "sed excesiva": ["Diabetes mellitus", "Diabetes insípida", "Hipertiroidismo", "Deshidratación", "Medicamentos"],
-            "hambre excesiva": ["Diabetes mellitus", "Hipertiroidismo", "Hipoglucemia", "Medicamentos", "Bulimia nerviosa"],
-            "intolerancia al calor": ["Hipertiroidismo", "Menopausia", "Medicamentos", "Lesión hipotalámica", "Feocromocitoma"],
-            "intolerancia al frío": ["Hipotiroidismo", "Anemia", "Enfermedad de Raynaud", "Desnutrición", "Falta de grasa corporal"],
-            "cambios en la distribución del vello": ["Hirsutismo", "Síndrome de ovario poliquístico", "Hiperplasia suprarrenal congénita", "Tumores productores de andrógenos", "Medicamentos"],
-            
-            # Síntomas reproductivos y sexuales
-            "disfunción eréctil": ["Enfermedad cardiovascular", "Diabetes", "Hipertensión", "Depresión", "Efectos secundarios de medicamentos"],
-            "disminución del deseo sexual": ["Depresión", "Bajo nivel de testosterona", "Estrés", "Efectos secundarios de medicamentos", "Problemas de relación"],
-            "dolor durante las relaciones sexuales": ["Vaginismo", "Endometriosis", "Infección vaginal", "Sequedad vaginal", "Prostatitis"],
-            "sangrado vaginal anormal": ["Pólipos uterinos", "Fibromas", "Cáncer de endometrio", "Desequilibrio hormonal", "Endometriosis"],
-            "dolor menstrual": ["Endometriosis", "Adenomiosis", "Enfermedad inflamatoria pélvica", "Fibromas", "Síndrome premenstrual"],
-            "flujo vaginal anormal": ["Vaginosis bacteriana", "Candidiasis", "Tricomoniasis", "Clamidia", "Gonorrea"],
-            "bulto en los senos": ["Quiste mamario", "Fibroadenoma", "Cáncer de mama", "Cambios fibroquísticos", "Mastitis"],
-            "secreción del pezón": ["Papiloma intraductal", "Cambios fibroquísticos", "Cáncer de mama", "Medicamentos", "Desequilibrio hormonal"],
-            
-            # Síntomas específicos
-            "fiebre alta": ["Infección bacteriana", "Neumonía", "Meningitis", "Septicemia", "Malaria"],
-            "deshidratación": ["Gastroenteritis", "Diarrea", "Vómitos", "Golpe de calor", "Diabetes descontrolada"],
-            "somnolencia excesiva": ["Apnea del sueño", "Narcolepsia", "Depresión", "Hipotiroidismo", "Deficiencia de vitamina B12"],
-            "dificultad para concentrarse": ["TDAH", "Ansiedad", "Depresión", "Trastorno del sueño", "Efecto secundario de medicamentos"],
-            "ronquidos": ["Apnea del sueño", "Obesidad", "Pólipos nasales", "Desviación del tabique", "Consumo de alcohol"],
-            "pérdida del gusto": ["COVID-19", "Resfriado común", "Sinusitis", "Medicamentos", "Deficiencia de zinc"],
-            "pérdida del olfato": ["COVID-19", "Resfriado común", "Sinusitis", "Pólipos nasales", "Enfermedad de Parkinson"],
-            "dolor dental": ["Caries", "Absceso dental", "Gingivitis", "Periodontitis", "Sensibilidad dental"],
-            "sangrado de encías": ["Gingivitis", "Periodontitis", "Trastornos de la coagulación", "Leucemia", "Escorbuto"],
-            "rigidez de cuello": ["Meningitis", "Tensión muscular", "Artritis cervical", "Fibromialgia", "Tortícolis"],
-            "piernas inquietas": ["Síndrome de piernas inquietas", "Deficiencia de hierro", "Embarazo", "Insuficiencia renal", "Neuropatía"],
-            "calambres musculares": ["Deshidratación", "Desequilibrio electrolítico", "Deficiencia de magnesio", "Medicamentos", "Síndrome de piernas inquietas"],
-            "inflamación de los ganglios linfáticos": ["Infección", "Mononucleosis", "Trastornos autoinmunes", "Cáncer", "VIH/SIDA"],
-            "tos al acostarse": ["Reflujo gastroesofágico", "Insuficiencia cardíaca", "Asma", "Bronquitis", "Goteo posnasal"],
-            "dolor en las pantorrillas": ["Trombosis venosa profunda", "Calambres musculares", "Shin splints", "Insuficiencia venosa", "Claudicación intermitente"],
-            "decoloración de la piel": ["Vitiligo", "Hígado graso", "Anemia", "Enfermedad de Addison", "Insuficiencia renal"],
-            "bultos en el cuello": ["Aumento de ganglios linfáticos", "Bocio", "Quiste tirogloso", "Cáncer de tiroides", "Lipoma"],
-            "falta de aliento al acostarse": ["Insuficiencia cardíaca", "EPOC", "Asma", "Ansiedad", "Obesidad"],
-            "confusión repentina": ["Accidente cerebrovascular", "Ataque isquémico transitorio", "Infección", "Hipoglucemia", "Delirium"]
-        }
-
-        # Verificar si alguno de los síntomas está en nuestro diccionario predefinido
-        matched_conditions = []
-        for symptom in symptoms:
-            symptom_lower = symptom.lower()
-            for key, conditions in predefined_conditions.items():
-                if key in symptom_lower or symptom_lower in key:
-                    matched_conditions.extend(conditions)
-                    
+        # Sistema de respaldo con condiciones predefinidas para síntomas comunes:
+        # el léxico compilado recorre todos los síntomas en una sola pasada
+        matched_conditions = match_conditions(symptoms)
+        
         # Si encontramos condiciones predefinidas, usarlas
         if matched_conditions:
-            # Eliminar duplicados y limitar a 3 condiciones
-            unique_conditions = list(dict.fromkeys(matched_conditions))
-            self.last_conditions = unique_conditions[:3]
+            self.last_conditions = matched_conditions
             return self.last_conditions
         
         # Respuesta genérica de respaldo 
@@ -246,41 +126,137 @@ class MedicalQASystem:
         self.last_conditions = default_conditions
         return default_conditions
     
-    async def answer_medical_question(self, question, memory):
-        # Recuperar documentos relevantes para la pregunta
-        docs = self.vector_store.similarity_search(
-            question,
-            k=3
-        )
+    async def answer_medical_question(self, question, memory, documents=None):
+        # Acumular la respuesta completa a partir del streaming
+        tokens = []
+        async for token in self.stream_medical_answer(question, memory, documents):
+            tokens.append(token)
+        return "".join(tokens)
+    
+    async def retrieve_documents(self, query, priority=PRIORITY_QA):
+        """
+        Recupera los documentos relevantes para la consulta sin bloquear el event loop.
+        Devuelve (documentos, vector de la consulta); el vector es None si el
+        servidor estaba saturado y no se pudo calcular.
+        """
+        query_vector = None
+        with metrics.span("stage_seconds", stage="retrieval"):
+            try:
+                # Embeber la consulta una sola vez: sirve para la búsqueda, la compresión y la caché
+                async with self.scheduler.slot("embedding", self.session_id, priority):
+                    query_vector = await self.retriever.aembed_query(query)
+                async with self.scheduler.slot("vector_store", self.session_id, priority):
+                    docs = await self.retriever.aretrieve(
+                        query,
+                        k=3,
+                        embedding=query_vector
+                    )
+            except (ExecutorBusyError, SchedulerBusyError):
+                # Si el servidor está saturado, responder sin contexto adicional
+                metrics.increment("retrieval_rejected_total")
+                docs = []
+        return docs, query_vector
+    
+    async def build_context(self, question, docs, question_vector=None):
+        """
+        Arma el contexto del prompt. Con el compresor activo solo entran las
+        oraciones más relevantes para la pregunta, dentro del presupuesto de tokens.
+        """
         context = "\n".join([doc.page_content for doc in docs])
+        if self.context_compressor is None or not docs:
+            return context
+        
+        with metrics.span("stage_seconds", stage="context_compression"):
+            try:
+                async with self.scheduler.slot("embedding", self.session_id, PRIORITY_QA):
+                    if question_vector is None:
+                        question_vector = await self.retriever.aembed_query(question)
+                    context, tokens_saved = await self.retriever.executor.run(
+                        self.context_compressor.compress, question_vector, docs
+                    )
+            except (ExecutorBusyError, SchedulerBusyError):
+                # Si el servidor está saturado, usar los chunks completos
+                metrics.increment("context_compression_total", result="rejected")
+                return context
+        metrics.increment("context_compression_total", result="compressed")
+        metrics.observe("context_tokens_saved", tokens_saved)
+        return context
+    
+    async def stream_medical_answer(self, question, memory, documents=None):
+        """
+        Genera la respuesta a una pregunta médica token a token a medida que llega del LLM.
+        Si se pasan `documents` (contexto ya recuperado en la sesión) no se consulta
+        la base de conocimiento.
+        """
+        if documents is None:
+            docs, question_vector = await self.retrieve_documents(question)
+        else:
+            # El contexto se recuperó para el mensaje de síntomas; la pregunta tiene
+            # su propio vector para la compresión y la caché
+            docs, question_vector = documents, await self._embed_question(question)
+        context = await self.build_context(question, docs, question_vector)
         
-        # Prompt para responder preguntas médicas
-        medical_qa_prompt = PromptTemplate(
-            input_variables=["question", "context", "chat_history"],
-            template="""
-            Como asistente médico virtual, responde a la siguiente pregunta utilizando
-            la información proporcionada y el historial de chat. Si no estás seguro o 
-            la pregunta requiere diagnóstico médico profesional, indícalo claramente.
-            
-            Historial: {chat_history}
-            
-            Información médica: {context}
-            
-            Pregunta: {question}
-            
-            Respuesta:
-            """
-        )
+        # Reutilizar una respuesta previa a una pregunta casi idéntica con el mismo
+        # contexto, en una sesión con las mismas condiciones identificadas
+        fingerprint = None
+        if self.answer_cache is not None and question_vector is not None:
+            chunk_ids = [document_chunk_id(doc) for doc in docs]
+            fingerprint = context_fingerprint(chunk_ids, self.last_conditions)
+            cached_answer = self.answer_cache.lookup(question_vector, fingerprint)
+            metrics.increment("answer_cache_total", result="hit" if cached_answer is not None else "miss")
+            if cached_answer is not None:
+                yield cached_answer
+                return
         
         # Obtener historial de chat
         chat_history = memory.load_memory_variables({})["history"]
         
-        # Crear y ejecutar la cadena
-        chain = LLMChain(llm=self.llm, prompt=medical_qa_prompt)
-        response = await chain.arun(
-            question=question,
-            context=context,
-            chat_history=chat_history
-        )
+        # Emitir los tokens a medida que el LLM los genera.
+        # Los modelos sin streaming nativo devuelven la respuesta en un solo fragmento.
+        metrics.increment("llm_calls_total", task="medical_qa")
+        tokens = []
+        try:
+            async with self.scheduler.slot("llm", self.session_id, PRIORITY_QA):
+                start = time.perf_counter()
+                async for token in self.chains.medical_qa.astream({
+                    "question": question,
+                    "context": context,
+                    "chat_history": chat_history
+                }):
+                    if token:
+                        if not tokens:
+                            metrics.observe("stage_seconds", time.perf_counter() - start, stage="qa_llm_first_token")
+                        tokens.append(token)
+                        yield token
+        except SchedulerBusyError:
+            # Saturado: avisar enseguida en lugar de esperar hasta un timeout
+            metrics.increment("busy_replies_total", task="medical_qa")
+            yield BUSY_ANSWER
+            return
+        except LLMUnavailableError:
+            metrics.increment("llm_fallback_total", task="medical_qa")
+            if not tokens:
+                # Responder con la base de conocimiento en lugar de dejar la sesión esperando
+                yield self._fallback_answer(context)
+            return
+        metrics.observe("stage_seconds", time.perf_counter() - start, stage="qa_llm")
         
-        return response
\ No newline at end of file
+        if fingerprint is not None:
+            self.answer_cache.store(question_vector, fingerprint, "".join(tokens), chunk_ids)
+    
+    async def _embed_question(self, question):
+        """Vector de la pregunta si lo usa el compresor o la caché; None si no o si está saturado"""
+        if self.context_compressor is None and self.answer_cache is None:
+            return None
+        try:
+            async with self.scheduler.slot("embedding", self.session_id, PRIORITY_QA):
+                return await self.retriever.aembed_query(question)
+        except (ExecutorBusyError, SchedulerBusyError):
+            return None
+    
+    def _fallback_answer(self, context):
+        """Respuesta sin LLM: el comienzo del contexto recuperado, si lo hay"""
+        if not context.strip():
+            return FALLBACK_ANSWER
+        excerpt = context.strip()[:FALLBACK_CONTEXT_CHARS].rsplit(" ", 1)[0]
+        return f"{FALLBACK_ANSWER_WITH_CONTEXT}\n\n{excerpt}..."
@@ -0,0 +1,235 @@
+import math
+import os
+import re
+
+from agent.symptom_lexicon import COMMON_SYMPTOM_MATCHER, CONDITION_MATCHER
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text):
+    """
+    Estimación rápida de tokens para modelos tipo T5: en español cada palabra
+    produce en promedio ~1.4 piezas de sentencepiece.
+    """
+    return math.ceil(len(TOKEN_PATTERN.findall(text)) * 1.4)
+
+
+class BoundedChatHistory:
+    """Historial de mensajes que avisa a la memoria cada vez que se agrega uno"""
+
+    def __init__(self, on_add):
+        self.messages = []
+        self._on_add = on_add
+
+    def add_user_message(self, message):
+        # Importación diferida para no cargar langchain al importar el módulo
+        from langchain.schema import HumanMessage
+        self.add_message(HumanMessage(content=message))
+
+    def add_ai_message(self, message):
+        from langchain.schema import AIMessage
+        self.add_message(AIMessage(content=message))
+
+    def add_message(self, message):
+        self.messages.append(message)
+        self._on_add(message)
+
+    def clear(self):
+        self.messages = []
+
+
+class TokenBudgetMemory:
+    """
+    Memoria de conversación con presupuesto de tokens.
+
+    Los mensajes recientes se guardan completos en una ventana deslizante; al
+    superar max_tokens, los más antiguos salen de la ventana y solo se conserva
+    de ellos un estado estructurado (síntomas mencionados por el paciente), que
+    se resume en una línea de como máximo summary_max_tokens. Los últimos
+    min_messages mensajes siempre se conservan, pero si aun así no caben se
+    recortan (el último mensaje del paciente, solo si él solo no cabe); así el
+    historial que llega al prompt y la RAM por sesión quedan acotados incluso
+    con un mensaje muy largo.
+    """
+
+    memory_key = "history"
+
+    def __init__(self, max_tokens=384, summary_max_tokens=64, min_messages=2,
+                 token_counter=estimate_tokens):
+        self.max_tokens = max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.min_messages = min_messages
+        self.count_tokens = token_counter
+        self.chat_memory = BoundedChatHistory(self._on_message_added)
+        self.symptoms = []  # síntomas de los turnos que ya salieron de la ventana
+        self.summary = ""
+        self.summary_tokens = 0
+        self.window_tokens = 0
+        self.evicted_messages = 0
+        self._message_tokens = []
+
+    @property
+    def token_count(self):
+        """Tokens que ocupa el historial completo en el prompt"""
+        return self.window_tokens + self.summary_tokens
+
+    def load_memory_variables(self, inputs):
+        lines = []
+        if self.summary:
+            lines.append(self.summary)
+        for message in self.chat_memory.messages:
+            speaker = "Paciente" if message.type == "human" else "Asistente"
+            lines.append(f"{speaker}: {message.content}")
+        return {self.memory_key: "\n".join(lines)}
+
+    def clear(self):
+        self.chat_memory.clear()
+        self.symptoms = []
+        self.summary = ""
+        self.summary_tokens = 0
+        self.window_tokens = 0
+        self._message_tokens = []
+
+    def _on_message_added(self, message):
+        tokens = self.count_tokens(message.content)
+        self._message_tokens.append(tokens)
+        self.window_tokens += tokens
+        self._prune()
+
+    def _prune(self):
+        """Saca de la ventana los mensajes más antiguos hasta respetar el presupuesto"""
+        evicted = False
+        while (self.token_count > self.max_tokens
+               and len(self.chat_memory.messages) > self.min_messages):
+            self._evict()
+            evicted = True
+        if self.token_count > self.max_tokens:
+            evicted = self._truncate_window() or evicted
+        if evicted:
+            self._update_summary()
+
+    def _evict(self, index=0):
+        message = self.chat_memory.messages.pop(index)
+        self.window_tokens -= self._message_tokens.pop(index)
+        self.evicted_messages += 1
+        if message.type == "human":
+            self._remember_symptoms(message.content)
+
+    def _truncate_window(self):
+        """
+        Recorta los mensajes que quedan en la ventana hasta que quepan junto al
+        resumen. Devuelve True si alguno tuvo que salir de la ventana.
+        """
+        evicted = False
+        while self.token_count > self.max_tokens:
+            before = (self.window_tokens, len(self.chat_memory.messages))
+            evicted = self._fit_window(max(self.max_tokens - self.summary_tokens, 0)) or evicted
+            # Lo recortado puede agregar síntomas al resumen: se repite si ya no cabe
+            self._update_summary()
+            if (self.window_tokens, len(self.chat_memory.messages)) == before:
+                break
+        return evicted
+
+    def _fit_window(self, available):
+        """
+        Ajusta la ventana a `available` tokens. El último mensaje del paciente
+        se conserva completo (salvo que él solo no quepa); los demás se
+        recortan empezando por los más recientes y los que no llegan a
+        conservar ninguna palabra salen de la ventana. Devuelve True si sacó alguno.
+        """
+        messages = self.chat_memory.messages
+        order = list(reversed(range(len(messages))))
+        latest_user = next((i for i in order if messages[i].type == "human"), None)
+        if latest_user is not None:
+            order.remove(latest_user)
+            order.insert(0, latest_user)
+
+        remaining = available
+        dropped = []
+        for i in order:
+            if self._message_tokens[i] > remaining:
+                message = messages[i]
+                # Las respuestas conservan el final, donde va la pregunta al
+                # paciente que _is_farewell revisa ("¿Quieres...?")
+                truncated = self._truncate_text(message.content, remaining,
+                                                keep_end=message.type == "ai")
+                if not truncated:
+                    dropped.append(i)
+                    continue
+                # Los síntomas de la parte recortada pasan al resumen
+                if message.type == "human":
+                    self._remember_symptoms(message.content)
+                message.content = truncated
+                tokens = self.count_tokens(truncated)
+                self.window_tokens += tokens - self._message_tokens[i]
+                self._message_tokens[i] = tokens
+            remaining -= self._message_tokens[i]
+        for i in sorted(dropped, reverse=True):
+            self._evict(i)
+        return bool(dropped)
+
+    def _truncate_text(self, text, max_tokens, keep_end=False):
+        """
+        El prefijo más largo de palabras completas (con "...") que cabe en
+        max_tokens, o el sufijo si keep_end es True.
+        """
+        words = text.split()
+
+        def shortened(count):
+            if keep_end:
+                return "... " + " ".join(words[len(words) - count:])
+            return " ".join(words[:count]) + " ..."
+
+        low, high = 0, len(words)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.count_tokens(shortened(middle)) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        return shortened(low) if low else ""
+
+    def _remember_symptoms(self, text):
+        matches = CONDITION_MATCHER.find_all(text)
+        # Los síntomas comunes solo cuentan si no forman parte de uno más específico
+        # ("dolor" dentro de "dolor de cabeza")
+        matches += [
+            common for common in COMMON_SYMPTOM_MATCHER.find_all(text)
+            if not any(m.start <= common.start and common.end <= m.end for m in matches)
+        ]
+        for match in sorted(matches, key=lambda m: m.start):
+            # Un síntoma repetido pasa al final: es el último en olvidarse
+            if match.term in self.symptoms:
+                self.symptoms.remove(match.term)
+            self.symptoms.append(match.term)
+
+    def _update_summary(self):
+        if not self.symptoms:
+            self.summary = ""
+            self.summary_tokens = 0
+            return
+        # Si el resumen no cabe, se olvidan primero los síntomas más antiguos
+        while True:
+            self.summary = "Síntomas mencionados antes: " + ", ".join(self.symptoms) + "."
+            self.summary_tokens = self.count_tokens(self.summary)
+            if self.summary_tokens <= self.summary_max_tokens or len(self.symptoms) == 1:
+                break
+            self.symptoms.pop(0)
+
+
+def create_memory():
+    """
+    Crea la memoria de conversación según MEDICHAT_MEMORY:
+    "budget" (por defecto) usa TokenBudgetMemory; "buffer" conserva todo el historial.
+    """
+    strategy = os.environ.get("MEDICHAT_MEMORY", "budget")
+    if strategy == "buffer":
+        from langchain.memory import ConversationBufferMemory
+        return ConversationBufferMemory(return_messages=True)
+    if strategy != "budget":
+        raise ValueError(f"Estrategia de memoria desconocida: {strategy}")
+    return TokenBudgetMemory(
+        max_tokens=int(os.environ.get("MEDICHAT_MEMORY_MAX_TOKENS", "384")),
+        summary_max_tokens=int(os.environ.get("MEDICHAT_MEMORY_SUMMARY_TOKENS", "64")),
+    )
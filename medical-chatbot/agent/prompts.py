@@ -0,0 +1,66 @@
+from langchain.chains import LLMChain
+from langchain.prompts import PromptTemplate
+
+# Prompts compilados una sola vez por proceso. Las cadenas que los usan se
+# construyen en build_chains() y se comparten entre todas las sesiones, así la
+# validación de pydantic y el análisis de plantillas no ocurren en cada mensaje.
+
+SYMPTOM_EXTRACTION_PROMPT = PromptTemplate(
+    input_variables=["patient_message"],
+    template="""
+            Extrae los síntomas mencionados en el siguiente mensaje del paciente:
+            
+            Mensaje: {patient_message}
+            
+            Lista de síntomas (separados por coma):
+            """
+)
+
+CONDITION_ANALYSIS_PROMPT = PromptTemplate(
+    input_variables=["symptoms", "context"],
+    template="""
+            Basado en los siguientes síntomas y la información médica proporcionada,
+            lista hasta 3 posibles condiciones médicas que podrían estar relacionadas.
+            Escribe solo el nombre de cada condición, una por línea, sin numeración ni prefijos.
+            
+            Síntomas: {symptoms}
+            
+            Información médica: {context}
+            
+            Posibles condiciones médicas:
+            """
+)
+
+MEDICAL_QA_PROMPT = PromptTemplate(
+    input_variables=["question", "context", "chat_history"],
+    template="""
+            Como asistente médico virtual, responde a la siguiente pregunta utilizando
+            la información proporcionada y el historial de chat. Si no estás seguro o 
+            la pregunta requiere diagnóstico médico profesional, indícalo claramente.
+            
+            Historial: {chat_history}
+            
+            Información médica: {context}
+            
+            Pregunta: {question}
+            
+            Respuesta:
+            """
+)
+
+
+class PromptChains:
+    """Cadenas listas para usar con un LLM concreto"""
+
+    def __init__(self, llm):
+        self.llm = llm
+        self.symptom_extraction_prompt = SYMPTOM_EXTRACTION_PROMPT
+        self.condition_analysis_prompt = CONDITION_ANALYSIS_PROMPT
+        self.symptom_extraction = LLMChain(llm=llm, prompt=SYMPTOM_EXTRACTION_PROMPT)
+        self.condition_analysis = LLMChain(llm=llm, prompt=CONDITION_ANALYSIS_PROMPT)
+        # Cadena LCEL para poder emitir los tokens de la respuesta con astream
+        self.medical_qa = MEDICAL_QA_PROMPT | llm
+
+
+def build_chains(llm):
+    return PromptChains(llm)
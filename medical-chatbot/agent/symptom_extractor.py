@@ -0,0 +1,96 @@
+import os
+import re
+
+from agent.symptom_lexicon import COMMON_SYMPTOM_MATCHER, CONDITION_MATCHER
+from utils.text import normalize_text
+
+WORD_PATTERN = re.compile(r"\w+")
+
+# Palabras que no aportan síntomas: no cuentan al calcular la cobertura
+FILLER_WORDS = frozenset(normalize_text(word) for word in """
+    a al algo algunos ahora antes bastante bien como con creo de del desde después
+    dia dias doctor doctora e el ella en es esta estoy estado este esto fuerte
+    ha hace hay he hola horas hoy la las le leve lo los me mi mis mucho mucha
+    muy noche no o otra otro para pero poco por que semana semanas ser se
+    siento sentido si sí siempre solo son su tambien también tarde tengo tenido
+    tiene todo un una uno unos unas ya y yo ayer mañana continuo constante
+    bueno gracias
+""".split())
+
+
+class SymptomExtractor:
+    """
+    Extracción de síntomas por léxico, sin LLM.
+
+    Busca en el mensaje los síntomas de PREDEFINED_CONDITIONS y COMMON_SYMPTOMS
+    y calcula la cobertura: la fracción de palabras con contenido (sin contar
+    FILLER_WORDS) que forman parte de algún síntoma reconocido. Si la cobertura
+    alcanza `threshold`, el resultado se usa directamente; si no, el mensaje
+    tiene información que el léxico no entiende y se consulta al LLM.
+    """
+
+    def __init__(self, threshold=0.6):
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self.llm_seconds = 0.0  # media móvil de la extracción con LLM
+        self.latency_saved = 0.0
+
+    def extract(self, message):
+        """Devuelve (síntomas, cobertura) del mensaje"""
+        matches = CONDITION_MATCHER.find_all(message)
+        # "dolor" solo cuenta por sí mismo si no forma parte de "dolor de cabeza"
+        matches += [
+            common for common in COMMON_SYMPTOM_MATCHER.find_all(message)
+            if not any(m.start <= common.start and common.end <= m.end for m in matches)
+        ]
+        matches.sort(key=lambda m: m.start)
+
+        content_words = 0
+        covered_words = 0
+        for word in WORD_PATTERN.finditer(message):
+            if normalize_text(word.group()) in FILLER_WORDS:
+                continue
+            content_words += 1
+            if any(m.start <= word.start() and word.end() <= m.end for m in matches):
+                covered_words += 1
+
+        symptoms = list(dict.fromkeys(match.term for match in matches))
+        coverage = covered_words / content_words if content_words else 0.0
+        return symptoms, coverage
+
+    def try_extract(self, message):
+        """Síntomas del mensaje si la extracción es confiable; None si hace falta el LLM"""
+        symptoms, coverage = self.extract(message)
+        if symptoms and coverage >= self.threshold:
+            self.hits += 1
+            self.latency_saved += self.llm_seconds
+            return symptoms
+        self.misses += 1
+        return None
+
+    def record_llm_latency(self, seconds):
+        """Registra cuánto tardó una extracción con LLM, para estimar el ahorro"""
+        if self.llm_seconds:
+            self.llm_seconds = 0.8 * self.llm_seconds + 0.2 * seconds
+        else:
+            self.llm_seconds = seconds
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "avg_llm_seconds": self.llm_seconds,
+            "latency_saved_seconds": self.latency_saved,
+        }
+
+
+def create_symptom_extractor():
+    """Crea el extractor por léxico salvo que esté desactivado (MEDICHAT_SYMPTOM_EXTRACTOR=0)"""
+    if os.environ.get("MEDICHAT_SYMPTOM_EXTRACTOR", "1") == "0":
+        return None
+    return SymptomExtractor(
+        threshold=float(os.environ.get("MEDICHAT_SYMPTOM_EXTRACTOR_THRESHOLD", "0.6")),
+    )
@@ -1,53 +1,106 @@
 import chainlit as cl
+from chainlit.server import app as server_app
 from agent.conversation import MedicalConversationAgent
+from utils.metrics import metrics, mount_metrics_route
+from utils.warmup import mount_readiness_route, ready, start_warm_up, wait_until_ready
 import asyncio
+import logging
+import os
 import random
+import time
+
+logger = logging.getLogger(__name__)
+
+# Cargar y calentar modelos, base vectorial y datos compartidos al iniciar el
+# servidor, así la primera sesión no paga el costo de carga
+if os.environ.get("MEDICHAT_PRELOAD", "1") != "0":
+    start_warm_up()
+else:
+    ready.set()
+
+# Métricas en formato Prometheus en /metrics (MEDICHAT_METRICS=0 las desactiva)
+if metrics.enabled:
+    mount_metrics_route(server_app)
+# Disponibilidad en /ready: 503 mientras dura el calentamiento
+mount_readiness_route(server_app)
+
+# Efecto de escritura simulado (desactivado por defecto): agrega pausas artificiales
+# entre fragmentos de la respuesta
+TYPING_EFFECT = os.environ.get("MEDICHAT_TYPING_EFFECT", "0") == "1"
+
+async def stream_text(message: cl.Message, text: str):
+    """Envía un fragmento al cliente, aplicando el efecto de escritura si está activo"""
+    if not TYPING_EFFECT:
+        await message.stream_token(text)
+        return
+
+    # Dividir el fragmento en partes pequeñas para el efecto de escritura
+    for i in range(0, len(text), 10):
+        chunk = text[i:i+10]
+        await message.stream_token(chunk)
+
+        # Pausa aleatoria para efecto de escritura
+        if "." in chunk or "!" in chunk or "?" in chunk or "\n" in chunk:
+            await asyncio.sleep(0.1 + random.random() * 0.1)  # Pausa más larga para puntuación
+        else:
+            await asyncio.sleep(0.03 + random.random() * 0.05)  # Pausa normal
 
 @cl.on_chat_start
 async def start():
+    # Las sesiones que llegan durante el calentamiento esperan sin bloquear el event loop
+    await wait_until_ready()
     agent = MedicalConversationAgent()
     cl.user_session.set("agent", agent)
-    
+    metrics.add_gauge("active_sessions", 1)
+
     # Usar streaming nativo de Chainlit con cl.Message y cl.Step
     message = cl.Message(content="")
-    
+
     welcome_message = "¡Hola! Soy un asistente médico virtual. Puedo ayudarte a identificar posibles condiciones basadas en tus síntomas. Recuerda que no soy un médico y mis sugerencias no reemplazan un diagnóstico profesional. ¿En qué puedo ayudarte hoy?"
-    
-    for i in range(0, len(welcome_message), 10):
-        chunk = welcome_message[i:i+10]
-        if i == 0:
-            # Primera parte, enviar el mensaje
-            await message.stream_token(chunk)
-        else:
-            # Partes subsiguientes, actualizar el mensaje
-            await message.stream_token(chunk)
-        
-        # Pequeña pausa aleatoria
-        await asyncio.sleep(0.05 + random.random() * 0.05)
-    
+    await stream_text(message, welcome_message)
+
     # Finalizar el mensaje
     await message.send()
 
+@cl.on_chat_end
+async def end():
+    agent = cl.user_session.get("agent")
+    if agent is not None:
+        # No dejar recuperaciones especulativas en curso de una sesión cerrada
+        agent.cancel_prefetch()
+        metrics.add_gauge("active_sessions", -1)
+
 @cl.on_message
 async def main(message: cl.Message):
     agent = cl.user_session.get("agent")
-    
-    # Obtener la respuesta completa del agente
-    full_response = await agent.process_message(message.content)
-    
-    # Usar streaming nativo de Chainlit
+
+    # Usar streaming nativo de Chainlit: cada fragmento se envía apenas el agente lo produce
     response_message = cl.Message(content="")
-    
-    # Dividir la respuesta en fragmentos para streaming
-    for i in range(0, len(full_response), 10):
-        chunk = full_response[i:i+10]
-        await response_message.stream_token(chunk)
-        
-        # Pausa aleatoria para efecto de escritura
-        if "." in chunk or "!" in chunk or "?" in chunk or "\n" in chunk:
-            await asyncio.sleep(0.1 + random.random() * 0.1)  # Pausa más larga para puntuación
-        else:
-            await asyncio.sleep(0.03 + random.random() * 0.05)  # Pausa normal
-    
-    # Finalizar el mensaje
-    await response_message.send()
\ No newline at end of file
+
+    metrics.add_gauge("active_turns", 1)
+    start_time = time.perf_counter()
+    first_token_time = None
+    output_seconds = 0.0
+    try:
+        async for token in agent.stream_message(message.content):
+            if first_token_time is None:
+                # Tiempo hasta el primer token (TTFT)
+                first_token_time = time.perf_counter()
+                metrics.observe("ttft_seconds", first_token_time - start_time)
+                logger.info("TTFT: %.1f ms", (first_token_time - start_time) * 1000)
+            output_start = time.perf_counter()
+            await stream_text(response_message, token)
+            output_seconds += time.perf_counter() - output_start
+
+        # Finalizar el mensaje
+        output_start = time.perf_counter()
+        await response_message.send()
+        output_seconds += time.perf_counter() - output_start
+    finally:
+        metrics.add_gauge("active_turns", -1)
+
+    # Tiempo de envío al cliente, incluido el efecto de escritura si está activo
+    metrics.observe("stage_seconds", output_seconds, stage="stream_output")
+    total_seconds = time.perf_counter() - start_time
+    metrics.observe("turn_seconds", total_seconds)
+    logger.info("Respuesta completa en %.1f ms", total_seconds * 1000)
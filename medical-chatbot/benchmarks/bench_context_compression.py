@@ -0,0 +1,82 @@
+"""
+Mide la compresión del contexto: tokens del prompt antes y después, cuánto
+tarda comprimir (con la caché de oraciones fría y caliente) y si el contexto
+comprimido conserva la sección relevante para la consulta.
+
+Usa las consultas etiquetadas de eval_retrieval sobre la base de conocimiento,
+indexada en un directorio temporal. Con --embeddings local se usa el modelo
+real; con el stub la selección de oraciones no es representativa, pero sí los
+tokens y la latencia.
+
+Uso (desde medical-chatbot/):
+    python -m benchmarks.bench_context_compression --embeddings local
+    python -m benchmarks.bench_context_compression --max-tokens 128 --k 5
+"""
+import argparse
+import logging
+import shutil
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+from benchmarks.eval_retrieval import QUERIES
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--embeddings", choices=["stub", "local"], default="stub")
+    parser.add_argument("--k", type=int, default=3, help="chunks recuperados por consulta")
+    parser.add_argument("--max-tokens", type=int, default=256, help="presupuesto de tokens del contexto")
+    parser.add_argument("--mmr-lambda", type=float, default=0.7)
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore")
+    logging.disable(logging.WARNING)
+
+    from agent.context_compressor import ContextCompressor
+    from utils.vector_store import get_embeddings, get_vector_store
+
+    if args.embeddings == "stub":
+        from langchain.embeddings import DeterministicFakeEmbedding
+        embeddings = DeterministicFakeEmbedding(size=64)
+    else:
+        embeddings = get_embeddings()
+
+    persist_directory = tempfile.mkdtemp(prefix="medichat-compression-")
+    try:
+        store = get_vector_store(embeddings=embeddings, persist_directory=persist_directory)
+        retrieve = store.retrieve if hasattr(store, "retrieve") else store.similarity_search
+        retrieved = [(query, topic, retrieve(query, args.k)) for query, topic in QUERIES]
+    finally:
+        shutil.rmtree(persist_directory, ignore_errors=True)
+
+    compressor = ContextCompressor(embeddings, max_tokens=args.max_tokens, mmr_lambda=args.mmr_lambda)
+    query_vectors = [embeddings.embed_query(query) for query, _, _ in retrieved]
+
+    print(f"{len(QUERIES)} consultas, k={args.k}, presupuesto {args.max_tokens} tokens, embeddings {args.embeddings}")
+    for label in ("caché fría", "caché caliente"):
+        latencies, before, after, kept = [], [], [], []
+        for (query, topic, documents), vector in zip(retrieved, query_vectors):
+            full = compressor.count_tokens("\n".join(d.page_content for d in documents))
+            start = time.perf_counter()
+            context, saved = compressor.compress(vector, documents)
+            latencies.append(time.perf_counter() - start)
+            before.append(full)
+            after.append(full - saved)
+            relevant = [d.page_content for d in documents if f"sobre {topic.lower()}:" in d.page_content.lower()]
+            if relevant:
+                # ¿Sobrevive alguna oración de la sección relevante?
+                kept.append(any(sentence in context for sentence in relevant[0].split(". ")[1:]))
+        latencies = np.array(latencies) * 1000
+        print(f"{label}:")
+        print(f"  tokens por consulta: {np.mean(before):.0f} -> {np.mean(after):.0f} "
+              f"({1 - np.sum(after) / np.sum(before):.0%} menos)")
+        print(f"  compresión: p50 {np.percentile(latencies, 50):.2f} ms, p95 {np.percentile(latencies, 95):.2f} ms")
+        if kept:
+            print(f"  sección relevante conservada: {np.mean(kept):.0%} de {len(kept)} consultas que la recuperaron")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Memoria y rendimiento de los embeddings con varios workers: cada worker con su
+propia copia del modelo (en proceso) frente a un servidor de embeddings
+compartido en un socket Unix (utils/embedding_server.py).
+
+Cada worker es un proceso que embebe consultas desde varios hilos, como el
+executor de recuperación de un worker de Chainlit. Se informa la memoria
+residente sumada de todos los procesos (workers y servidor), las consultas/s y
+la latencia por consulta.
+
+Por defecto usa un modelo sustituto: una pila de matrices float32 del tamaño
+indicado con --model-mb, que ocupa memoria como los pesos de mpnet y cuyo
+costo baja al procesar por lotes. Con --embeddings local se usa el modelo real
+(requiere sentence-transformers).
+
+Uso (desde medical-chatbot/):
+    python -m benchmarks.bench_embedding_server --workers 4 --queries 200
+    python -m benchmarks.bench_embedding_server --embeddings local --workers 4 --threads 1
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import queue
+import shutil
+import tempfile
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+QUERY_TEMPLATES = [
+    "¿Qué puedo tomar para la fiebre y el dolor de cabeza? ({})",
+    "Tengo tos seca desde hace varios días ({})",
+    "¿Cuándo debo ir al médico por un dolor de pecho? ({})",
+    "Me duele el estómago después de comer ({})",
+]
+
+
+class StandInEmbeddings:
+    """Modelo sustituto: bolsa de palabras por hash seguida de capas densas con tanh"""
+
+    def __init__(self, model_mb=300, hidden=768):
+        layers = max(1, int(model_mb * 1024 * 1024 / (hidden * hidden * 4)))
+        rng = np.random.default_rng(0)
+        self.hidden = hidden
+        self.weights = rng.standard_normal((layers, hidden, hidden), dtype=np.float32) / np.sqrt(hidden)
+
+    def embed_documents(self, texts):
+        features = np.zeros((len(texts), self.hidden), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in text.lower().split():
+                features[row, zlib.crc32(token.encode("utf-8")) % self.hidden] += 1.0
+        for weight in self.weights:
+            features = np.tanh(features @ weight)
+        features /= np.linalg.norm(features, axis=1, keepdims=True) + 1e-12
+        return features.tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def make_embeddings(kind, model_mb):
+    if kind == "local":
+        from utils.vector_store import load_embedding_model
+        return load_embedding_model()
+    return StandInEmbeddings(model_mb)
+
+
+def rss_mb(pid):
+    """Memoria residente actual de un proceso, en MB (Linux)"""
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def run_server(socket_path, kind, model_mb, batch_size, batch_wait_ms, started):
+    from utils.embedding_server import EmbeddingServer
+    server = EmbeddingServer(make_embeddings(kind, model_mb), socket_path, batch_size, batch_wait_ms)
+    asyncio.run(server.serve_forever(started))
+
+
+def run_worker(worker_id, socket_path, kind, model_mb, queries, concurrency, ready, start, results):
+    if socket_path:
+        from utils.embedding_server import RemoteEmbeddings
+        embeddings = RemoteEmbeddings(socket_path)
+    else:
+        embeddings = make_embeddings(kind, model_mb)
+    embeddings.embed_query("calentamiento")
+    ready.put(worker_id)
+    start.wait()
+
+    def one(index):
+        text = QUERY_TEMPLATES[index % len(QUERY_TEMPLATES)].format(f"{worker_id}-{index}")
+        started = time.perf_counter()
+        embeddings.embed_query(text)
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        latencies = list(pool.map(one, range(queries)))
+    results.put({"latencies": latencies, "rss_mb": rss_mb(os.getpid())})
+
+
+def run_scenario(mode, args):
+    context = multiprocessing.get_context("spawn")
+    socket_dir = tempfile.mkdtemp(prefix="medichat-embeddings-")
+    socket_path = os.path.join(socket_dir, "embeddings.sock") if mode == "servidor" else None
+    server = None
+    try:
+        if socket_path:
+            started = context.Event()
+            server = context.Process(
+                target=run_server,
+                args=(socket_path, args.embeddings, args.model_mb, args.batch_size, args.batch_wait_ms, started),
+                daemon=True,
+            )
+            server.start()
+            if not started.wait(300):
+                raise RuntimeError("El servidor de embeddings no arrancó")
+
+        ready, start, results = context.Queue(), context.Event(), context.Queue()
+        workers = [
+            context.Process(
+                target=run_worker,
+                args=(i, socket_path, args.embeddings, args.model_mb, args.queries, args.concurrency,
+                      ready, start, results),
+                daemon=True,
+            )
+            for i in range(args.workers)
+        ]
+        for worker in workers:
+            worker.start()
+        for _ in workers:
+            ready.get(timeout=300)
+
+        begin = time.perf_counter()
+        start.set()
+        outcomes = []
+        for _ in workers:
+            try:
+                outcomes.append(results.get(timeout=600))
+            except queue.Empty:
+                raise RuntimeError("Un worker no terminó a tiempo")
+        elapsed = time.perf_counter() - begin
+        server_rss = rss_mb(server.pid) if server is not None else 0.0
+        for worker in workers:
+            worker.join()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.join()
+        shutil.rmtree(socket_dir, ignore_errors=True)
+
+    latencies = np.array([latency for outcome in outcomes for latency in outcome["latencies"]]) * 1000
+    workers_rss = sum(outcome["rss_mb"] for outcome in outcomes)
+    return {
+        "mode": mode,
+        "rss_mb": workers_rss + server_rss,
+        "rss_per_worker_mb": workers_rss / len(outcomes),
+        "server_rss_mb": server_rss,
+        "queries_per_second": len(latencies) / elapsed,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4, help="procesos worker")
+    parser.add_argument("--queries", type=int, default=200, help="consultas por worker")
+    parser.add_argument("--concurrency", type=int, default=2, help="hilos por worker que piden embeddings")
+    parser.add_argument("--embeddings", choices=["standin", "local"], default="standin")
+    parser.add_argument("--model-mb", type=float, default=300, help="tamaño del modelo sustituto")
+    parser.add_argument("--batch-size", type=int, default=64, help="textos por lote en el servidor")
+    parser.add_argument("--batch-wait-ms", type=float, default=5)
+    parser.add_argument("--threads", type=int, default=0,
+                        help="hilos de BLAS/torch por proceso (0: valor por defecto)")
+    args = parser.parse_args()
+
+    if args.threads:
+        # Lo heredan los procesos hijos antes de importar numpy o torch
+        for variable in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+            os.environ[variable] = str(args.threads)
+
+    print(f"Modelo: {args.embeddings}, {args.workers} workers x {args.queries} consultas "
+          f"({args.concurrency} hilos por worker)")
+    print(f"{'modo':>10} {'RSS total MB':>13} {'RSS/worker':>11} {'RSS servidor':>13} "
+          f"{'consultas/s':>12} {'p50 ms':>8} {'p95 ms':>8}")
+    for mode in ("en proceso", "servidor"):
+        result = run_scenario(mode, args)
+        print(f"{result['mode']:>10} {result['rss_mb']:>13.0f} {result['rss_per_worker_mb']:>11.0f} "
+              f"{result['server_rss_mb']:>13.0f} {result['queries_per_second']:>12.0f} "
+              f"{result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Rendimiento del backend de LLM local (models/local_llm.py) en tokens/s según
+el tamaño máximo de lote, con peticiones concurrentes como las de varias
+sesiones de chat.
+
+Por defecto usa un modelo sustituto que imita el costo de un seq2seq en CPU:
+cada paso de decodificación cuesta un tiempo fijo más un poco por fila del
+lote, y el hilo duerme (libera el GIL) como hace torch al calcular. Con
+--model-path se mide el modelo real (requiere torch y transformers).
+
+Uso (desde medical-chatbot/):
+    python -m benchmarks.bench_local_llm --requests 32 --batch-sizes 1,4,8,16
+    python -m benchmarks.bench_local_llm --model-path modelos/flan-t5-base --threads 4
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from models.local_llm import GeneratedText, GenerationWorker, LocalLLM
+
+PROMPT = (
+    "Contexto: La gripe es una infección viral que causa fiebre, tos y dolor muscular.\n"
+    "Pregunta: ¿Qué puedo hacer si tengo fiebre y tos desde ayer?\nRespuesta:"
+)
+
+
+class StandInGenerator:
+    """Modelo sustituto: `tokens` pasos de decodificación por lote, con costo por paso y por fila"""
+
+    def __init__(self, tokens=64, step_ms=4.0, row_ms=0.5, overhead_ms=10.0):
+        self.tokens = tokens
+        self.step = step_ms / 1000
+        self.row = row_ms / 1000
+        self.overhead = overhead_ms / 1000
+
+    def generate(self, prompts):
+        time.sleep(self.overhead + self.tokens * (self.step + self.row * len(prompts)))
+        return [GeneratedText("respuesta " * self.tokens, self.tokens) for _ in prompts]
+
+
+async def run_requests(llm, requests):
+    async def one():
+        start = time.perf_counter()
+        await llm.ainvoke(PROMPT)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*[one() for _ in range(requests)])
+    return time.perf_counter() - start, np.array(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=32, help="peticiones concurrentes")
+    parser.add_argument("--batch-sizes", default="1,4,8,16")
+    parser.add_argument("--batch-wait-ms", type=float, default=5)
+    parser.add_argument("--model-path", help="modelo seq2seq local; sin él se usa el sustituto")
+    parser.add_argument("--threads", type=int, default=0, help="hilos de torch (0: valor por defecto)")
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--step-ms", type=float, default=4.0, help="costo por paso del sustituto")
+    parser.add_argument("--row-ms", type=float, default=0.5, help="costo por fila y paso del sustituto")
+    args = parser.parse_args()
+
+    if args.model_path:
+        from models.local_llm import Seq2SeqGenerator
+        generator = Seq2SeqGenerator(args.model_path, max_new_tokens=args.max_new_tokens, threads=args.threads)
+        label = args.model_path
+    else:
+        generator = StandInGenerator(args.max_new_tokens, args.step_ms, args.row_ms)
+        label = "sustituto"
+
+    print(f"Modelo: {label}, {args.requests} peticiones concurrentes")
+    print(f"{'lote máx.':>9} {'lote medio':>11} {'tokens/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'total s':>8}")
+    for batch_size in (int(size) for size in args.batch_sizes.split(",")):
+        worker = GenerationWorker(generator, max_batch_size=batch_size, batch_wait_ms=args.batch_wait_ms)
+        llm = LocalLLM(worker=worker)
+        # Una petición de calentamiento fuera de la medición
+        asyncio.run(run_requests(llm, 1))
+        worker.batches = worker.prompts = worker.tokens = 0
+        worker.generation_seconds = 0.0
+
+        elapsed, latencies = asyncio.run(run_requests(llm, args.requests))
+        stats = worker.stats()
+        worker.close()
+        print(f"{batch_size:>9} {stats['avg_batch_size']:>11.1f} {worker.tokens / elapsed:>9.0f} "
+              f"{np.percentile(latencies, 50):>9.0f} {np.percentile(latencies, 95):>9.0f} {elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Micro-benchmark del costo por mensaje de construir prompts y cadenas.
+
+Compara crear PromptTemplate + LLMChain en cada llamada (como se hacía antes)
+con reutilizar las cadenas compiladas una vez en agent/prompts.py. Usa un LLM
+falso para medir solo el trabajo de LangChain, no la inferencia.
+
+Uso (desde medical-chatbot/):
+    python -m benchmarks.bench_prompt_chains --iterations 2000
+"""
+import argparse
+import asyncio
+import time
+
+from langchain.chains import LLMChain
+from langchain.llms.fake import FakeListLLM
+from langchain.prompts import PromptTemplate
+
+from agent.prompts import MEDICAL_QA_PROMPT, SYMPTOM_EXTRACTION_PROMPT, build_chains
+
+MESSAGE = "Tengo dolor de cabeza y fiebre desde ayer"
+QA_INPUTS = {"question": "¿Qué es la migraña?", "context": "La migraña es un dolor de cabeza recurrente.", "chat_history": ""}
+
+
+def _fresh_chains(llm):
+    """Reproduce el comportamiento anterior: todo se construye por mensaje"""
+    extraction = LLMChain(
+        llm=llm,
+        prompt=PromptTemplate(input_variables=["patient_message"], template=SYMPTOM_EXTRACTION_PROMPT.template),
+    )
+    qa_prompt = PromptTemplate(input_variables=["question", "context", "chat_history"], template=MEDICAL_QA_PROMPT.template)
+    return extraction, qa_prompt | llm
+
+
+async def _message(extraction, medical_qa):
+    await extraction.arun(patient_message=MESSAGE)
+    async for _ in medical_qa.astream(QA_INPUTS):
+        pass
+
+
+def _measure_setup(iterations, llm):
+    """Costo de solo construir las cadenas, que es lo que ahorra compartirlas"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        _fresh_chains(llm)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+async def _measure(iterations, llm, shared):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        if shared is None:
+            extraction, medical_qa = _fresh_chains(llm)
+        else:
+            extraction, medical_qa = shared.symptom_extraction, shared.medical_qa
+        await _message(extraction, medical_qa)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=1000)
+    args = parser.parse_args()
+
+    llm = FakeListLLM(responses=["dolor de cabeza, fiebre"])
+    shared = build_chains(llm)
+
+    # Calentamiento para que ambos casos partan con los módulos ya importados
+    asyncio.run(_measure(50, llm, None))
+    asyncio.run(_measure(50, llm, shared))
+
+    setup = _measure_setup(args.iterations, llm)
+    per_call = asyncio.run(_measure(args.iterations, llm, None))
+    cached = asyncio.run(_measure(args.iterations, llm, shared))
+    print(f"Construcción de cadenas:  {setup:8.1f} µs/mensaje")
+    print(f"Mensaje construyendo:     {per_call:8.1f} µs")
+    print(f"Mensaje compartido:       {cached:8.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
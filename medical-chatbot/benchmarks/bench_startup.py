@@ -0,0 +1,111 @@
+"""
+Benchmark de arranque: tiempo de importación, de calentamiento y latencia de la
+primera conversación, con y sin calentamiento previo.
+
+Cada escenario corre en un intérprete nuevo para medir un arranque en frío real.
+El LLM es falso; los embeddings pueden ser el stub determinista o el modelo real
+(--embeddings local), que es donde el calentamiento más se nota.
+
+Uso (desde medical-chatbot/):
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --embeddings local
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+FIRST_DIALOGUE = ["Hola", "Tengo fiebre y tos seca", "¿Es grave?"]
+
+
+def run_child(mode, embeddings_kind):
+    """Se ejecuta en el proceso hijo: las importaciones pesadas empiezan aquí"""
+    start = time.perf_counter()
+    import agent.conversation  # noqa: F401  (mide lo que importa app.py)
+    import_seconds = time.perf_counter() - start
+
+    import asyncio
+    import logging
+    import shutil
+    import tempfile
+    import warnings
+
+    warnings.filterwarnings("ignore")
+    logging.disable(logging.WARNING)
+
+    start = time.perf_counter()
+    from benchmarks.load_test import configure_resources
+    persist_directory = tempfile.mkdtemp(prefix="medichat-startup-")
+    configure_resources(0.0, embeddings_kind, persist_directory, preload=False)
+    setup_seconds = time.perf_counter() - start
+
+    result = {"mode": mode, "import_seconds": import_seconds, "setup_seconds": setup_seconds}
+    try:
+        if mode == "warm":
+            from utils.warmup import warm_up
+            result["warm_up"] = warm_up()
+
+        async def first_conversation():
+            from agent.conversation import MedicalConversationAgent
+            latencies = []
+            start = time.perf_counter()
+            agent = MedicalConversationAgent()
+            latencies.append(time.perf_counter() - start)
+            for message in FIRST_DIALOGUE:
+                start = time.perf_counter()
+                await agent.process_message(message)
+                latencies.append(time.perf_counter() - start)
+            return latencies
+
+        latencies = asyncio.run(first_conversation())
+    finally:
+        shutil.rmtree(persist_directory, ignore_errors=True)
+    result["session_start_seconds"] = latencies[0]
+    result["message_seconds"] = latencies[1:]
+    result["first_request_seconds"] = sum(latencies)
+    print(json.dumps(result))
+
+
+def run_scenario(mode, embeddings_kind):
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_startup", "--child", mode, "--embeddings", embeddings_kind],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process_seconds"] = time.perf_counter() - start
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--embeddings", choices=["stub", "local"], default="stub")
+    parser.add_argument("--child", choices=["cold", "warm"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.embeddings)
+        return
+
+    for mode in ("cold", "warm"):
+        result = run_scenario(mode, args.embeddings)
+        label = "Sin calentamiento" if mode == "cold" else "Con calentamiento"
+        print(f"{label}:")
+        print(f"  importación de la aplicación: {result['import_seconds'] * 1000:8.1f} ms")
+        if "warm_up" in result:
+            steps = ", ".join(f"{name}={seconds * 1000:.0f} ms" for name, seconds in result["warm_up"].items())
+            print(f"  calentamiento:                {result['warm_up']['total'] * 1000:8.1f} ms ({steps})")
+        print(f"  inicio de sesión:             {result['session_start_seconds'] * 1000:8.1f} ms")
+        messages = ", ".join(f"{seconds * 1000:.1f}" for seconds in result["message_seconds"])
+        print(f"  primeros mensajes:            {messages} ms")
+        print(f"  primera conversación:         {result['first_request_seconds'] * 1000:8.1f} ms")
+        print(f"  proceso completo:             {result['process_seconds'] * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
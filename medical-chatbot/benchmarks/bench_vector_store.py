@@ -0,0 +1,150 @@
+"""
+Compara Chroma con los índices FAISS (flat, ivf, hnsw) en recall@k y latencia.
+
+Genera un corpus sintético de vectores agrupados (parecido a los embeddings de
+textos sobre pocos temas), lo carga en una colección de Chroma en un directorio
+temporal y exporta desde ella cada índice FAISS, igual que hace la aplicación.
+El recall se mide contra la búsqueda exacta por fuerza bruta y la latencia por
+consulta individual, que es como busca el chatbot.
+
+Uso (desde medical-chatbot/):
+    python -m benchmarks.bench_vector_store --vectors 20000 --dimension 768
+    python -m benchmarks.bench_vector_store --vectors 100000 --k 10 --nprobe 16
+"""
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+from utils.faiss_store import FaissVectorStore
+
+CHROMA_BATCH_SIZE = 5000
+
+
+def synthetic_corpus(count, dimension, clusters, seed):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimension)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=count)
+    vectors = centers[labels] + 0.35 * rng.normal(size=(count, dimension)).astype(np.float32)
+    return vectors.astype(np.float32)
+
+
+def synthetic_queries(vectors, count, seed):
+    rng = np.random.default_rng(seed + 1)
+    picks = rng.integers(0, len(vectors), size=count)
+    noise = 0.2 * rng.normal(size=(count, vectors.shape[1])).astype(np.float32)
+    return (vectors[picks] + noise).astype(np.float32)
+
+
+def exact_neighbors(vectors, queries, k, batch_size=256):
+    """Vecinos exactos por distancia L2 (la métrica por defecto de Chroma)"""
+    norms = (vectors ** 2).sum(axis=1)
+    result = []
+    for start in range(0, len(queries), batch_size):
+        batch = queries[start:start + batch_size]
+        distances = norms[None, :] - 2 * batch @ vectors.T
+        top = np.argpartition(distances, k, axis=1)[:, :k]
+        order = np.take_along_axis(distances, top, axis=1).argsort(axis=1)
+        result.extend(np.take_along_axis(top, order, axis=1))
+    return [set(row.tolist()) for row in result]
+
+
+def load_chroma(vectors, directory):
+    from langchain.vectorstores import Chroma
+
+    db = Chroma(persist_directory=directory, embedding_function=None)
+    for start in range(0, len(vectors), CHROMA_BATCH_SIZE):
+        end = min(start + CHROMA_BATCH_SIZE, len(vectors))
+        db._collection.add(
+            ids=[f"v{i}" for i in range(start, end)],
+            embeddings=vectors[start:end].tolist(),
+            documents=[f"documento {i}" for i in range(start, end)],
+            metadatas=[{"position": i} for i in range(start, end)],
+        )
+    return db
+
+
+def measure(search, queries, truth, k):
+    latencies = []
+    found = []
+    for query in queries:
+        start = time.perf_counter()
+        result = search(query)
+        latencies.append(time.perf_counter() - start)
+        found.append(result)
+    recall = np.mean([len(set(f) & t) / k for f, t in zip(found, truth)])
+    latencies = np.array(latencies) * 1000
+    return recall, np.percentile(latencies, 50), np.percentile(latencies, 95)
+
+
+def directory_size_mb(directory):
+    total = 0
+    for root, _, files in os.walk(directory):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--clusters", type=int, default=64)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore")
+    logging.disable(logging.WARNING)
+
+    vectors = synthetic_corpus(args.vectors, args.dimension, args.clusters, args.seed)
+    queries = synthetic_queries(vectors, args.queries, args.seed)
+    truth = exact_neighbors(vectors, queries, args.k)
+
+    directory = tempfile.mkdtemp(prefix="medichat-bench-")
+    try:
+        start = time.perf_counter()
+        db = load_chroma(vectors, directory)
+        chroma_seconds = time.perf_counter() - start
+        chroma_size = directory_size_mb(directory)
+
+        print(f"Corpus: {args.vectors} vectores de dimensión {args.dimension}, {args.queries} consultas, k={args.k}")
+        print(f"{'backend':<8} {'construcción':>13} {'recall@k':>9} {'p50 ms':>8} {'p95 ms':>8} {'índice MB':>9}")
+
+        def chroma_search(query):
+            result = db._collection.query(query_embeddings=[query.tolist()], n_results=args.k, include=[])
+            return [int(i[1:]) for i in result["ids"][0]]
+
+        recall, p50, p95 = measure(chroma_search, queries, truth, args.k)
+        print(f"{'chroma':<8} {chroma_seconds:>12.1f}s {recall:>9.3f} {p50:>8.3f} {p95:>8.3f} {chroma_size:>9.1f}")
+
+        for index_type in ("flat", "ivf", "hnsw"):
+            index_directory = os.path.join(directory, f"faiss-{index_type}")
+            start = time.perf_counter()
+            store = FaissVectorStore.from_chroma(
+                db, index_directory, index_type=index_type, nprobe=args.nprobe, ef_search=args.ef_search,
+            )
+            build_seconds = time.perf_counter() - start
+            # Posición en el índice -> posición en el corpus original
+            positions = [store.document(p).metadata["position"] for p in range(len(store))]
+
+            def faiss_search(query, store=store, positions=positions):
+                return [positions[p] for p, _ in store.search_positions(query, args.k)]
+
+            recall, p50, p95 = measure(faiss_search, queries, truth, args.k)
+            size = os.path.getsize(os.path.join(index_directory, "index.faiss")) / (1024 * 1024)
+            print(f"{index_type:<8} {build_seconds:>12.1f}s {recall:>9.3f} {p50:>8.3f} {p95:>8.3f} {size:>9.1f}")
+            store.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Evalúa cuánto recall@k se pierde al guardar los vectores cuantizados (fp16,
+int8) o reducidos con PCA, con y sin reordenamiento en float32, frente al
+índice actual de precisión completa.
+
+La referencia es la búsqueda exacta sobre los vectores float32 de la colección.
+Por defecto usa un corpus sintético; con --persist-dir evalúa la colección real
+de Chroma (solo la lee: los índices se construyen en un directorio temporal).
+Las consultas son vectores del corpus con ruido, así no hace falta el modelo.
+
+Uso (desde medical-chatbot/):
+    python -m benchmarks.eval_quantization --vectors 50000 --dimension 768
+    python -m benchmarks.eval_quantization --persist-dir chroma_db --k 3
+"""
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import warnings
+
+import numpy as np
+
+from benchmarks.bench_vector_store import (
+    exact_neighbors,
+    load_chroma,
+    measure,
+    synthetic_corpus,
+)
+from utils.faiss_store import VECTORS_FILENAME, FaissVectorStore
+
+
+def noisy_queries(vectors, count, seed):
+    """Vectores del corpus con ruido proporcional a su escala"""
+    rng = np.random.default_rng(seed + 1)
+    picks = rng.integers(0, len(vectors), size=count)
+    scale = 0.2 * float(np.abs(vectors).mean())
+    return (vectors[picks] + scale * rng.normal(size=(count, vectors.shape[1]))).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--persist-dir", help="evaluar la colección de Chroma de este directorio")
+    parser.add_argument("--vectors", type=int, default=20000, help="tamaño del corpus sintético")
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--index-type", choices=["flat", "ivf", "hnsw"], default="flat")
+    parser.add_argument("--pca-dims", default="256,128,64", help="dimensiones de PCA a evaluar, separadas por coma")
+    parser.add_argument("--rerank", type=int, default=4, help="candidatos por resultado para reordenar")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore")
+    logging.disable(logging.WARNING)
+
+    work_directory = tempfile.mkdtemp(prefix="medichat-quant-")
+    try:
+        if args.persist_dir:
+            from langchain.vectorstores import Chroma
+            db = Chroma(persist_directory=args.persist_dir, embedding_function=None)
+        else:
+            db = load_chroma(
+                synthetic_corpus(args.vectors, args.dimension, 64, args.seed),
+                os.path.join(work_directory, "chroma"),
+            )
+
+        # Referencia de precisión completa, exportada igual que en la aplicación
+        reference = FaissVectorStore.from_chroma(db, os.path.join(work_directory, "reference"), index_type="flat")
+        vectors = np.load(os.path.join(reference.directory, VECTORS_FILENAME))
+        queries = noisy_queries(vectors, args.queries, args.seed)
+        k = min(args.k, len(vectors) - 1)
+        truth = exact_neighbors(vectors, queries, k)
+        reference.close()
+
+        configurations = [("none", None), ("fp16", None), ("int8", None)]
+        configurations += [("pca", int(d)) for d in args.pca_dims.split(",") if int(d) < vectors.shape[1]]
+
+        print(f"Colección: {len(vectors)} vectores de dimensión {vectors.shape[1]}, "
+              f"índice {args.index_type}, {args.queries} consultas, k={k}")
+        print(f"{'almacenamiento':<16} {'reorden':>8} {'recall@k':>9} {'pérdida':>8} "
+              f"{'p50 ms':>8} {'índice MB':>10} {'ahorro':>7}")
+
+        # El ahorro se mide contra el mismo tipo de índice sin cuantizar
+        baseline_size = None
+        for quantization, pca_dim in configurations:
+            label = f"pca{pca_dim}" if pca_dim else quantization
+            directory = os.path.join(work_directory, label)
+            reranks = [1] if quantization == "none" else [1, args.rerank]
+            for rerank in reranks:
+                store = FaissVectorStore.from_chroma(
+                    db, directory, index_type=args.index_type, quantization=quantization,
+                    pca_dim=pca_dim or 128, rerank=rerank,
+                )
+
+                def search(query, store=store):
+                    return [p for p, _ in store.search_positions(query, k)]
+
+                recall, p50, _ = measure(search, queries, truth, k)
+                size = os.path.getsize(os.path.join(directory, "index.faiss"))
+                baseline_size = baseline_size or size
+                print(f"{label:<16} {'x' + str(rerank) if rerank > 1 else 'no':>8} {recall:>9.3f} "
+                      f"{1 - recall:>8.3f} {p50:>8.3f} {size / (1024 * 1024):>10.1f} "
+                      f"{1 - size / baseline_size:>7.0%}")
+                store.close()
+    finally:
+        shutil.rmtree(work_directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
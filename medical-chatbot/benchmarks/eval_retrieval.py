@@ -0,0 +1,115 @@
+"""
+Compara la recuperación vectorial, BM25 y la híbrida (RRF) sobre la base de
+conocimiento real con consultas etiquetadas.
+
+Cada consulta indica el tema de la sección que debería recuperarse ("Información
+sobre <tema>:"). Se informa el acierto en el primer resultado y entre los tres
+primeros (lo que usa el chatbot), el MRR y la latencia por consulta. La base se
+indexa en un directorio temporal; con --embeddings local se usa el modelo real,
+sin él la parte vectorial usa el stub determinista y solo sirve como referencia.
+
+Uso (desde medical-chatbot/):
+    python -m benchmarks.eval_retrieval --embeddings local
+    python -m benchmarks.eval_retrieval --k 5
+"""
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+QUERIES = [
+    ("tengo tos con sangre", "tos"),
+    ("me duele la cabeza desde hace días", "dolor de cabeza"),
+    ("presión arterial alta", "hipertensión"),
+    ("tengo mucha sed y orino a cada rato", "diabetes"),
+    ("siento ardor en el estómago después de comer", "gastritis"),
+    ("el ácido me sube a la garganta", "reflujo gastroesofágico"),
+    ("me falta el aire al subir escaleras", "dificultad para respirar"),
+    ("siento el corazón acelerado", "palpitaciones"),
+    ("no puedo dormir por las noches", "insomnio"),
+    ("tengo una migraña con aura", "migraña"),
+    ("piedras en el riñón", "cálculos renales"),
+    ("me duelen las articulaciones de las manos", "artritis"),
+    ("estoy cansado todo el tiempo", "fatiga"),
+    ("tengo temperatura alta y escalofríos", "fiebre"),
+    ("la tiroides lenta me hace subir de peso", "hipotiroidismo"),
+    ("temblor en las manos y rigidez", "enfermedad de Parkinson"),
+    ("me olvido de las cosas con frecuencia", "problemas de memoria"),
+    ("manchas rojas que pican en la piel", "erupciones cutáneas"),
+    ("deposiciones líquidas varias veces al día", "diarrea"),
+    ("dolor en la parte baja de la espalda", "dolor de espalda"),
+    ("congestión nasal y dolor en la cara", "sinusitis"),
+    ("huesos frágiles después de la menopausia", "osteoporosis"),
+    ("dolor muscular generalizado y cansancio", "fibromialgia"),
+    ("qué comer para una dieta equilibrada", "alimentación saludable"),
+]
+
+
+def is_relevant(document, topic):
+    return f"información sobre {topic.lower()}:" in document.page_content.lower()
+
+
+def evaluate(search, k):
+    hits_1, hits_k, reciprocal_ranks, latencies, context_chars = [], [], [], [], []
+    for query, topic in QUERIES:
+        start = time.perf_counter()
+        documents = search(query, k)
+        latencies.append(time.perf_counter() - start)
+        ranks = [rank for rank, document in enumerate(documents, start=1) if is_relevant(document, topic)]
+        hits_1.append(bool(ranks) and ranks[0] == 1)
+        hits_k.append(bool(ranks))
+        reciprocal_ranks.append(1 / ranks[0] if ranks else 0.0)
+        context_chars.append(sum(len(document.page_content) for document in documents))
+    return {
+        "hit_1": np.mean(hits_1),
+        "hit_k": np.mean(hits_k),
+        "mrr": np.mean(reciprocal_ranks),
+        "p50_ms": np.percentile(latencies, 50) * 1000,
+        "context_chars": np.mean(context_chars),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--embeddings", choices=["stub", "local"], default="stub")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--candidates", type=int, default=10, help="resultados que aporta cada buscador a la fusión")
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore")
+    logging.disable(logging.WARNING)
+
+    from utils.vector_store import get_embeddings, get_vector_store
+
+    if args.embeddings == "stub":
+        from langchain.embeddings import DeterministicFakeEmbedding
+        embeddings = DeterministicFakeEmbedding(size=64)
+    else:
+        embeddings = get_embeddings()
+
+    os.environ["MEDICHAT_HYBRID_CANDIDATES"] = str(args.candidates)
+    persist_directory = tempfile.mkdtemp(prefix="medichat-retrieval-")
+    try:
+        print(f"{len(QUERIES)} consultas, k={args.k}, embeddings {args.embeddings}")
+        print(f"{'modo':<8} {'acierto@1':>10} {'acierto@k':>10} {'MRR':>6} {'p50 ms':>8} {'contexto':>9}")
+        for mode in ("vector", "lexical", "hybrid"):
+            os.environ["MEDICHAT_RETRIEVAL_MODE"] = mode
+            store = get_vector_store(embeddings=embeddings, persist_directory=persist_directory)
+            if hasattr(store, "retrieve"):
+                search = store.retrieve
+            else:
+                search = store.similarity_search
+            result = evaluate(search, args.k)
+            print(f"{mode:<8} {result['hit_1']:>10.2f} {result['hit_k']:>10.2f} {result['mrr']:>6.2f} "
+                  f"{result['p50_ms']:>8.2f} {result['context_chars']:>9.0f}")
+    finally:
+        shutil.rmtree(persist_directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
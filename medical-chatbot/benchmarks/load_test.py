@@ -0,0 +1,235 @@
+"""
+Prueba de carga: N sesiones de chat concurrentes contra un LLM falso.
+
+Cada sesión recorre un diálogo guionado (saludo -> síntomas -> recomendación
+-> alternativas -> despedida) llamando a MedicalConversationAgent.process_message.
+El LLM es un FakeListLLM con latencia artificial y los embeddings son un stub
+determinista (o el modelo real con --embeddings local), así que la prueba no
+depende de la red. La base de conocimiento se indexa en un directorio temporal.
+
+Informa el rendimiento (mensajes/s), los percentiles de latencia por etapa del
+diálogo, el retraso del event loop y la memoria por sesión.
+
+Uso (desde medical-chatbot/):
+    python -m benchmarks.load_test --sessions 50 --llm-latency-ms 200
+    python -m benchmarks.load_test --sessions 200 --json resultados.json
+"""
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+from langchain.llms.fake import FakeListLLM
+
+from utils.metrics import Metrics
+from utils.resources import registry
+
+DIALOGUES = [
+    [
+        ("greeting", "Hola"),
+        ("symptoms", "Tengo fiebre y tos seca desde ayer"),
+        ("recommendation", "Sí, por favor"),
+        ("alternatives", "¿Hay otras alternativas?"),
+        ("farewell", "Gracias, eso es todo"),
+    ],
+    [
+        ("greeting", "Buenas tardes"),
+        ("symptoms", "Tengo dolor de cabeza y náuseas"),
+        ("follow_up", "¿Es grave si dura varios días?"),
+        ("recommendation", "Sí, recomiéndame un especialista"),
+        ("alternatives", "¿Algún otro especialista?"),
+        ("farewell", "Muchas gracias"),
+    ],
+    [
+        ("greeting", "Hola, necesito ayuda"),
+        # El léxico no cubre este mensaje: la extracción pasa por el LLM
+        ("symptoms", "Siento un hormigueo raro en la mano izquierda cuando escribo"),
+        ("recommendation", "Claro"),
+        ("alternatives", "Dame una alternativa diferente"),
+        ("farewell", "Adiós"),
+    ],
+]
+
+LLM_RESPONSES = [
+    "hormigueo, mano",
+    "Es recomendable consultar con un profesional si los síntomas persisten o empeoran.",
+]
+
+
+class LatencyFakeLLM(FakeListLLM):
+    """FakeListLLM que tarda `latency` segundos en responder, como un LLM remoto"""
+
+    latency: float = 0.0
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        return super()._call(prompt, stop=stop, run_manager=run_manager, **kwargs)
+
+    async def _acall(self, prompt, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return await super()._acall(prompt, stop=stop, run_manager=run_manager, **kwargs)
+
+
+def configure_resources(llm_latency, embeddings_kind, persist_directory, preload=True):
+    """Reemplaza el LLM, los embeddings y la ubicación del índice en el registro compartido"""
+    from langchain.embeddings import DeterministicFakeEmbedding
+    from utils.vector_store import get_vector_store
+
+    if embeddings_kind == "stub":
+        registry.override("embeddings", DeterministicFakeEmbedding(size=64))
+    registry.override("llm", LatencyFakeLLM(responses=LLM_RESPONSES, latency=llm_latency))
+    registry.register(
+        "vector_store",
+        lambda: get_vector_store(embeddings=registry.get("query_embeddings"), persist_directory=persist_directory),
+    )
+    if preload:
+        registry.preload()
+
+
+async def monitor_loop_lag(results, stop_event, interval=0.01):
+    """Mide cuánto se retrasa el event loop respecto de un temporizador de `interval` segundos"""
+    loop = asyncio.get_running_loop()
+    while not stop_event.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        results.observe("loop_lag_seconds", max(0.0, loop.time() - expected))
+
+
+async def run_session(agent_factory, dialogue, results, start_jitter):
+    await asyncio.sleep(start_jitter)
+    agent = agent_factory()
+    for stage, message in dialogue:
+        start = time.perf_counter()
+        await agent.process_message(message)
+        elapsed = time.perf_counter() - start
+        results.observe("stage_seconds", elapsed, stage=stage)
+        results.observe("message_seconds", elapsed)
+    return agent
+
+
+async def run_load(sessions, ramp_up, seed):
+    from agent.conversation import MedicalConversationAgent
+
+    rng = random.Random(seed)
+    results = Metrics(window=1_000_000)
+    stop_event = asyncio.Event()
+    monitor = asyncio.create_task(monitor_loop_lag(results, stop_event))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        run_session(
+            MedicalConversationAgent,
+            DIALOGUES[i % len(DIALOGUES)],
+            results,
+            rng.uniform(0, ramp_up),
+        )
+        for i in range(sessions)
+    ])
+    elapsed = time.perf_counter() - start
+
+    stop_event.set()
+    await monitor
+    return results, elapsed
+
+
+async def measure_session_memory(sessions):
+    """Memoria que retiene cada sesión tras completar su diálogo (tracemalloc)"""
+    from agent.conversation import MedicalConversationAgent
+
+    results = Metrics(window=1)
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    agents = await asyncio.gather(*[
+        run_session(MedicalConversationAgent, DIALOGUES[i % len(DIALOGUES)], results, 0)
+        for i in range(sessions)
+    ])
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    retained = (current - baseline) / len(agents)
+    return retained, peak - baseline
+
+
+def _format_percentiles(percentiles, scale=1000):
+    return "  ".join(f"p{int(q * 100)}={value * scale:8.1f}" for q, value in percentiles.items())
+
+
+def report(results, elapsed, sessions, memory):
+    messages = sum(len(DIALOGUES[i % len(DIALOGUES)]) for i in range(sessions))
+    retained, peak = memory
+    summary = {
+        "sessions": sessions,
+        "messages": messages,
+        "seconds": elapsed,
+        "messages_per_second": messages / elapsed,
+        "sessions_per_second": sessions / elapsed,
+        "latency_ms": {},
+        "loop_lag_ms": {},
+        "memory_per_session_kb": retained / 1024,
+        "memory_peak_kb": peak / 1024,
+    }
+
+    print(f"Sesiones: {sessions}  mensajes: {messages}  tiempo: {elapsed:.2f} s")
+    print(f"Rendimiento: {summary['messages_per_second']:.1f} mensajes/s, {summary['sessions_per_second']:.1f} sesiones/s")
+    print("Latencia por etapa (ms):")
+    stages = list(dict.fromkeys(stage for dialogue in DIALOGUES for stage, _ in dialogue))
+    for stage in stages + [None]:
+        if stage is None:
+            percentiles = results.percentiles("message_seconds")
+            label = "total"
+        else:
+            percentiles = results.percentiles("stage_seconds", stage=stage)
+            label = stage
+        if percentiles is None:
+            continue
+        summary["latency_ms"][label] = {f"p{int(q * 100)}": value * 1000 for q, value in percentiles.items()}
+        print(f"  {label:<15} {_format_percentiles(percentiles)}")
+
+    lag = results.percentiles("loop_lag_seconds")
+    if lag is not None:
+        summary["loop_lag_ms"] = {f"p{int(q * 100)}": value * 1000 for q, value in lag.items()}
+        print(f"Retraso del event loop (ms): {_format_percentiles(lag)}")
+    print(f"Memoria retenida por sesión: {retained / 1024:.1f} KB (pico {peak / 1024:.1f} KB)")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=50, help="sesiones concurrentes")
+    parser.add_argument("--llm-latency-ms", type=float, default=200, help="latencia artificial de cada llamada al LLM")
+    parser.add_argument("--ramp-up", type=float, default=1.0, help="segundos en los que se reparten los inicios de sesión")
+    parser.add_argument("--embeddings", choices=["stub", "local"], default="stub",
+                        help="stub determinista o el modelo de embeddings real")
+    parser.add_argument("--memory-sessions", type=int, default=20,
+                        help="sesiones usadas para medir la memoria (con tracemalloc, aparte de la carga)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="guardar los resultados en este archivo")
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore")
+    logging.disable(logging.WARNING)
+
+    persist_directory = tempfile.mkdtemp(prefix="medichat-load-")
+    try:
+        configure_resources(args.llm_latency_ms / 1000, args.embeddings, persist_directory)
+        results, elapsed = asyncio.run(run_load(args.sessions, args.ramp_up, args.seed))
+        memory = asyncio.run(measure_session_memory(min(args.sessions, args.memory_sessions)))
+    finally:
+        shutil.rmtree(persist_directory, ignore_errors=True)
+
+    summary = report(results, elapsed, args.sessions, memory)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import asyncio
+import os
+from collections import namedtuple
+from typing import Any
+
+from langchain.llms.base import LLM
+from langchain.schema.output import GenerationChunk
+from langchain_core.language_models.llms import BaseLLM
+
+PendingPrompt = namedtuple("PendingPrompt", ["prompt", "future"])
+
+
+class PromptBatcher:
+    """
+    Agrupa los prompts que llegan de sesiones concurrentes.
+
+    El primer prompt de un lote abre una ventana de window_ms milisegundos; los
+    que llegan mientras tanto (hasta max_batch_size) se despachan juntos y cada
+    corrutina recibe su propio resultado. Los lotes se despachan en orden de
+    llegada y un lote lleno sale sin esperar la ventana, así ningún usuario queda
+    retrasado más de window_ms por los demás.
+
+    Solo los modelos que redefinen _agenerate con generación por lotes real
+    (como LocalLLM) reciben el lote en una sola llamada a agenerate(). El
+    _agenerate por defecto de LLM (HuggingFaceHub, entre otros) llama a los
+    prompts uno detrás de otro, así que a esos se les envían en paralelo con
+    ainvoke().
+    """
+
+    def __init__(self, llm, window_ms=10, max_batch_size=8):
+        self.llm = llm
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.native_batching = type(llm)._agenerate is not LLM._agenerate
+        self.batches = 0
+        self.prompts = 0
+        self._loop = None
+        self._pending = {}  # stop -> lista de PendingPrompt
+        self._timers = {}  # stop -> tarea que cierra la ventana
+
+    async def submit(self, prompt, stop=None):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Cada bucle de eventos tiene sus propios lotes
+            self._loop = loop
+            self._pending = {}
+            self._timers = {}
+
+        # Solo se agrupan prompts con las mismas secuencias de parada
+        key = tuple(stop) if stop else None
+        future = loop.create_future()
+        pending = self._pending.setdefault(key, [])
+        pending.append(PendingPrompt(prompt, future))
+
+        if len(pending) >= self.max_batch_size:
+            timer = self._timers.pop(key, None)
+            if timer is not None:
+                timer.cancel()
+            self._dispatch(key)
+        elif key not in self._timers:
+            self._timers[key] = loop.create_task(self._close_window(key))
+        return await future
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "prompts": self.prompts,
+            "avg_batch_size": self.prompts / self.batches if self.batches else 0.0,
+        }
+
+    async def _close_window(self, key):
+        await asyncio.sleep(self.window)
+        self._timers.pop(key, None)
+        self._dispatch(key)
+
+    def _dispatch(self, key):
+        batch = self._pending.pop(key, [])
+        # Las sesiones que se cancelaron mientras esperaban no ocupan lugar en el lote
+        batch = [item for item in batch if not item.future.done()]
+        if batch:
+            self._loop.create_task(self._run_batch(batch, list(key) if key else None))
+
+    async def _run_batch(self, batch, stop):
+        self.batches += 1
+        self.prompts += len(batch)
+        try:
+            if self.native_batching:
+                result = await self.llm.agenerate([item.prompt for item in batch], stop=stop)
+                for item, generations in zip(batch, result.generations):
+                    if not item.future.done():
+                        item.future.set_result(generations[0].text)
+            else:
+                results = await asyncio.gather(
+                    *(self.llm.ainvoke(item.prompt, stop=stop) for item in batch),
+                    return_exceptions=True,
+                )
+                for item, result in zip(batch, results):
+                    if item.future.done():
+                        continue
+                    if isinstance(result, Exception):
+                        item.future.set_exception(result)
+                    else:
+                        item.future.set_result(result)
+        except Exception as e:
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+        finally:
+            # Lote cancelado, otra BaseException o menos resultados que prompts:
+            # ninguna sesión debe quedar esperando
+            for item in batch:
+                if not item.future.done():
+                    item.future.cancel()
+
+
+class MicroBatchingLLM(LLM):
+    """
+    LLM que envía sus llamadas asíncronas a través de un PromptBatcher.
+
+    Los backends con generación por lotes (por ejemplo un modelo local) reciben
+    todos los prompts del lote en una sola llamada; a los que solo aceptan un
+    prompt por petición se les envían los prompts del lote en paralelo.
+    Las llamadas síncronas y los modelos con streaming nativo van directo al LLM.
+    """
+
+    llm: BaseLLM
+    batcher: Any
+
+    @property
+    def _llm_type(self):
+        return "micro_batching"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        return self.llm.invoke(prompt, stop=stop, **kwargs)
+
+    async def _acall(self, prompt, stop=None, run_manager=None, **kwargs):
+        return await self.batcher.submit(prompt, stop=stop)
+
+    async def _astream(self, prompt, stop=None, run_manager=None, **kwargs):
+        if type(self.llm)._astream is BaseLLM._astream and type(self.llm)._stream is BaseLLM._stream:
+            text = await self.batcher.submit(prompt, stop=stop)
+            yield GenerationChunk(text=text)
+            return
+        async for token in self.llm.astream(prompt, stop=stop, **kwargs):
+            yield GenerationChunk(text=token)
+
+
+def create_batching_llm(llm):
+    """
+    Envuelve el LLM con el agrupador de prompts si está activado
+    (MEDICHAT_LLM_BATCH_WINDOW_MS > 0).
+    """
+    window_ms = float(os.environ.get("MEDICHAT_LLM_BATCH_WINDOW_MS", "0"))
+    if window_ms <= 0:
+        return llm
+    max_batch_size = int(os.environ.get("MEDICHAT_LLM_BATCH_SIZE", "8"))
+    return MicroBatchingLLM(llm=llm, batcher=PromptBatcher(llm, window_ms, max_batch_size))
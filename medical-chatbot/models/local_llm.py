@@ -0,0 +1,223 @@
+"""
+Backend de LLM local: un modelo seq2seq (flan-t5-base u otro apto para CPU)
+cargado una sola vez por proceso desde una ruta local.
+
+La generación corre en un hilo dedicado que agrupa las peticiones concurrentes
+en lotes dinámicos: toma la primera petición de la cola, espera hasta
+batch_wait_ms a que lleguen más (hasta max_batch_size) y genera todas en una
+sola llamada a model.generate(). torch libera el GIL mientras calcula, así el
+event loop de Chainlit sigue atendiendo a las demás sesiones.
+
+LocalLLM expone el worker con la interfaz LLM de LangChain, así las cadenas
+de agent/prompts.py lo usan igual que a HuggingFaceHub.
+"""
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+from typing import Any
+
+from langchain.llms.base import LLM
+from langchain.schema import Generation, LLMResult
+
+logger = logging.getLogger(__name__)
+
+GeneratedText = namedtuple("GeneratedText", ["text", "tokens"])
+GenerationRequest = namedtuple("GenerationRequest", ["prompt", "future"])
+
+
+def apply_stop(text, stop):
+    """Corta el texto en la primera secuencia de parada"""
+    if not stop:
+        return text
+    positions = [text.find(s) for s in stop if s and s in text]
+    return text[:min(positions)] if positions else text
+
+
+class Seq2SeqGenerator:
+    """
+    Modelo seq2seq de transformers que genera un lote de prompts por llamada.
+
+    `threads` fija los hilos intra-op de torch (0 deja el valor por defecto);
+    conviene que no supere los núcleos disponibles para el proceso.
+    """
+
+    def __init__(self, model_path, max_new_tokens=256, max_input_tokens=512, threads=0, temperature=0.0):
+        import torch
+        from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+
+        from utils.embedding_pipeline import set_torch_threads
+
+        set_torch_threads(threads)
+        self._torch = torch
+        self.model_path = model_path
+        self.max_new_tokens = max_new_tokens
+        self.max_input_tokens = max_input_tokens
+        self.temperature = temperature
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.model = AutoModelForSeq2SeqLM.from_pretrained(model_path)
+        self.model.eval()
+
+    def generate(self, prompts):
+        inputs = self.tokenizer(
+            prompts,
+            return_tensors="pt",
+            padding=True,
+            truncation=True,
+            max_length=self.max_input_tokens,
+        )
+        options = {"max_new_tokens": self.max_new_tokens}
+        if self.temperature > 0:
+            options.update(do_sample=True, temperature=self.temperature)
+        with self._torch.inference_mode():
+            outputs = self.model.generate(**inputs, **options)
+
+        texts = self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
+        # Tokens generados por fila, sin el relleno ni el token inicial del decoder
+        tokens = (outputs != self.tokenizer.pad_token_id).sum(dim=1).tolist()
+        return [GeneratedText(text.strip(), count) for text, count in zip(texts, tokens)]
+
+
+class GenerationWorker:
+    """
+    Hilo dedicado que atiende una cola de prompts con lotes dinámicos.
+
+    Cada petición recibe un concurrent.futures.Future con su GeneratedText; si
+    el modelo falla, todas las peticiones del lote reciben la excepción.
+    """
+
+    def __init__(self, generator, max_batch_size=8, batch_wait_ms=5):
+        self.generator = generator
+        self.max_batch_size = max_batch_size
+        self.batch_wait = batch_wait_ms / 1000
+        self.batches = 0
+        self.prompts = 0
+        self.tokens = 0
+        self.generation_seconds = 0.0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="medichat-llm", daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    def submit(self, prompt):
+        future = Future()
+        self._queue.put(GenerationRequest(prompt, future))
+        return future
+
+    def close(self):
+        """Detiene el hilo después de atender las peticiones ya encoladas"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "prompts": self.prompts,
+            "pending": self.pending,
+            "avg_batch_size": self.prompts / self.batches if self.batches else 0.0,
+            "tokens_per_second": self.tokens / self.generation_seconds if self.generation_seconds else 0.0,
+        }
+
+    def _next_batch(self):
+        request = self._queue.get()
+        if request is None:
+            return None
+        batch = [request]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                request = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                # Reencolar la señal de cierre para salir después de este lote
+                self._queue.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            # Las peticiones canceladas mientras esperaban no ocupan lugar en el lote
+            batch = [request for request in batch if request.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            start = time.perf_counter()
+            try:
+                results = self.generator.generate([request.prompt for request in batch])
+            except Exception as e:
+                logger.exception("Falló la generación de un lote de %d prompts", len(batch))
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            self.generation_seconds += time.perf_counter() - start
+            self.batches += 1
+            self.prompts += len(batch)
+            self.tokens += sum(result.tokens for result in results)
+            for request, result in zip(batch, results):
+                request.future.set_result(result)
+
+
+class LocalLLM(LLM):
+    """
+    LLM de LangChain respaldado por un GenerationWorker.
+
+    generate()/agenerate() encolan todos los prompts a la vez, así el worker
+    puede agruparlos en un lote junto con los de otras sesiones.
+    """
+
+    worker: Any
+
+    @property
+    def _llm_type(self):
+        return "local_seq2seq"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        return apply_stop(self.worker.submit(prompt).result().text, stop)
+
+    async def _acall(self, prompt, stop=None, run_manager=None, **kwargs):
+        result = await asyncio.wrap_future(self.worker.submit(prompt))
+        return apply_stop(result.text, stop)
+
+    def _generate(self, prompts, stop=None, run_manager=None, **kwargs):
+        futures = [self.worker.submit(prompt) for prompt in prompts]
+        return LLMResult(generations=[
+            [Generation(text=apply_stop(future.result().text, stop))] for future in futures
+        ])
+
+    async def _agenerate(self, prompts, stop=None, run_manager=None, **kwargs):
+        results = await asyncio.gather(*[asyncio.wrap_future(self.worker.submit(p)) for p in prompts])
+        return LLMResult(generations=[[Generation(text=apply_stop(r.text, stop))] for r in results])
+
+
+def create_local_llm():
+    """LLM local con la configuración del entorno (MEDICHAT_LOCAL_MODEL_PATH y afines)"""
+    model_path = os.environ.get("MEDICHAT_LOCAL_MODEL_PATH")
+    if not model_path:
+        raise ValueError("MEDICHAT_LLM_BACKEND=local requiere MEDICHAT_LOCAL_MODEL_PATH")
+    logger.info("Cargando el modelo local %s", model_path)
+    generator = Seq2SeqGenerator(
+        model_path,
+        max_new_tokens=int(os.environ.get("MEDICHAT_LOCAL_MAX_NEW_TOKENS", "256")),
+        max_input_tokens=int(os.environ.get("MEDICHAT_LOCAL_MAX_INPUT_TOKENS", "512")),
+        threads=int(os.environ.get("MEDICHAT_LOCAL_THREADS", "0")),
+        temperature=float(os.environ.get("MEDICHAT_LOCAL_TEMPERATURE", "0")),
+    )
+    worker = GenerationWorker(
+        generator,
+        max_batch_size=int(os.environ.get("MEDICHAT_LOCAL_BATCH_SIZE", "8")),
+        batch_wait_ms=float(os.environ.get("MEDICHAT_LOCAL_BATCH_WAIT_MS", "5")),
+    )
+    return LocalLLM(worker=worker)
@@ -9,7 +9,16 @@ dotenv.load_dotenv()
 def get_medical_qa_model():
     """
     Devuelve el modelo de lenguaje para preguntas y respuestas médicas.
+    Con MEDICHAT_LLM_BACKEND=local carga un modelo seq2seq desde disco
+    (models/local_llm.py); por defecto usa Hugging Face Hub si hay token.
     """
+    backend = os.environ.get("MEDICHAT_LLM_BACKEND", "hub")
+    if backend == "local":
+        from models.local_llm import create_local_llm
+        return create_local_llm()
+    if backend != "hub":
+        raise ValueError(f"Backend de LLM desconocido: {backend}")
+    
     # Verificar si hay un token de API de Hugging Face
     huggingface_token = os.environ.get("HUGGINGFACEHUB_API_TOKEN")
     
@@ -0,0 +1,243 @@
+"""
+Control de la latencia de cola de las llamadas al LLM.
+
+Cuando HuggingFaceHub está lento o limita las peticiones, cada sesión que lo
+llama queda esperando. ResilientLLM envuelve al LLM con:
+
+    plazo por llamada   la llamada se abandona pasados `timeout` segundos
+    cobertura (hedge)   si la primera llamada tarda más que el p95 reciente,
+                        se lanza una segunda y se usa la que termine primero
+    circuit breaker     tras `failure_threshold` fallos seguidos el circuito
+                        se abre y las llamadas fallan de inmediato durante
+                        `reset_seconds`; después se deja pasar una de prueba
+
+El envoltorio con la interfaz LLM de LangChain está en models/resilient_llm.py;
+este módulo no importa LangChain, así el agente puede capturar
+LLMUnavailableError sin cargarlo al arrancar.
+
+Las llamadas que no se pueden completar lanzan LLMUnavailableError, y el
+agente responde con sus rutas basadas en reglas (léxico de síntomas y
+condiciones predefinidas) en lugar de bloquear la sesión.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class LLMUnavailableError(RuntimeError):
+    """Se lanza cuando el LLM no responde a tiempo, falla o el circuito está abierto"""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por fallos consecutivos.
+
+    Cerrado deja pasar todo; abierto rechaza hasta que pasan reset_seconds;
+    semiabierto deja pasar una sola llamada de prueba, que lo cierra si sale
+    bien o lo vuelve a abrir si falla.
+    """
+
+    def __init__(self, failure_threshold=5, reset_seconds=30, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.opened = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == OPEN and self._clock() - self._opened_at >= self.reset_seconds:
+                return HALF_OPEN
+            return self._state
+
+    def allow(self):
+        """True si la llamada puede pasar; en semiabierto solo pasa la de prueba"""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if self._clock() - self._opened_at < self.reset_seconds:
+                    return False
+                self._state = HALF_OPEN
+                self._probe_in_flight = False
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self.opened += 1
+                    logger.warning("Circuito del LLM abierto tras %d fallos", self._failures)
+                self._state = OPEN
+                self._opened_at = self._clock()
+                self._probe_in_flight = False
+
+    def release_probe(self):
+        """
+        Libera la llamada de prueba sin resultado (por ejemplo, si se canceló);
+        la siguiente llamada vuelve a probar el LLM.
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+
+class ResiliencePolicy:
+    """
+    Plazo, cobertura y circuit breaker compartidos por todas las llamadas al LLM.
+
+    El retraso de la cobertura es el cuantil `hedge_quantile` de las latencias
+    de las últimas `window` llamadas exitosas; hasta reunir hedge_min_samples
+    no se cubre ninguna llamada.
+    """
+
+    def __init__(self, timeout=20.0, breaker=None, hedge=False, hedge_quantile=0.95,
+                 hedge_min_samples=20, window=200):
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self._latencies = deque(maxlen=window)
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self):
+        """Segundos tras los que se lanza la segunda llamada, o None si no se cubre"""
+        if not self.hedge or len(self._latencies) < self.hedge_min_samples:
+            return None
+        return float(np.quantile(self._latencies, self.hedge_quantile))
+
+    def before_call(self):
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise LLMUnavailableError("El circuito del LLM está abierto")
+        self.calls += 1
+
+    def record_success(self, seconds):
+        self._latencies.append(seconds)
+        self.breaker.record_success()
+
+    def record_failure(self, timed_out=False):
+        self.failures += 1
+        if timed_out:
+            self.timeouts += 1
+        self.breaker.record_failure()
+
+    def record_abandoned(self):
+        """La llamada terminó sin resultado (cancelada): no cuenta como éxito ni como fallo"""
+        self.breaker.release_probe()
+
+    async def call(self, attempt, hedge=True):
+        """
+        Ejecuta `attempt()` (una función que devuelve una corrutina nueva en
+        cada llamada) dentro del plazo. Si la primera llamada supera el retraso
+        de cobertura, o falla antes, se lanza una segunda y gana la primera que
+        responda bien.
+        """
+        self.before_call()
+        start = time.perf_counter()
+        deadline = start + self.timeout
+        delay = self.hedge_delay() if hedge else None
+        first = asyncio.ensure_future(attempt())
+        tasks = {first}
+        error = None
+        try:
+            while tasks:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                wait = remaining if delay is None else min(remaining, delay)
+                done, _ = await asyncio.wait(tasks, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    tasks.discard(task)
+                    if task.exception() is None:
+                        self.record_success(time.perf_counter() - start)
+                        if task is not first:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+                if delay is not None and (not done or not tasks):
+                    # Una sola llamada de cobertura por petición
+                    tasks.add(asyncio.ensure_future(attempt()))
+                    self.hedges += 1
+                    delay = None
+        except BaseException:
+            # Cancelada desde fuera (botón de detener, fin de sesión): si era la
+            # prueba del circuito semiabierto, liberarla o el circuito no vuelve a cerrarse
+            self.record_abandoned()
+            raise
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        if not tasks and error is not None:
+            self.record_failure()
+            raise LLMUnavailableError(f"Falló la llamada al LLM: {error}") from error
+        self.record_failure(timed_out=True)
+        raise LLMUnavailableError(f"El LLM no respondió en {self.timeout:.1f} s")
+
+    def stats(self):
+        delay = self.hedge_delay()
+        return {
+            "breaker_state": STATE_CODES[self.breaker.state],
+            "breaker_opened": self.breaker.opened,
+            "calls": self.calls,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_delay_seconds": delay if delay is not None else 0.0,
+        }
+
+
+def create_resilient_llm(llm):
+    """
+    Envuelve el LLM con plazo y circuit breaker salvo que esté desactivado
+    (MEDICHAT_LLM_RESILIENCE=0). La cobertura se activa con MEDICHAT_LLM_HEDGE=1.
+    """
+    if os.environ.get("MEDICHAT_LLM_RESILIENCE", "1") == "0":
+        return llm
+    # El envoltorio importa LangChain: solo se carga al construir el LLM
+    from models.resilient_llm import ResilientLLM
+    policy = ResiliencePolicy(
+        timeout=float(os.environ.get("MEDICHAT_LLM_TIMEOUT", "20")),
+        breaker=CircuitBreaker(
+            failure_threshold=int(os.environ.get("MEDICHAT_LLM_BREAKER_FAILURES", "5")),
+            reset_seconds=float(os.environ.get("MEDICHAT_LLM_BREAKER_RESET", "30")),
+        ),
+        hedge=os.environ.get("MEDICHAT_LLM_HEDGE", "0") == "1",
+        hedge_quantile=float(os.environ.get("MEDICHAT_LLM_HEDGE_QUANTILE", "0.95")),
+    )
+    return ResilientLLM(llm=llm, policy=policy)
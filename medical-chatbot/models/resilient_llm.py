@@ -0,0 +1,66 @@
+"""Envoltorio LLM de LangChain para el control de latencia de models/resilience.py"""
+import time
+from typing import Any
+
+from langchain.llms.base import LLM
+from langchain.schema.output import GenerationChunk
+from langchain_core.language_models.llms import BaseLLM
+
+from models.resilience import LLMUnavailableError
+
+
+class ResilientLLM(LLM):
+    """
+    LLM cuyas llamadas asíncronas pasan por un ResiliencePolicy.
+
+    Los modelos con streaming nativo se protegen hasta el primer token (el
+    plazo cubre la espera inicial, no la respuesta completa); los demás se
+    llaman con ainvoke y devuelven la respuesta en un solo fragmento. Las
+    llamadas síncronas solo consultan y actualizan el circuit breaker.
+    """
+
+    llm: BaseLLM
+    policy: Any
+
+    @property
+    def _llm_type(self):
+        return "resilient"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        self.policy.before_call()
+        start = time.perf_counter()
+        try:
+            result = self.llm.invoke(prompt, stop=stop, **kwargs)
+        except Exception as e:
+            self.policy.record_failure()
+            raise LLMUnavailableError(f"Falló la llamada al LLM: {e}") from e
+        except BaseException:
+            # Interrumpida sin resultado: liberar la prueba del circuito semiabierto
+            self.policy.record_abandoned()
+            raise
+        self.policy.record_success(time.perf_counter() - start)
+        return result
+
+    async def _acall(self, prompt, stop=None, run_manager=None, **kwargs):
+        return await self.policy.call(lambda: self.llm.ainvoke(prompt, stop=stop, **kwargs))
+
+    async def _astream(self, prompt, stop=None, run_manager=None, **kwargs):
+        if type(self.llm)._astream is BaseLLM._astream and type(self.llm)._stream is BaseLLM._stream:
+            yield GenerationChunk(text=await self._acall(prompt, stop=stop, **kwargs))
+            return
+
+        stream = self.llm.astream(prompt, stop=stop, **kwargs).__aiter__()
+
+        async def first_token():
+            async for token in stream:
+                return token
+            return None
+
+        # El primer token pasa por el plazo y el circuit breaker; el resto se
+        # reenvía tal cual. Sin cobertura: no se puede leer dos veces el mismo stream
+        first = await self.policy.call(first_token, hedge=False)
+        if first is None:
+            return
+        yield GenerationChunk(text=first)
+        async for token in stream:
+            yield GenerationChunk(text=token)
@@ -0,0 +1,313 @@
+"""
+Búsqueda híbrida: índice invertido BM25 sobre los chunks de la colección de
+Chroma fusionado con la búsqueda vectorial.
+
+Los embeddings de mpnet a veces ordenan por debajo de chunks vagamente
+relacionados a los que contienen el término clínico exacto de la consulta
+("apendicitis", "tos con sangre"). BM25 premia esas coincidencias literales y
+la fusión por rango recíproco (RRF) combina ambos ordenamientos sin tener que
+calibrar puntajes de escalas distintas.
+
+El índice se construye una vez a partir de la colección (los mismos chunks que
+produce get_vector_store) y se guarda en `chroma_db/bm25/`: vocabulario en
+JSON, listas de postings con el peso BM25 ya calculado en .npy (abiertas con
+mmap) y los textos en documents.jsonl. Se reconstruye solo cuando cambia el
+conjunto de chunks o los parámetros de BM25.
+
+Modos (MEDICHAT_RETRIEVAL_MODE):
+    vector    solo búsqueda vectorial (comportamiento anterior)
+    hybrid    vectorial + BM25 fusionados con RRF
+    lexical   solo BM25
+"""
+import json
+import logging
+import math
+import mmap
+import os
+import re
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from utils.text import normalize_text
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 2
+RETRIEVAL_MODES = ("vector", "hybrid", "lexical")
+EXPORT_BATCH_SIZE = 1000
+
+META_FILENAME = "meta.json"
+VOCABULARY_FILENAME = "vocabulary.json"
+POSTINGS_DOCS_FILENAME = "postings_docs.npy"
+POSTINGS_WEIGHTS_FILENAME = "postings_weights.npy"
+DOCUMENTS_FILENAME = "documents.jsonl"
+OFFSETS_FILENAME = "offsets.npy"
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Palabras vacías del español, ya sin tildes (el texto se normaliza antes)
+STOPWORDS = frozenset(normalize_text(word) for word in """
+    a al algo algun alguna algunas alguno algunos ante antes aqui asi aun bajo
+    bien cada como con contra cual cuales cuando de del desde donde dos durante
+    e el ella ellas ellos en entre era eran es esa esas ese eso esos esta estan
+    estar estas este esto estos fue fueron ha han hasta hay la las le les lo los
+    mas me mi mis mucho muy ni no nos o os otra otras otro otros para pero poco
+    por porque puede pueden que se sea segun ser si sido sin sobre son su sus
+    tambien tan tanto te tengo tiene tienen toda todas todo todos tu tus un una
+    unas uno unos y ya yo
+""".split())
+
+VOWELS = frozenset("aeiou")
+
+
+def _stem(token):
+    """
+    Lleva singular y plural al mismo término: quita la 's' final y luego una
+    'e' final tras consonante, así 'dolores' y 'dolor' dan 'dolor', 'fiebres'
+    y 'fiebre' dan 'fiebr', y 'nauseas' y 'nausea' dan 'nausea'.
+    """
+    if len(token) > 3 and token.endswith("s"):
+        token = token[:-1]
+    if len(token) > 3 and token.endswith("e") and token[-2] not in VOWELS:
+        token = token[:-1]
+    return token
+
+
+def tokenize(text):
+    """Términos de un texto: minúsculas, sin tildes, sin palabras vacías y en singular"""
+    return [
+        _stem(token)
+        for token in TOKEN_PATTERN.findall(normalize_text(text))
+        if len(token) > 1 and token not in STOPWORDS
+    ]
+
+
+def document_key(document):
+    """Identidad de un chunk para fusionar resultados de distintos buscadores"""
+    return document.metadata.get("source"), document.page_content
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Fusiona varias listas ordenadas de documentos: cada documento suma
+    1 / (k + rango) por cada lista en la que aparece.
+    """
+    scores = {}
+    documents = {}
+    for ranking in rankings:
+        for rank, document in enumerate(ranking, start=1):
+            key = document_key(document)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            documents.setdefault(key, document)
+    ordered = sorted(scores, key=scores.get, reverse=True)
+    return [documents[key] for key in ordered]
+
+
+def _atomic_path(path):
+    return f"{path}.tmp-{os.getpid()}"
+
+
+def _save_array(path, array):
+    """Guarda un .npy sin pisar el archivo que otros workers tienen abierto con mmap"""
+    with open(_atomic_path(path), "wb") as f:
+        np.save(f, array)
+    os.replace(_atomic_path(path), path)
+
+
+def build_bm25_index(collection, directory, k1=1.2, b=0.75, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Recorre la colección por páginas, guarda los textos en documents.jsonl y
+    escribe las listas de postings con el peso BM25 de cada (término, chunk).
+    Devuelve (cantidad de chunks, longitud media en términos).
+    """
+    count = collection.count()
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    lengths = np.zeros(count, dtype=np.float32)
+    postings = defaultdict(list)  # término -> [(posición, frecuencia)]
+    documents_path = os.path.join(directory, DOCUMENTS_FILENAME)
+
+    position = 0
+    with open(_atomic_path(documents_path), "wb") as documents:
+        for offset in range(0, count, batch_size):
+            page = collection.get(limit=batch_size, offset=offset, include=["documents", "metadatas"])
+            for text, metadata in zip(page["documents"], page["metadatas"]):
+                terms = Counter(tokenize(text or ""))
+                for term, frequency in terms.items():
+                    postings[term].append((position, frequency))
+                lengths[position] = sum(terms.values())
+                line = json.dumps({"page_content": text, "metadata": metadata or {}}, ensure_ascii=False)
+                documents.write(line.encode("utf-8") + b"\n")
+                position += 1
+                offsets[position] = documents.tell()
+    os.replace(_atomic_path(documents_path), documents_path)
+    _save_array(os.path.join(directory, OFFSETS_FILENAME), offsets)
+
+    average_length = float(lengths.mean()) if count else 0.0
+    # Normalización de longitud de cada chunk, común a todos sus términos
+    length_norm = k1 * (1 - b + b * lengths / average_length) if average_length else np.full(count, k1)
+
+    vocabulary = {}
+    total = sum(len(entries) for entries in postings.values())
+    docs = np.zeros(total, dtype=np.int32)
+    weights = np.zeros(total, dtype=np.float32)
+    start = 0
+    for term in sorted(postings):
+        entries = postings[term]
+        end = start + len(entries)
+        positions = np.array([p for p, _ in entries], dtype=np.int32)
+        frequencies = np.array([f for _, f in entries], dtype=np.float32)
+        idf = math.log(1 + (count - len(entries) + 0.5) / (len(entries) + 0.5))
+        docs[start:end] = positions
+        weights[start:end] = idf * frequencies * (k1 + 1) / (frequencies + length_norm[positions])
+        vocabulary[term] = [start, end]
+        start = end
+
+    _save_array(os.path.join(directory, POSTINGS_DOCS_FILENAME), docs)
+    _save_array(os.path.join(directory, POSTINGS_WEIGHTS_FILENAME), weights)
+    vocabulary_path = os.path.join(directory, VOCABULARY_FILENAME)
+    with open(_atomic_path(vocabulary_path), "w", encoding="utf-8") as f:
+        json.dump(vocabulary, f, ensure_ascii=False)
+    os.replace(_atomic_path(vocabulary_path), vocabulary_path)
+    return count, average_length
+
+
+class BM25Index:
+    """
+    Índice invertido BM25 de solo lectura.
+
+    Los pesos de cada posting se calculan al construir el índice, así una
+    búsqueda solo suma los pesos de las listas de los términos de la consulta.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, META_FILENAME), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(os.path.join(directory, VOCABULARY_FILENAME), encoding="utf-8") as f:
+            self.vocabulary = json.load(f)
+        self._docs = np.load(os.path.join(directory, POSTINGS_DOCS_FILENAME), mmap_mode="r")
+        self._weights = np.load(os.path.join(directory, POSTINGS_WEIGHTS_FILENAME), mmap_mode="r")
+
+        self._offsets = np.load(os.path.join(directory, OFFSETS_FILENAME), mmap_mode="r")
+        self._documents_file = open(os.path.join(directory, DOCUMENTS_FILENAME), "rb")
+        if self._offsets[-1] > 0:
+            self._documents = mmap.mmap(self._documents_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._documents = b""
+
+    def __len__(self):
+        return self.meta["count"]
+
+    def document(self, position):
+        from langchain.schema import Document
+
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        data = json.loads(self._documents[start:end])
+        return Document(page_content=data["page_content"], metadata=data["metadata"])
+
+    def search_positions(self, query, k):
+        """Posiciones y puntajes BM25 de los k chunks con mejor puntaje (> 0)"""
+        spans = [self.vocabulary[term] for term in set(tokenize(query)) if term in self.vocabulary]
+        if not spans or k <= 0:
+            return []
+        scores = np.zeros(len(self), dtype=np.float32)
+        for start, end in spans:
+            # Dentro de una lista cada chunk aparece una sola vez
+            scores[self._docs[start:end]] += self._weights[start:end]
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(p), float(scores[p])) for p in order]
+
+    def search(self, query, k=4):
+        return [self.document(p) for p, _ in self.search_positions(query, k)]
+
+    def close(self):
+        if isinstance(self._documents, mmap.mmap):
+            self._documents.close()
+        self._documents_file.close()
+
+    @classmethod
+    def from_chroma(cls, db, directory, k1=1.2, b=0.75, rebuild=False):
+        """
+        Abre el índice BM25 de la colección, construyéndolo de nuevo si la
+        colección o los parámetros cambiaron desde la última vez.
+        """
+        from utils.faiss_store import ids_digest
+
+        collection = db._collection
+        ids = collection.get(include=[])["ids"]
+        config = {"version": INDEX_VERSION, "k1": k1, "b": b, "ids_digest": ids_digest(ids)}
+
+        meta_path = os.path.join(directory, META_FILENAME)
+        meta = None
+        if not rebuild and os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        if meta is None or any(meta.get(key) != value for key, value in config.items()):
+            logger.info("Construyendo índice BM25 con %d chunks", len(ids))
+            os.makedirs(directory, exist_ok=True)
+            count, average_length = build_bm25_index(collection, directory, k1, b)
+            meta = dict(config, count=count, average_length=average_length)
+            # meta.json se escribe al final: marca el índice como completo
+            with open(_atomic_path(meta_path), "w", encoding="utf-8") as f:
+                json.dump(meta, f, indent=2)
+            os.replace(_atomic_path(meta_path), meta_path)
+        return cls(directory)
+
+
+class HybridVectorStore:
+    """
+    Base vectorial que combina la búsqueda vectorial con BM25.
+
+    `retrieve(query, k, embedding)` es la API única de recuperación: en modo
+    hybrid pide `candidates` resultados a cada buscador y los fusiona con RRF;
+    en modo lexical usa solo BM25. Si ya se calculó el vector de la consulta
+    (por ejemplo para la caché de respuestas) se reutiliza.
+    """
+
+    def __init__(self, vector_store, lexical_index, mode="hybrid", candidates=10, rrf_k=60):
+        if mode not in ("hybrid", "lexical"):
+            raise ValueError(f"Modo de recuperación desconocido: {mode}")
+        self.vector_store = vector_store
+        self.lexical_index = lexical_index
+        self.mode = mode
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+
+    def retrieve(self, query, k=4, embedding=None):
+        candidates = max(k, self.candidates)
+        lexical = self.lexical_index.search(query, candidates)
+        if self.mode == "lexical":
+            return lexical[:k]
+        if embedding is None:
+            embedding = self.vector_store.embeddings.embed_query(query)
+        vector = self.vector_store.similarity_search_by_vector(embedding, k=candidates)
+        return reciprocal_rank_fusion([vector, lexical], k=self.rrf_k)[:k]
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return self.retrieve(query, k)
+
+    def __getattr__(self, name):
+        # similarity_search_by_vector y el resto se delegan a la base vectorial
+        return getattr(self.vector_store, name)
+
+
+def create_hybrid_store(vector_store, db, persist_directory, mode):
+    """Envuelve la base vectorial con BM25 según la configuración del entorno"""
+    lexical_index = BM25Index.from_chroma(
+        db,
+        directory=os.path.join(persist_directory, "bm25"),
+        k1=float(os.environ.get("MEDICHAT_BM25_K1", "1.2")),
+        b=float(os.environ.get("MEDICHAT_BM25_B", "0.75")),
+    )
+    return HybridVectorStore(
+        vector_store,
+        lexical_index,
+        mode=mode,
+        candidates=int(os.environ.get("MEDICHAT_HYBRID_CANDIDATES", "10")),
+        rrf_k=int(os.environ.get("MEDICHAT_RRF_K", "60")),
+    )
@@ -0,0 +1,127 @@
+import atexit
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from langchain.embeddings.base import Embeddings
+
+from utils.text import normalize_text
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Caché LRU con caducidad opcional para los embeddings de las consultas.
+
+    Las preguntas se normalizan (minúsculas, sin tildes, espacios colapsados)
+    antes de buscarlas, así "¿Qué es la migraña?" y "¿que es la  migrana?"
+    comparten vector y no vuelven a pasar por el modelo. Los embeddings de
+    documentos no se cachean: se delegan tal cual al modelo original.
+    """
+
+    def __init__(self, embeddings, max_entries=1024, ttl_seconds=None,
+                 persist_path=None, model_name=""):
+        self.embeddings = embeddings
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persist_path = persist_path
+        self.model_name = model_name
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # clave normalizada -> (vector, instante de creación)
+        self._lock = threading.Lock()
+
+        if persist_path:
+            self.load()
+            atexit.register(self.save)
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        key = normalize_text(text)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                vector, created = entry
+                if self.ttl_seconds and now - created > self.ttl_seconds:
+                    del self._entries[key]
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return list(vector)
+            self.misses += 1
+
+        # El modelo se ejecuta fuera del lock para no serializar las consultas
+        vector = self.embeddings.embed_query(text)
+
+        with self._lock:
+            self._entries[key] = (tuple(vector), now)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return vector
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def save(self):
+        """Guarda la caché en disco para reutilizarla tras un reinicio"""
+        if not self.persist_path:
+            return
+        with self._lock:
+            # En disco se guarda la antigüedad, porque time.monotonic() no sobrevive al reinicio
+            now = time.monotonic()
+            entries = [(key, vector, now - created) for key, (vector, created) in self._entries.items()]
+        directory = os.path.dirname(self.persist_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.persist_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"model_name": self.model_name, "entries": entries}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.persist_path)
+
+    def load(self):
+        """Carga la caché guardada si corresponde al mismo modelo de embeddings"""
+        try:
+            with open(self.persist_path, "rb") as f:
+                data = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return
+        if data.get("model_name") != self.model_name:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for key, vector, age in data.get("entries", [])[-self.max_entries:]:
+                if self.ttl_seconds and age > self.ttl_seconds:
+                    continue
+                self._entries[key] = (tuple(vector), now - age)
+
+
+def create_query_embeddings(embeddings, model_name=""):
+    """Envuelve el modelo con la caché de consultas según la configuración del entorno"""
+    max_entries = int(os.environ.get("MEDICHAT_QUERY_CACHE_SIZE", "1024"))
+    if max_entries <= 0:
+        return embeddings
+    ttl_seconds = float(os.environ.get("MEDICHAT_QUERY_CACHE_TTL", "0")) or None
+    persist_path = os.environ.get("MEDICHAT_QUERY_CACHE_PATH") or None
+    return CachedQueryEmbeddings(
+        embeddings,
+        max_entries=max_entries,
+        ttl_seconds=ttl_seconds,
+        persist_path=persist_path,
+        model_name=model_name,
+    )
@@ -0,0 +1,153 @@
+"""
+Pipeline de embeddings por lotes para indexar corpus grandes.
+
+Los chunks llegan de un iterable (se leen y dividen de forma perezosa), se
+agrupan en lotes de tamaño configurable y se embeben en el proceso actual o en
+un pool de procesos, cada uno con su propia copia del modelo. Los resultados se
+escriben en orden con una función de escritura por lote (upsert masivo en Chroma).
+"""
+import multiprocessing
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+PipelineStats = namedtuple(
+    "PipelineStats",
+    ["chunks", "batches", "seconds", "docs_per_second", "peak_rss_mb", "peak_worker_rss_mb"],
+)
+
+# Modelo cargado en cada proceso del pool
+_worker_embeddings = None
+
+
+def set_torch_threads(threads):
+    """Limita los hilos intra-op de torch; sin torch instalado no hace nada"""
+    if not threads:
+        return
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(threads)
+
+
+def _default_embeddings_factory():
+    from utils.vector_store import get_embeddings
+    return get_embeddings()
+
+
+def _init_worker(embeddings_factory, threads):
+    global _worker_embeddings
+    set_torch_threads(threads)
+    _worker_embeddings = embeddings_factory()
+
+
+def _embed_in_worker(texts):
+    return _worker_embeddings.embed_documents(texts)
+
+
+def _max_rss_mb(who):
+    try:
+        import resource  # solo existe en Unix
+    except ImportError:
+        return None
+    # En Linux ru_maxrss viene en KB
+    return resource.getrusage(getattr(resource, who)).ru_maxrss / 1024
+
+
+def peak_rss_mb():
+    """Memoria residente máxima del proceso actual, en MB (None fuera de Unix)"""
+    return _max_rss_mb("RUSAGE_SELF")
+
+
+def peak_worker_rss_mb():
+    """
+    Memoria residente máxima del mayor proceso hijo ya terminado, en MB. No es
+    el total del pool: ru_maxrss de RUSAGE_CHILDREN es el máximo de un solo hijo.
+    """
+    return _max_rss_mb("RUSAGE_CHILDREN")
+
+
+def _batches(chunks, batch_size):
+    iterator = iter(chunks)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+class EmbeddingPipeline:
+    """
+    Embebe chunks por lotes y los escribe en bloque.
+
+    workers=1 usa el modelo del proceso actual (o el que se pase en `embeddings`);
+    con workers>1 se arranca un pool de procesos que cargan el modelo una vez cada
+    uno. `threads` fija los hilos intra-op de torch en cada proceso para no
+    sobresuscribir la CPU (workers * threads <= núcleos disponibles).
+    """
+
+    def __init__(self, embeddings=None, batch_size=64, workers=1, threads=None,
+                 embeddings_factory=_default_embeddings_factory):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.workers = workers
+        self.threads = threads
+        self.embeddings_factory = embeddings_factory
+
+    def run(self, chunks, write_batch):
+        """
+        Consume un iterable de (id, texto, metadatos) y llama a
+        write_batch(ids, textos, metadatos, vectores) por cada lote embebido.
+        """
+        start = time.perf_counter()
+        total_chunks = 0
+        total_batches = 0
+
+        for ids, texts, metadatas, vectors in self._embed_batches(chunks):
+            write_batch(ids, texts, metadatas, vectors)
+            total_chunks += len(ids)
+            total_batches += 1
+
+        seconds = time.perf_counter() - start
+        return PipelineStats(
+            chunks=total_chunks,
+            batches=total_batches,
+            seconds=seconds,
+            docs_per_second=total_chunks / seconds if seconds > 0 else 0.0,
+            peak_rss_mb=peak_rss_mb(),
+            peak_worker_rss_mb=peak_worker_rss_mb() if self.workers > 1 else None,
+        )
+
+    def _embed_batches(self, chunks):
+        batches = _batches(chunks, self.batch_size)
+
+        if self.workers <= 1:
+            set_torch_threads(self.threads)
+            embeddings = self.embeddings or self.embeddings_factory()
+            for batch in batches:
+                ids, texts, metadatas = zip(*batch)
+                yield list(ids), list(texts), list(metadatas), embeddings.embed_documents(list(texts))
+            return
+
+        # "spawn" evita heredar el estado de torch del proceso padre mediante fork
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self.embeddings_factory, self.threads),
+        ) as pool:
+            # Mantener como máximo dos lotes por proceso en vuelo para acotar la memoria
+            in_flight = deque()
+            for batch in batches:
+                ids, texts, metadatas = zip(*batch)
+                future = pool.submit(_embed_in_worker, list(texts))
+                in_flight.append((list(ids), list(texts), list(metadatas), future))
+                if len(in_flight) >= self.workers * 2:
+                    ids, texts, metadatas, future = in_flight.popleft()
+                    yield ids, texts, metadatas, future.result()
+            while in_flight:
+                ids, texts, metadatas, future = in_flight.popleft()
+                yield ids, texts, metadatas, future.result()
@@ -0,0 +1,388 @@
+"""
+Servicio de embeddings compartido entre procesos.
+
+Con varios workers de Chainlit, cada proceso cargaría su propia copia del
+modelo mpnet. El servidor carga el modelo una sola vez, escucha en un socket
+Unix, agrupa en lotes las peticiones que llegan de todos los workers y
+devuelve los vectores en binario. RemoteEmbeddings es el cliente con la
+interfaz Embeddings de LangChain: basta con MEDICHAT_EMBEDDING_SOCKET para
+que get_embeddings() lo use en lugar del modelo en proceso.
+
+Protocolo: cada mensaje es una cabecera <BI (código, longitud del cuerpo)
+seguida del cuerpo.
+
+    OP_EMBED      <I n, <nI longitudes en bytes, textos UTF-8 concatenados
+    OP_STATS      sin cuerpo
+    STATUS_OK     <II filas, dimensión y los vectores en float32 little-endian
+                  (OP_STATS responde un JSON)
+    STATUS_ERROR  mensaje UTF-8
+
+Uso (desde medical-chatbot/):
+    python -m utils.embedding_server --socket /tmp/medichat-embeddings.sock
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct("<BI")
+COUNT = struct.Struct("<I")
+SHAPE = struct.Struct("<II")
+OP_EMBED = 1
+OP_STATS = 2
+STATUS_OK = 0
+STATUS_ERROR = 1
+# Tamaño máximo de un mensaje; protege al servidor de cabeceras corruptas
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+
+EmbeddingRequest = namedtuple("EmbeddingRequest", ["texts", "future"])
+
+
+class EmbeddingServiceError(RuntimeError):
+    """Se lanza cuando el servidor de embeddings responde con un error"""
+
+
+def encode_texts(texts):
+    encoded = [text.encode("utf-8") for text in texts]
+    lengths = struct.pack(f"<{len(encoded)}I", *(len(data) for data in encoded))
+    return COUNT.pack(len(encoded)) + lengths + b"".join(encoded)
+
+
+def decode_texts(body):
+    (count,) = COUNT.unpack_from(body)
+    lengths = struct.unpack_from(f"<{count}I", body, COUNT.size)
+    texts = []
+    offset = COUNT.size + 4 * count
+    for length in lengths:
+        texts.append(body[offset:offset + length].decode("utf-8"))
+        offset += length
+    return texts
+
+
+def encode_vectors(vectors):
+    vectors = np.ascontiguousarray(vectors, dtype="<f4")
+    return SHAPE.pack(*vectors.shape) + vectors.tobytes()
+
+
+def decode_vectors(body):
+    rows, dim = SHAPE.unpack_from(body)
+    return np.frombuffer(body, dtype="<f4", count=rows * dim, offset=SHAPE.size).reshape(rows, dim)
+
+
+class EmbeddingBatcher:
+    """
+    Hilo dedicado que embebe las peticiones de todas las conexiones en lotes.
+
+    Toma la primera petición de la cola y espera hasta batch_wait_ms a que
+    lleguen más, hasta reunir max_batch_size textos. Cada petición recibe un
+    concurrent.futures.Future con su matriz de vectores.
+    """
+
+    def __init__(self, embeddings, max_batch_size=64, batch_wait_ms=5):
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.batch_wait = batch_wait_ms / 1000
+        self.batches = 0
+        self.texts = 0
+        self.embedding_seconds = 0.0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="medichat-embeddings", daemon=True)
+        self._thread.start()
+
+    def submit(self, texts):
+        future = Future()
+        self._queue.put(EmbeddingRequest(texts, future))
+        return future
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "pending": self._queue.qsize(),
+            "avg_batch_size": self.texts / self.batches if self.batches else 0.0,
+            "texts_per_second": self.texts / self.embedding_seconds if self.embedding_seconds else 0.0,
+        }
+
+    def _next_batch(self):
+        request = self._queue.get()
+        if request is None:
+            return None
+        batch = [request]
+        size = len(request.texts)
+        deadline = time.monotonic() + self.batch_wait
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                request = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                self._queue.put(None)
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            texts = [text for request in batch for text in request.texts]
+            start = time.perf_counter()
+            try:
+                vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+            except Exception as e:
+                logger.exception("Falló el embedding de un lote de %d textos", len(texts))
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            self.embedding_seconds += time.perf_counter() - start
+            self.batches += 1
+            self.texts += len(texts)
+            offset = 0
+            for request in batch:
+                request.future.set_result(vectors[offset:offset + len(request.texts)])
+                offset += len(request.texts)
+
+
+class EmbeddingServer:
+    """Servidor asyncio en un socket Unix que atiende a los workers con un EmbeddingBatcher"""
+
+    def __init__(self, embeddings, socket_path, max_batch_size=64, batch_wait_ms=5):
+        self.socket_path = socket_path
+        self.batcher = EmbeddingBatcher(embeddings, max_batch_size, batch_wait_ms)
+        self.connections = 0
+        self.requests = 0
+        self.errors = 0
+        self.listening = False
+
+    async def serve_forever(self, started=None):
+        self._remove_stale_socket()
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        # Solo el usuario y el grupo de los workers pueden conectarse
+        os.chmod(self.socket_path, 0o660)
+        self.listening = True
+        logger.info("Servidor de embeddings escuchando en %s", self.socket_path)
+        if started is not None:
+            started.set()
+        async with server:
+            await server.serve_forever()
+
+    def stats(self):
+        return {
+            "connections": self.connections,
+            "requests": self.requests,
+            "errors": self.errors,
+            **self.batcher.stats(),
+        }
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    code, length = HEADER.unpack(await reader.readexactly(HEADER.size))
+                except asyncio.IncompleteReadError:
+                    return
+                if length > MAX_MESSAGE_BYTES:
+                    self._write(writer, STATUS_ERROR, f"Mensaje demasiado grande: {length} bytes".encode())
+                    return
+                body = await reader.readexactly(length)
+                self.requests += 1
+                status, payload = await self._dispatch(code, body)
+                self._write(writer, status, payload)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def _dispatch(self, code, body):
+        try:
+            if code == OP_EMBED:
+                vectors = await asyncio.wrap_future(self.batcher.submit(decode_texts(body)))
+                return STATUS_OK, encode_vectors(vectors)
+            if code == OP_STATS:
+                return STATUS_OK, json.dumps(self.stats()).encode("utf-8")
+            raise ValueError(f"Operación desconocida: {code}")
+        except Exception as e:
+            self.errors += 1
+            return STATUS_ERROR, str(e).encode("utf-8")
+
+    @staticmethod
+    def _write(writer, status, payload):
+        writer.write(HEADER.pack(status, len(payload)) + payload)
+
+    def _remove_stale_socket(self):
+        """Borra el socket de una ejecución anterior; falla si otro servidor lo está usando"""
+        if not os.path.exists(self.socket_path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except OSError:
+            os.unlink(self.socket_path)
+        else:
+            raise RuntimeError(f"Ya hay un servidor de embeddings en {self.socket_path}")
+        finally:
+            probe.close()
+
+
+class RemoteEmbeddings(Embeddings):
+    """
+    Cliente del servidor de embeddings con la interfaz Embeddings de LangChain.
+
+    Cada hilo usa su propia conexión (los embeddings se piden desde el
+    executor de recuperación). Si la conexión se cae, por ejemplo porque el
+    servidor se reinició, la petición se reintenta una vez con una nueva.
+    """
+
+    def __init__(self, socket_path, timeout=30.0, max_texts_per_request=256):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.max_texts_per_request = max_texts_per_request
+        self.requests = 0
+        self.texts = 0
+        self.errors = 0
+        self.request_seconds = 0.0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        vectors = []
+        for start in range(0, len(texts), self.max_texts_per_request):
+            batch = texts[start:start + self.max_texts_per_request]
+            vectors.extend(self.embed_array(batch).tolist())
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_array([text])[0].tolist()
+
+    def embed_array(self, texts):
+        """Vectores como matriz float32, sin convertirlos a listas de Python"""
+        start = time.perf_counter()
+        body = self._request(OP_EMBED, encode_texts(texts))
+        with self._lock:
+            self.requests += 1
+            self.texts += len(texts)
+            self.request_seconds += time.perf_counter() - start
+        return decode_vectors(body)
+
+    def server_stats(self):
+        return json.loads(self._request(OP_STATS, b"").decode("utf-8"))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "texts": self.texts,
+                "errors": self.errors,
+                "avg_request_ms": 1000 * self.request_seconds / self.requests if self.requests else 0.0,
+            }
+
+    def close(self):
+        """Cierra la conexión del hilo actual"""
+        sock = getattr(self._local, "socket", None)
+        if sock is not None:
+            sock.close()
+            self._local.socket = None
+
+    def _request(self, code, body):
+        message = HEADER.pack(code, len(body)) + body
+        for attempt in range(2):
+            sock = self._connection()
+            try:
+                sock.sendall(message)
+                status, length = HEADER.unpack(self._read_exactly(sock, HEADER.size))
+                payload = self._read_exactly(sock, length)
+                break
+            except OSError:
+                self.close()
+                if attempt:
+                    with self._lock:
+                        self.errors += 1
+                    raise
+        if status != STATUS_OK:
+            with self._lock:
+                self.errors += 1
+            raise EmbeddingServiceError(payload.decode("utf-8", errors="replace"))
+        return payload
+
+    def _connection(self):
+        sock = getattr(self._local, "socket", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._local.socket = sock
+        return sock
+
+    @staticmethod
+    def _read_exactly(sock, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("El servidor de embeddings cerró la conexión")
+            data.extend(chunk)
+        return bytes(data)
+
+
+def create_remote_embeddings():
+    """Cliente del servidor de embeddings si MEDICHAT_EMBEDDING_SOCKET está definido; si no, None"""
+    socket_path = os.environ.get("MEDICHAT_EMBEDDING_SOCKET")
+    if not socket_path:
+        return None
+    return RemoteEmbeddings(
+        socket_path,
+        timeout=float(os.environ.get("MEDICHAT_EMBEDDING_TIMEOUT", "30")),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", default=os.environ.get("MEDICHAT_EMBEDDING_SOCKET", "/tmp/medichat-embeddings.sock"))
+    parser.add_argument("--batch-size", type=int, default=int(os.environ.get("MEDICHAT_EMBEDDING_BATCH_SIZE", "64")))
+    parser.add_argument("--batch-wait-ms", type=float,
+                        default=float(os.environ.get("MEDICHAT_EMBEDDING_BATCH_WAIT_MS", "5")))
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("MEDICHAT_EMBEDDING_THREADS", "0")),
+                        help="hilos intra-op de torch (0: valor por defecto)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from utils.embedding_pipeline import set_torch_threads
+    from utils.vector_store import load_embedding_model
+
+    set_torch_threads(args.threads)
+    server = EmbeddingServer(load_embedding_model(), args.socket, args.batch_size, args.batch_wait_ms)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.batcher.close()
+        if server.listening and os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ExecutorBusyError(RuntimeError):
+    """Se lanza cuando la cola del executor está llena y no se aceptan más tareas"""
+
+
+class BoundedExecutor:
+    """
+    Pool de hilos con límite de cola para trabajo bloqueante (embeddings, Chroma).
+
+    Como máximo se admiten max_workers tareas en ejecución más max_queue en espera;
+    por encima de ese límite run() falla de inmediato con ExecutorBusyError en vez
+    de acumular trabajo que bloquearía al resto de las sesiones.
+    """
+
+    def __init__(self, max_workers=2, max_queue=32, name="medichat-worker"):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+
+    @property
+    def pending(self):
+        """Tareas admitidas que aún no terminan (en ejecución o en cola)"""
+        return self._pending
+
+    def submit(self, func, *args, **kwargs):
+        """Encola una tarea y devuelve un concurrent.futures.Future"""
+        if not self._slots.acquire(blocking=False):
+            raise ExecutorBusyError(
+                f"Executor saturado ({self.max_workers} hilos, {self.max_queue} en cola)"
+            )
+        with self._pending_lock:
+            self._pending += 1
+        try:
+            future = self._pool.submit(func, *args, **kwargs)
+        except BaseException:
+            self._release(None)
+            raise
+        # El callback se ejecuta al terminar o al cancelarse antes de empezar,
+        # así el cupo nunca se libera mientras el hilo sigue trabajando
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, func, *args, **kwargs):
+        """Ejecuta func en el pool sin bloquear el event loop"""
+        future = self.submit(functools.partial(func, *args, **kwargs))
+        return await asyncio.wrap_future(future)
+
+    def _release(self, _future):
+        with self._pending_lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+
+def create_retrieval_executor():
+    """Crea el executor para embeddings y búsquedas según la configuración del entorno"""
+    return BoundedExecutor(
+        max_workers=int(os.environ.get("MEDICHAT_RETRIEVAL_WORKERS", "2")),
+        max_queue=int(os.environ.get("MEDICHAT_RETRIEVAL_MAX_QUEUE", "32")),
+        name="medichat-retrieval",
+    )
@@ -0,0 +1,334 @@
+"""
+Índice FAISS de solo lectura construido a partir de la colección de Chroma.
+
+Chroma sigue siendo el almacén de la ingesta (utils/ingest.py); este módulo
+exporta sus vectores a un índice FAISS en `chroma_db/faiss/` y responde las
+búsquedas sin pasar por Chroma. Los textos y los vectores float32 se abren con
+mmap, así varios procesos del servidor comparten una sola copia en la caché de
+páginas. Del índice FAISS solo las listas invertidas de ivf se leen con mmap:
+flat y hnsw se cargan completos en la memoria de cada proceso.
+
+Tipos de índice:
+    flat   búsqueda exacta, para corpus pequeños
+    ivf    listas invertidas (IVFFlat), para corpus grandes; nprobe ajustable
+    hnsw   grafo HNSW, baja latencia a cambio de más memoria
+    auto   flat hasta AUTO_FLAT_MAX_VECTORS vectores, ivf por encima; siempre
+           ivf si el índice está cuantizado
+
+Para corpus grandes los vectores del índice pueden guardarse cuantizados
+(fp16 o int8 por componente) o reducidos con PCA; las búsquedas reordenan los
+mejores candidatos con los vectores originales en float32. El ahorro solo se
+reparte entre procesos con ivf: un flat o hnsw cuantizado sigue cargándose en
+la memoria de cada proceso.
+
+El índice se reconstruye solo cuando cambia el conjunto de chunks de la
+colección (se compara un hash de los ids) o la configuración pedida.
+"""
+import hashlib
+import json
+import logging
+import math
+import mmap
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+INDEX_TYPES = ("auto", "flat", "ivf", "hnsw")
+QUANTIZATIONS = ("none", "fp16", "int8", "pca")
+AUTO_FLAT_MAX_VECTORS = 50_000
+EXPORT_BATCH_SIZE = 1000
+
+INDEX_FILENAME = "index.faiss"
+VECTORS_FILENAME = "vectors.npy"
+DOCUMENTS_FILENAME = "documents.jsonl"
+OFFSETS_FILENAME = "offsets.npy"
+META_FILENAME = "meta.json"
+
+
+def ids_digest(ids):
+    """Huella del conjunto de chunks de la colección"""
+    return hashlib.sha256("\0".join(sorted(ids)).encode("utf-8")).hexdigest()
+
+
+def resolve_index_type(index_type, count, quantization="none"):
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Tipo de índice FAISS desconocido: {index_type}")
+    if index_type == "auto":
+        # Cuantizar solo ahorra memoria si el índice se comparte con mmap (ivf)
+        if quantization != "none":
+            return "ivf"
+        return "flat" if count <= AUTO_FLAT_MAX_VECTORS else "ivf"
+    return index_type
+
+
+def ivf_list_count(count):
+    """Número de listas de IVF: ~4·√n, con al menos 39 vectores de entrenamiento por lista"""
+    return max(1, min(int(4 * math.sqrt(count)), count // 39))
+
+
+def index_description(index_type, dimension, count, hnsw_m=32, quantization="none", pca_dim=128):
+    """
+    Descripción del índice para faiss.index_factory, por ejemplo "IVF512,SQ8"
+    o "PCA128,HNSW32".
+    """
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Cuantización desconocida: {quantization}")
+    prefix = ""
+    if quantization == "pca" and pca_dim < dimension:
+        prefix = f"PCA{pca_dim},"
+    codes = {"fp16": "SQfp16", "int8": "SQ8"}.get(quantization, "Flat")
+
+    if index_type == "flat":
+        return prefix + codes
+    if index_type == "ivf":
+        return f"{prefix}IVF{ivf_list_count(count)},{codes}"
+    if index_type == "hnsw":
+        return f"{prefix}HNSW{hnsw_m}" + ("" if codes == "Flat" else f"_{codes}")
+    raise ValueError(f"Tipo de índice FAISS desconocido: {index_type}")
+
+
+def create_index(index_type, dimension, count, hnsw_m=32, quantization="none", pca_dim=128):
+    import faiss
+
+    description = index_description(index_type, dimension, count, hnsw_m, quantization, pca_dim)
+    index = faiss.index_factory(dimension, description)
+    if index_type == "hnsw":
+        graph = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexPreTransform) else index
+        graph.hnsw.efConstruction = 80
+    return index
+
+
+def _atomic_path(path):
+    return f"{path}.tmp-{os.getpid()}"
+
+
+def _save_array(path, array):
+    """Guarda un .npy sin pisar el archivo que otros workers tienen abierto con mmap"""
+    with open(_atomic_path(path), "wb") as f:
+        np.save(f, array)
+    os.replace(_atomic_path(path), path)
+
+
+def export_collection(collection, directory, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Copia vectores, textos y metadatos de la colección de Chroma a `directory`
+    por páginas, sin cargar la colección completa en memoria. Devuelve
+    (cantidad de vectores, dimensión).
+    """
+    count = collection.count()
+    vectors = None
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    vectors_path = os.path.join(directory, VECTORS_FILENAME)
+    documents_path = os.path.join(directory, DOCUMENTS_FILENAME)
+
+    position = 0
+    with open(_atomic_path(documents_path), "wb") as documents:
+        for offset in range(0, count, batch_size):
+            page = collection.get(
+                limit=batch_size,
+                offset=offset,
+                include=["embeddings", "documents", "metadatas"],
+            )
+            page_vectors = np.asarray(page["embeddings"], dtype=np.float32)
+            if vectors is None:
+                vectors = np.lib.format.open_memmap(
+                    _atomic_path(vectors_path), mode="w+", dtype=np.float32,
+                    shape=(count, page_vectors.shape[1]),
+                )
+            vectors[position:position + len(page_vectors)] = page_vectors
+            for text, metadata in zip(page["documents"], page["metadatas"]):
+                line = json.dumps({"page_content": text, "metadata": metadata or {}}, ensure_ascii=False)
+                documents.write(line.encode("utf-8") + b"\n")
+                position += 1
+                offsets[position] = documents.tell()
+
+    if vectors is None:
+        return 0, 0
+    dimension = vectors.shape[1]
+    vectors.flush()
+    del vectors
+    os.replace(_atomic_path(vectors_path), vectors_path)
+    os.replace(_atomic_path(documents_path), documents_path)
+    _save_array(os.path.join(directory, OFFSETS_FILENAME), offsets)
+    return count, dimension
+
+
+def build_index(directory, index_type, hnsw_m=32, quantization="none", pca_dim=128,
+                train_size=100_000, batch_size=10_000):
+    """Construye el índice a partir de vectors.npy y lo guarda en index.faiss"""
+    import faiss
+
+    vectors = np.load(os.path.join(directory, VECTORS_FILENAME), mmap_mode="r")
+    count, dimension = vectors.shape
+    index = create_index(index_type, dimension, count, hnsw_m, quantization, pca_dim)
+    if not index.is_trained:
+        # Muestra uniforme del corpus para entrenar los centroides
+        step = max(1, count // train_size)
+        index.train(np.ascontiguousarray(vectors[::step][:train_size]))
+    for start in range(0, count, batch_size):
+        index.add(np.ascontiguousarray(vectors[start:start + batch_size]))
+
+    index_path = os.path.join(directory, INDEX_FILENAME)
+    faiss.write_index(index, _atomic_path(index_path))
+    os.replace(_atomic_path(index_path), index_path)
+    return index
+
+
+class FaissVectorStore:
+    """
+    Base vectorial de solo lectura sobre un índice FAISS abierto con mmap.
+
+    Ofrece las mismas búsquedas que usa la aplicación con Chroma
+    (similarity_search y similarity_search_by_vector) y devuelve Documents
+    con el mismo texto y metadatos.
+
+    Si el índice guarda los vectores cuantizados (fp16, int8 o reducidos con
+    PCA), se piden k * rerank candidatos y se reordenan por la distancia exacta
+    con los vectores float32 de vectors.npy, también abierto con mmap: solo se
+    leen del disco las filas de los candidatos.
+    """
+
+    def __init__(self, directory, embeddings, nprobe=8, ef_search=64, rerank=4):
+        import faiss
+
+        self.directory = directory
+        self.embeddings = embeddings
+        with open(os.path.join(directory, META_FILENAME), encoding="utf-8") as f:
+            self.meta = json.load(f)
+
+        index_path = os.path.join(directory, INDEX_FILENAME)
+        try:
+            self.index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP)
+        except RuntimeError:
+            # Versiones de FAISS sin mmap para este tipo de índice
+            logger.warning("El índice %s no admite mmap; se carga en memoria", index_path)
+            self.index = faiss.read_index(index_path)
+        if self.meta.get("index_type") != "ivf":
+            # FAISS solo aplica IO_FLAG_MMAP a las listas invertidas de IVF
+            logger.info(
+                "El índice %s (%s) se carga en la memoria de cada proceso; "
+                "solo ivf se comparte entre procesos con mmap",
+                index_path, self.meta.get("index_type"),
+            )
+        self._configure_search(nprobe, ef_search)
+
+        self.rerank = rerank
+        self._vectors = None
+        if rerank > 1 and self.meta.get("quantization", "none") != "none":
+            self._vectors = np.load(os.path.join(directory, VECTORS_FILENAME), mmap_mode="r")
+
+        self._offsets = np.load(os.path.join(directory, OFFSETS_FILENAME), mmap_mode="r")
+        self._documents_file = open(os.path.join(directory, DOCUMENTS_FILENAME), "rb")
+        if self._offsets[-1] > 0:
+            self._documents = mmap.mmap(self._documents_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._documents = b""
+
+    def _configure_search(self, nprobe, ef_search):
+        import faiss
+
+        # ParameterSpace llega al índice interno aunque esté envuelto en un PCA
+        parameters = faiss.ParameterSpace()
+        if self.meta["index_type"] == "ivf":
+            parameters.set_index_parameter(self.index, "nprobe", nprobe)
+        elif self.meta["index_type"] == "hnsw":
+            parameters.set_index_parameter(self.index, "efSearch", ef_search)
+
+    def __len__(self):
+        return self.index.ntotal
+
+    def document(self, position):
+        from langchain.schema import Document
+
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        data = json.loads(self._documents[start:end])
+        return Document(page_content=data["page_content"], metadata=data["metadata"])
+
+    def search_positions(self, embedding, k):
+        """Posiciones y distancias L2 de los k vecinos más cercanos"""
+        query = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+        candidates = k * self.rerank if self._vectors is not None else k
+        distances, positions = self.index.search(query, candidates)
+        found = [(int(p), float(d)) for p, d in zip(positions[0], distances[0]) if p >= 0]
+        if self._vectors is None:
+            return found
+
+        # Reordenar con los vectores originales; las filas se leen en orden de disco
+        rows = sorted(p for p, _ in found)
+        exact = ((self._vectors[rows] - query) ** 2).sum(axis=1)
+        return sorted(zip(rows, exact.tolist()), key=lambda item: item[1])[:k]
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, **kwargs):
+        return [(self.document(p), distance) for p, distance in self.search_positions(embedding, k)]
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_with_score_by_vector(self.embeddings.embed_query(query), k)
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return self.similarity_search_by_vector(self.embeddings.embed_query(query), k)
+
+    def close(self):
+        if isinstance(self._documents, mmap.mmap):
+            self._documents.close()
+        self._documents_file.close()
+
+    @classmethod
+    def from_chroma(cls, db, directory, index_type="auto", hnsw_m=32, quantization="none", pca_dim=128,
+                    nprobe=8, ef_search=64, rerank=4, rebuild=False):
+        """
+        Abre el índice FAISS de la colección, exportándola y reconstruyendo el
+        índice si la colección o la configuración pedida cambiaron desde la última vez.
+        """
+        collection = db._collection
+        ids = collection.get(include=[])["ids"]
+        config = {
+            "version": INDEX_VERSION,
+            "index_type": resolve_index_type(index_type, len(ids), quantization),
+            "hnsw_m": hnsw_m,
+            "quantization": quantization,
+            "pca_dim": pca_dim if quantization == "pca" else None,
+            "ids_digest": ids_digest(ids),
+        }
+
+        meta_path = os.path.join(directory, META_FILENAME)
+        meta = None
+        if not rebuild and os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        if meta is None or any(meta.get(key) != value for key, value in config.items()):
+            logger.info("Construyendo índice FAISS %s (%s) con %d vectores",
+                        config["index_type"], quantization, len(ids))
+            os.makedirs(directory, exist_ok=True)
+            count, dimension = export_collection(collection, directory)
+            if count:
+                build_index(directory, config["index_type"], hnsw_m, quantization, pca_dim)
+            meta = dict(config, count=count, dimension=dimension)
+            # meta.json se escribe al final: marca el índice como completo
+            with open(_atomic_path(meta_path), "w", encoding="utf-8") as f:
+                json.dump(meta, f, indent=2)
+            os.replace(_atomic_path(meta_path), meta_path)
+
+        if not meta["count"]:
+            raise ValueError("La colección está vacía; no hay vectores para el índice FAISS")
+        return cls(directory, db.embeddings, nprobe=nprobe, ef_search=ef_search, rerank=rerank)
+
+
+def create_faiss_store(db, persist_directory):
+    """Índice FAISS de la colección con la configuración del entorno"""
+    return FaissVectorStore.from_chroma(
+        db,
+        directory=os.path.join(persist_directory, "faiss"),
+        index_type=os.environ.get("MEDICHAT_FAISS_INDEX", "auto"),
+        hnsw_m=int(os.environ.get("MEDICHAT_FAISS_HNSW_M", "32")),
+        quantization=os.environ.get("MEDICHAT_FAISS_QUANTIZATION", "none"),
+        pca_dim=int(os.environ.get("MEDICHAT_FAISS_PCA_DIM", "128")),
+        rerank=int(os.environ.get("MEDICHAT_FAISS_RERANK", "4")),
+        nprobe=int(os.environ.get("MEDICHAT_FAISS_NPROBE", "8")),
+        ef_search=int(os.environ.get("MEDICHAT_FAISS_EF_SEARCH", "64")),
+    )
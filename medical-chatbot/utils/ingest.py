@@ -0,0 +1,364 @@
+"""
+Ingesta incremental de la base de conocimiento médico en Chroma.
+
+Cada chunk se guarda con un id derivado del hash de su contenido, y un
+manifiesto (chroma_db/ingest_manifest.json) registra el hash de cada archivo y
+los ids de sus chunks. Así solo se embeben los chunks nuevos o modificados, se
+eliminan los de archivos borrados y se reparan los que falten en un índice
+incompleto.
+
+Uso:
+    python -m utils.ingest            # sincronizar cambios
+    python -m utils.ingest --verify   # además comprobar que no falte ningún chunk
+    python -m utils.ingest --rebuild  # reconstruir el índice desde cero
+"""
+import argparse
+import hashlib
+import json
+import os
+
+from utils.embedding_pipeline import EmbeddingPipeline
+
+KNOWLEDGE_DIRECTORY = "data/medical_knowledge"
+PERSIST_DIRECTORY = "chroma_db"
+MANIFEST_FILENAME = "ingest_manifest.json"
+MANIFEST_VERSION = 1
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+READ_BLOCK_SIZE = 4 * 1024 * 1024
+
+
+# Funciones a las que se avisa con los ids de los chunks eliminados tras una sincronización
+_change_listeners = []
+
+
+def add_change_listener(listener):
+    """Registra una función listener(ids_eliminados) para invalidar cachés derivadas"""
+    _change_listeners.append(listener)
+
+
+def document_chunk_id(document, knowledge_directory=KNOWLEDGE_DIRECTORY):
+    """Id de contenido de un documento recuperado de la base vectorial"""
+    source = os.path.relpath(document.metadata.get("source", ""), knowledge_directory)
+    return chunk_ids(source, [document.page_content])[0]
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_ids(source, texts):
+    """Ids estables por contenido; los chunks repetidos dentro de un archivo llevan sufijo"""
+    ids = []
+    seen = {}
+    for text in texts:
+        base = hashlib.sha256(f"{source}\0{text}".encode("utf-8")).hexdigest()[:40]
+        count = seen.get(base, 0)
+        seen[base] = count + 1
+        ids.append(base if count == 0 else f"{base}-{count}")
+    return ids
+
+
+def list_knowledge_files(knowledge_directory=KNOWLEDGE_DIRECTORY):
+    """Devuelve las rutas relativas de los .txt de la base de conocimiento, ordenadas"""
+    files = []
+    for root, _, names in os.walk(knowledge_directory):
+        for name in names:
+            if name.endswith(".txt"):
+                path = os.path.join(root, name)
+                files.append(os.path.relpath(path, knowledge_directory))
+    return sorted(files)
+
+
+def iter_file_chunks(path, name):
+    """
+    Lee un archivo de forma perezosa y devuelve (id, texto, metadatos) por chunk.
+
+    Los archivos grandes se procesan por bloques cortados en un salto de párrafo,
+    así nunca se carga el archivo completo en memoria; los menores que un bloque
+    se dividen igual que con TextLoader + CharacterTextSplitter.
+    """
+    # Importación diferida: langchain solo se carga al indexar
+    from langchain.text_splitter import CharacterTextSplitter
+
+    text_splitter = CharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP
+    )
+    metadata = {"source": path}
+    seen = {}
+
+    def split(text):
+        for document in text_splitter.create_documents([text], metadatas=[metadata]):
+            base = chunk_ids(name, [document.page_content])[0]
+            count = seen.get(base, 0)
+            seen[base] = count + 1
+            chunk_id = base if count == 0 else f"{base}-{count}"
+            yield chunk_id, document.page_content, document.metadata
+
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = f.read(READ_BLOCK_SIZE)
+        while True:
+            more = f.read(READ_BLOCK_SIZE)
+            if not more:
+                if buffer.strip():
+                    yield from split(buffer)
+                return
+            # Cortar en el último párrafo completo del bloque anterior
+            cut = buffer.rfind("\n\n")
+            buffer += more
+            if cut > 0:
+                yield from split(buffer[:cut])
+                buffer = buffer[cut + 2:]
+
+
+def manifest_path(persist_directory=PERSIST_DIRECTORY):
+    return os.path.join(persist_directory, MANIFEST_FILENAME)
+
+
+def load_manifest(persist_directory=PERSIST_DIRECTORY):
+    try:
+        with open(manifest_path(persist_directory), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(manifest, persist_directory=PERSIST_DIRECTORY):
+    """Escribe el manifiesto de forma atómica para no dejarlo a medias"""
+    os.makedirs(persist_directory, exist_ok=True)
+    path = manifest_path(persist_directory)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _empty_manifest(embedding_model):
+    return {
+        "version": MANIFEST_VERSION,
+        "embedding_model": embedding_model,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "files": {},
+    }
+
+
+def _manifest_is_compatible(manifest, embedding_model):
+    return (
+        manifest is not None
+        and manifest.get("embedding_model") == embedding_model
+        and manifest.get("chunk_size") == CHUNK_SIZE
+        and manifest.get("chunk_overlap") == CHUNK_OVERLAP
+    )
+
+
+def _index_is_readable(collection):
+    """
+    Comprueba que el índice HNSW responde. Un índice a medio escribir (archivos
+    truncados en chroma_db/) falla al consultar aunque sqlite siga intacto.
+    """
+    try:
+        if collection.count() == 0:
+            return True
+        sample = collection.get(limit=1, include=["embeddings"])
+        collection.query(query_embeddings=sample["embeddings"], n_results=1, include=[])
+        return True
+    except Exception:
+        return False
+
+
+def _upsert_batch(collection):
+    def write_batch(ids, texts, metadatas, vectors):
+        collection.upsert(ids=ids, embeddings=vectors, documents=texts, metadatas=metadatas)
+    return write_batch
+
+
+def sync_knowledge_base(db, knowledge_directory=KNOWLEDGE_DIRECTORY,
+                        persist_directory=PERSIST_DIRECTORY, embedding_model="",
+                        verify=False, rebuild=False, pipeline=None, check_index=True):
+    """
+    Sincroniza la colección de Chroma con los archivos de la base de conocimiento.
+
+    Devuelve un diccionario con los chunks embebidos ("added", incluye los
+    reparados), los que faltaban en el índice ("repaired"), los eliminados y los
+    reutilizados (vectores ya existentes que no hubo que volver a embeber).
+    Los chunks nuevos se embeben con `pipeline` (por defecto, lotes de 64 en el
+    proceso actual con el modelo de la base vectorial).
+
+    check_index=False omite la consulta de prueba al índice HNSW de Chroma,
+    que lo carga completo en la memoria del proceso; se usa cuando las
+    búsquedas las responde el índice FAISS compartido.
+    """
+    stats = {"added": 0, "removed": 0, "repaired": 0, "reused": 0, "rebuilt": False, "pipeline": None}
+    collection = db._collection
+
+    manifest = None if rebuild else load_manifest(persist_directory)
+    if manifest is not None and not _manifest_is_compatible(manifest, embedding_model):
+        # Cambió el modelo de embeddings o la división en chunks: los vectores no sirven
+        rebuild = True
+        manifest = None
+
+    if rebuild or (check_index and not _index_is_readable(collection)):
+        # El índice no se puede consultar: descartar la colección y volver a crearla
+        db.delete_collection()
+        db._collection = db._client.get_or_create_collection(
+            name=collection.name,
+            embedding_function=None,
+            metadata=collection.metadata,
+        )
+        collection = db._collection
+        manifest = None
+        stats["rebuilt"] = True
+
+    files = list_knowledge_files(knowledge_directory)
+    hashes = {name: file_sha256(os.path.join(knowledge_directory, name)) for name in files}
+    old_files = manifest["files"] if manifest else {}
+    expected_total = sum(len(old_files[name]["chunks"]) for name in files if name in old_files)
+
+    # Camino rápido: nada cambió y la colección tiene exactamente los chunks esperados
+    if (manifest and not verify
+            and all(old_files.get(name, {}).get("sha256") == digest for name, digest in hashes.items())
+            and set(old_files) == set(hashes)
+            and collection.count() == expected_total):
+        return stats
+
+    present_ids = set(collection.get(include=[])["ids"])
+    new_manifest = _empty_manifest(embedding_model)
+    files_to_read = []
+
+    # Primera pasada: ids esperados de cada archivo (solo se dividen los que cambiaron)
+    for name in files:
+        path = os.path.join(knowledge_directory, name)
+        previous = old_files.get(name)
+        if previous and previous["sha256"] == hashes[name]:
+            ids = previous["chunks"]
+            missing = sum(1 for chunk_id in ids if chunk_id not in present_ids)
+            # Índice incompleto: habrá que volver a leer este archivo para recuperar los textos
+            stats["repaired"] += missing
+        else:
+            ids = [chunk_id for chunk_id, _, _ in iter_file_chunks(path, name)]
+            missing = sum(1 for chunk_id in ids if chunk_id not in present_ids)
+        if missing:
+            files_to_read.append(name)
+        new_manifest["files"][name] = {"sha256": hashes[name], "chunks": ids}
+
+    expected_ids = {chunk_id for entry in new_manifest["files"].values() for chunk_id in entry["chunks"]}
+    stale_ids = [chunk_id for chunk_id in present_ids if chunk_id not in expected_ids]
+
+    # Reutilizar los vectores de chunks con el mismo contenido guardados con otro id
+    # (por ejemplo, índices creados antes de existir el manifiesto)
+    by_content = {}
+    if files_to_read and stale_ids:
+        stale = collection.get(ids=stale_ids, include=["documents", "metadatas", "embeddings"])
+        for document, metadata, embedding in zip(stale["documents"], stale["metadatas"], stale["embeddings"]):
+            source = os.path.relpath((metadata or {}).get("source", ""), knowledge_directory)
+            by_content[chunk_ids(source, [document])[0]] = embedding
+
+    def pending_chunks():
+        """Segunda pasada perezosa: solo los chunks que faltan en la colección"""
+        reused = []
+        for name in files_to_read:
+            path = os.path.join(knowledge_directory, name)
+            for chunk_id, text, metadata in iter_file_chunks(path, name):
+                if chunk_id in present_ids:
+                    continue
+                embedding = by_content.get(chunk_id.split("-")[0])
+                if embedding is None:
+                    yield chunk_id, text, metadata
+                    continue
+                reused.append((chunk_id, text, metadata, embedding))
+                if len(reused) >= 256:
+                    _write_reused(collection, reused)
+                    stats["reused"] += len(reused)
+                    reused = []
+        if reused:
+            _write_reused(collection, reused)
+            stats["reused"] += len(reused)
+
+    if files_to_read:
+        if pipeline is None:
+            pipeline = EmbeddingPipeline(embeddings=db.embeddings)
+        result = pipeline.run(pending_chunks(), _upsert_batch(collection))
+        stats["added"] = result.chunks
+        stats["pipeline"] = result
+
+    if stale_ids:
+        db.delete(ids=stale_ids)
+        stats["removed"] = len(stale_ids)
+        for listener in _change_listeners:
+            listener(stale_ids)
+
+    save_manifest(new_manifest, persist_directory)
+    return stats
+
+
+def _write_reused(collection, reused):
+    ids, texts, metadatas, vectors = zip(*reused)
+    _upsert_batch(collection)(list(ids), list(texts), list(metadatas), list(vectors))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingesta incremental de la base de conocimiento médico")
+    parser.add_argument("--knowledge-dir", default=KNOWLEDGE_DIRECTORY)
+    parser.add_argument("--persist-dir", default=PERSIST_DIRECTORY)
+    parser.add_argument("--verify", action="store_true",
+                        help="comprobar que todos los chunks del manifiesto estén en el índice")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="descartar el índice y volver a embeber todo")
+    parser.add_argument("--batch-size", type=int, default=64,
+                        help="chunks por lote de embeddings y por upsert en Chroma")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="procesos que embeben en paralelo (cada uno carga su propio modelo)")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="hilos intra-op de torch por proceso")
+    args = parser.parse_args()
+
+    from langchain.vectorstores import Chroma
+    from utils.vector_store import EMBEDDING_MODEL_NAME, get_embeddings
+
+    # Con varios procesos el modelo se carga en cada uno; aquí solo hace falta para consultar
+    embeddings = get_embeddings() if args.workers <= 1 else None
+    db = Chroma(persist_directory=args.persist_dir, embedding_function=embeddings)
+    pipeline = EmbeddingPipeline(
+        embeddings=embeddings,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        threads=args.threads,
+    )
+    stats = sync_knowledge_base(
+        db,
+        knowledge_directory=args.knowledge_dir,
+        persist_directory=args.persist_dir,
+        embedding_model=EMBEDDING_MODEL_NAME,
+        verify=args.verify,
+        rebuild=args.rebuild,
+        pipeline=pipeline,
+    )
+    print(
+        f"Agregados: {stats['added']}, reparados: {stats['repaired']}, "
+        f"reutilizados: {stats['reused']}, eliminados: {stats['removed']}"
+        + (", índice reconstruido" if stats["rebuilt"] else "")
+    )
+    result = stats["pipeline"]
+    if result and result.chunks:
+        summary = (
+            f"{result.chunks} chunks en {result.seconds:.1f} s "
+            f"({result.docs_per_second:.1f} docs/s, {result.batches} lotes)"
+        )
+        if result.peak_rss_mb is not None:
+            summary += f", RSS máximo: {result.peak_rss_mb:.0f} MB"
+        if result.peak_worker_rss_mb is not None:
+            summary += f", RSS máximo de un worker: {result.peak_worker_rss_mb:.0f} MB"
+        print(summary)
+
+
+if __name__ == "__main__":
+    main()
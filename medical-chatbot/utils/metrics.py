@@ -0,0 +1,223 @@
+"""
+Métricas internas del chatbot en formato de texto de Prometheus.
+
+Los tiempos de cada etapa se registran con spans:
+
+    with metrics.span("stage_seconds", stage="retrieval"):
+        ...
+
+y se agregan en resúmenes con los percentiles p50/p95/p99 de las últimas
+observaciones. También hay contadores (llamadas al LLM, aciertos de caché),
+gauges (sesiones activas) y colectores que leen las estadísticas de los
+componentes al momento de exportar. Con MEDICHAT_METRICS=0 todas las
+operaciones vuelven de inmediato y el span es un objeto vacío compartido.
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+
+PREFIX = "medichat_"
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(label_key, extra=()):
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value):
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, float) and math.isnan(value):
+        return "NaN"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """Mide el tiempo de un bloque y lo registra al salir"""
+
+    __slots__ = ("_metrics", "_name", "_labels", "_start")
+
+    def __init__(self, metrics, name, labels):
+        self._metrics = metrics
+        self._name = name
+        self._labels = labels
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._metrics.observe(self._name, time.perf_counter() - self._start, **self._labels)
+        return False
+
+
+class Metrics:
+    """
+    Registro de métricas del proceso.
+
+    Los resúmenes guardan las últimas `window` observaciones de cada serie para
+    calcular los percentiles, además de la suma y el total acumulados.
+    """
+
+    def __init__(self, enabled=True, window=2048):
+        self.enabled = enabled
+        self.window = window
+        self._counters = {}  # nombre -> {etiquetas: valor}
+        self._gauges = {}
+        self._summaries = {}  # nombre -> {etiquetas: [observaciones, suma, total]}
+        self._collectors = {}  # prefijo -> función que devuelve un dict de valores
+        self._lock = threading.Lock()
+
+    def span(self, name, **labels):
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, labels)
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self._summaries.setdefault(name, {})
+            entry = series.get(key)
+            if entry is None:
+                entry = series[key] = [deque(maxlen=self.window), 0.0, 0]
+            entry[0].append(value)
+            entry[1] += value
+            entry[2] += 1
+
+    def increment(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def set_gauge(self, name, value, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def add_gauge(self, name, amount, **labels):
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self._gauges.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def add_collector(self, prefix, collect):
+        """
+        Registra una función que devuelve un dict de estadísticas (por ejemplo
+        cache.stats); sus valores numéricos se exportan como gauges `prefix_clave`.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._collectors[prefix] = collect
+
+    def percentiles(self, name, **labels):
+        """Percentiles p50/p95/p99 de la serie, o None si no tiene observaciones"""
+        with self._lock:
+            entry = self._summaries.get(name, {}).get(_label_key(labels))
+            values = sorted(entry[0]) if entry else []
+        if not values:
+            return None
+        return {q: self._quantile(values, q) for q in QUANTILES}
+
+    def render(self):
+        """Exporta todas las métricas en el formato de texto de Prometheus"""
+        lines = []
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            gauges = {name: dict(series) for name, series in self._gauges.items()}
+            summaries = {
+                name: {key: (sorted(entry[0]), entry[1], entry[2]) for key, entry in series.items()}
+                for name, series in self._summaries.items()
+            }
+            collectors = list(self._collectors.items())
+
+        for prefix, collect in collectors:
+            try:
+                stats = collect()
+            except Exception:
+                continue
+            for key, value in stats.items():
+                if isinstance(value, (int, float)):
+                    gauges.setdefault(f"{prefix}_{key}", {})[()] = value
+
+        for name in sorted(counters):
+            lines.append(f"# TYPE {PREFIX}{name} counter")
+            for key, value in sorted(counters[name].items()):
+                lines.append(f"{PREFIX}{name}{_format_labels(key)} {_format_value(value)}")
+
+        for name in sorted(gauges):
+            lines.append(f"# TYPE {PREFIX}{name} gauge")
+            for key, value in sorted(gauges[name].items()):
+                lines.append(f"{PREFIX}{name}{_format_labels(key)} {_format_value(value)}")
+
+        for name in sorted(summaries):
+            lines.append(f"# TYPE {PREFIX}{name} summary")
+            for key, (values, total, count) in sorted(summaries[name].items()):
+                for q in QUANTILES:
+                    value = self._quantile(values, q) if values else float("nan")
+                    lines.append(f"{PREFIX}{name}{_format_labels(key, [('quantile', q)])} {_format_value(value)}")
+                lines.append(f"{PREFIX}{name}_sum{_format_labels(key)} {_format_value(float(total))}")
+                lines.append(f"{PREFIX}{name}_count{_format_labels(key)} {count}")
+
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._summaries.clear()
+            self._collectors.clear()
+
+    @staticmethod
+    def _quantile(sorted_values, q):
+        # Método del rango más cercano
+        index = max(0, math.ceil(q * len(sorted_values)) - 1)
+        return sorted_values[index]
+
+
+metrics = Metrics(enabled=os.environ.get("MEDICHAT_METRICS", "1") != "0")
+
+
+def mount_metrics_route(app, path="/metrics"):
+    """Publica las métricas en la aplicación FastAPI de Chainlit"""
+    from fastapi.responses import PlainTextResponse
+
+    from utils.routes import add_priority_route
+
+    async def metrics_endpoint():
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+    add_priority_route(app, path, metrics_endpoint)
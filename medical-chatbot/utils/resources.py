@@ -0,0 +1,241 @@
+import threading
+
+from utils.metrics import metrics
+
+
+class ResourceRegistry:
+    """
+    Registro de recursos pesados compartidos por todo el proceso.
+
+    Cada recurso se construye una sola vez (de forma perezosa o en el arranque)
+    y todas las sesiones de chat reciben el mismo objeto.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._resources = {}
+        self._locks = {}
+        self._registry_lock = threading.Lock()
+
+    def register(self, name, factory):
+        """Registra (o reemplaza) la función que construye un recurso"""
+        with self._registry_lock:
+            self._factories[name] = factory
+            self._resources.pop(name, None)
+            self._locks.setdefault(name, threading.Lock())
+
+    def override(self, name, value):
+        """Fija un recurso ya construido (útil para benchmarks y desarrollo)"""
+        with self._registry_lock:
+            self._factories[name] = lambda: value
+            self._locks.setdefault(name, threading.Lock())
+            self._resources[name] = value
+
+    def get(self, name):
+        """Devuelve el recurso, construyéndolo la primera vez que se pide"""
+        try:
+            return self._resources[name]
+        except KeyError:
+            pass
+
+        with self._registry_lock:
+            if name not in self._factories:
+                raise KeyError(f"Recurso no registrado: {name}")
+            lock = self._locks[name]
+
+        # Un lock por recurso: cargar el LLM no bloquea a quien pide los especialistas
+        with lock:
+            if name not in self._resources:
+                self._resources[name] = self._factories[name]()
+            return self._resources[name]
+
+    def is_loaded(self, name):
+        return name in self._resources
+
+    def preload(self, names=None):
+        """Carga los recursos indicados (o todos) de forma síncrona"""
+        for name in names or list(self._factories):
+            self.get(name)
+
+    def preload_in_background(self, names=None):
+        """Carga los recursos en un hilo aparte para no retrasar el arranque del servidor"""
+        thread = threading.Thread(
+            target=self.preload,
+            args=(names,),
+            name="medichat-preload",
+            daemon=True,
+        )
+        thread.start()
+        return thread
+
+    def clear(self):
+        """Descarta los recursos construidos; se volverán a crear al pedirlos"""
+        with self._registry_lock:
+            self._resources.clear()
+
+
+def _load_embeddings():
+    from utils.vector_store import get_embeddings
+    embeddings = get_embeddings()
+    if hasattr(embeddings, "stats"):
+        metrics.add_collector("remote_embeddings", embeddings.stats)
+    return embeddings
+
+
+def _load_query_embeddings():
+    from utils.embedding_cache import create_query_embeddings
+    from utils.vector_store import EMBEDDING_MODEL_NAME
+    embeddings = create_query_embeddings(registry.get("embeddings"), model_name=EMBEDDING_MODEL_NAME)
+    if hasattr(embeddings, "stats"):
+        metrics.add_collector("query_embedding_cache", embeddings.stats)
+    return embeddings
+
+
+def _load_vector_store():
+    from utils.vector_store import get_vector_store
+    # Las consultas pasan por la caché de embeddings; los documentos van directo al modelo
+    return get_vector_store(embeddings=registry.get("query_embeddings"))
+
+
+def _load_retrieval_executor():
+    from utils.executor import create_retrieval_executor
+    executor = create_retrieval_executor()
+    metrics.add_collector("retrieval_executor", lambda: {"pending": executor.pending})
+    return executor
+
+
+def _load_async_vector_store():
+    from utils.vector_store import AsyncVectorStore
+    return AsyncVectorStore(registry.get("vector_store"), registry.get("retrieval_executor"))
+
+
+def _load_answer_cache():
+    from utils.ingest import add_change_listener
+    from utils.semantic_cache import create_answer_cache
+    cache = create_answer_cache()
+    if cache is not None:
+        # Invalidar las respuestas cuyos chunks desaparezcan de la base de conocimiento
+        add_change_listener(cache.invalidate_chunks)
+        metrics.add_collector("answer_cache", cache.stats)
+    return cache
+
+
+def _load_llm():
+    from models.batching import create_batching_llm
+    from models.qa_model import get_medical_qa_model
+    from models.resilience import create_resilient_llm
+    model = get_medical_qa_model()
+    if hasattr(model, "worker"):
+        metrics.add_collector("local_llm", model.worker.stats)
+    llm = create_batching_llm(model)
+    if hasattr(llm, "batcher"):
+        metrics.add_collector("llm_batcher", llm.batcher.stats)
+    # Plazo, cobertura y circuit breaker por cada llamada de una sesión
+    llm = create_resilient_llm(llm)
+    if hasattr(llm, "policy"):
+        metrics.add_collector("llm_resilience", llm.policy.stats)
+    return llm
+
+
+def _load_chains():
+    from agent.prompts import build_chains
+    return build_chains(registry.get("llm"))
+
+
+def _load_symptom_extractor():
+    from agent.symptom_extractor import create_symptom_extractor
+    extractor = create_symptom_extractor()
+    if extractor is not None:
+        metrics.add_collector("symptom_extractor", extractor.stats)
+    return extractor
+
+
+def _load_context_compressor():
+    from agent.context_compressor import create_context_compressor
+    compressor = create_context_compressor(registry.get("embeddings"))
+    if compressor is not None:
+        metrics.add_collector("context_compressor", compressor.stats)
+    return compressor
+
+
+def _load_scheduler():
+    from utils.scheduler import create_scheduler
+    scheduler = create_scheduler()
+    metrics.add_collector("scheduler", scheduler.stats)
+    return scheduler
+
+
+def _load_specialists_data():
+    from agent.recommender import load_specialists_data
+    return load_specialists_data()
+
+
+def _load_specialty_index():
+    from agent.recommender import build_specialty_index
+    index = build_specialty_index(registry.get("specialists_data"))
+    metrics.add_collector("specialty_index_cache", lambda: index.rank.cache_info()._asdict())
+    return index
+
+
+registry = ResourceRegistry()
+registry.register("embeddings", _load_embeddings)
+registry.register("query_embeddings", _load_query_embeddings)
+registry.register("vector_store", _load_vector_store)
+registry.register("retrieval_executor", _load_retrieval_executor)
+registry.register("async_vector_store", _load_async_vector_store)
+registry.register("answer_cache", _load_answer_cache)
+registry.register("llm", _load_llm)
+registry.register("chains", _load_chains)
+registry.register("symptom_extractor", _load_symptom_extractor)
+registry.register("context_compressor", _load_context_compressor)
+registry.register("scheduler", _load_scheduler)
+registry.register("specialists_data", _load_specialists_data)
+registry.register("specialty_index", _load_specialty_index)
+
+
+def get_shared_embeddings():
+    return registry.get("embeddings")
+
+
+def get_shared_query_embeddings():
+    return registry.get("query_embeddings")
+
+
+def get_shared_vector_store():
+    return registry.get("vector_store")
+
+
+def get_shared_retriever():
+    return registry.get("async_vector_store")
+
+
+def get_shared_answer_cache():
+    return registry.get("answer_cache")
+
+
+def get_shared_llm():
+    return registry.get("llm")
+
+
+def get_shared_chains():
+    return registry.get("chains")
+
+
+def get_shared_symptom_extractor():
+    return registry.get("symptom_extractor")
+
+
+def get_shared_context_compressor():
+    return registry.get("context_compressor")
+
+
+def get_shared_scheduler():
+    return registry.get("scheduler")
+
+
+def get_shared_specialists_data():
+    return registry.get("specialists_data")
+
+
+def get_shared_specialty_index():
+    return registry.get("specialty_index")
@@ -0,0 +1,9 @@
+def add_priority_route(app, path, endpoint):
+    """
+    Agrega una ruta GET a la aplicación FastAPI de Chainlit. La ruta se mueve al
+    principio porque Chainlit registra una ruta comodín que, si no, respondería
+    primero con la interfaz web.
+    """
+    app.add_api_route(path, endpoint, methods=["GET"], include_in_schema=False)
+    routes = app.router.routes
+    routes.insert(0, routes.pop())
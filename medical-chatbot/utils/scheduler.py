@@ -0,0 +1,200 @@
+"""
+Control de admisión y reparto justo del trabajo caro entre sesiones.
+
+Cada recurso (LLM, embeddings, base vectorial) tiene un límite de operaciones
+simultáneas. Las que no caben esperan en una cola ordenada por prioridad y,
+dentro de cada prioridad, por turnos entre sesiones: una sesión que encola
+muchas operaciones no adelanta a las demás. Si la cola está llena o la espera
+supera max_wait, la operación falla enseguida con SchedulerBusyError y el
+agente responde "ocupado" en lugar de esperar hasta un timeout.
+
+Los turnos basados en reglas (saludo, recomendaciones, despedida) no pasan
+por el planificador; entre las operaciones que sí pasan, la extracción de
+síntomas va antes que las respuestas abiertas, y la recuperación especulativa
+va al final.
+"""
+import asyncio
+import contextlib
+import itertools
+import os
+import time
+from collections import OrderedDict, deque
+
+from utils.metrics import metrics
+
+# Prioridades: menor número, antes se atiende
+PRIORITY_SYMPTOMS = 0
+PRIORITY_QA = 1
+PRIORITY_BACKGROUND = 2
+
+_session_ids = itertools.count(1)
+
+
+def new_session_id():
+    """Identificador de sesión para repartir los turnos del planificador"""
+    return next(_session_ids)
+
+
+class SchedulerBusyError(RuntimeError):
+    """Se lanza cuando un recurso está saturado y la operación no se admite"""
+
+
+class ResourceScheduler:
+    """
+    Limita las operaciones simultáneas sobre un recurso.
+
+    `slot(session, priority)` es un context manager asíncrono: entra cuando
+    hay lugar (o cuando llega el turno de la sesión) y libera el lugar al
+    salir. Se usa desde un solo event loop.
+    """
+
+    def __init__(self, name, max_concurrent, max_queue=64, max_wait=5.0):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.running = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._waiting = {}  # prioridad -> OrderedDict(sesión -> deque de futures)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, session=None, priority=PRIORITY_QA):
+        await self.acquire(session, priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, session=None, priority=PRIORITY_QA):
+        start = time.perf_counter()
+        if self.running < self.max_concurrent and not self.queued:
+            self.running += 1
+            self._admit(start)
+            return
+        if self.queued >= self.max_queue:
+            self._reject("queue_full")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(priority, OrderedDict()).setdefault(session, deque()).append(future)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(future, self.max_wait)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # El turno llegó justo cuando vencía la espera: devolverlo
+                self.release()
+            else:
+                self._remove(priority, session, future)
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject("timeout")
+            raise
+        self._admit(start)
+
+    def release(self):
+        self.running -= 1
+        while self.running < self.max_concurrent and self.queued:
+            future = self._pop_next()
+            if future.done():
+                # Espera cancelada o vencida que aún no salió de la cola
+                continue
+            self.running += 1
+            future.set_result(True)
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "max_concurrent": self.max_concurrent,
+        }
+
+    def _admit(self, start):
+        self.admitted += 1
+        metrics.observe("scheduler_queue_seconds", time.perf_counter() - start, resource=self.name)
+
+    def _reject(self, reason):
+        self.rejected += 1
+        metrics.increment("scheduler_rejected_total", resource=self.name, reason=reason)
+        raise SchedulerBusyError(f"Recurso {self.name} saturado ({reason})")
+
+    def _pop_next(self):
+        """Siguiente espera: la prioridad más alta y, dentro de ella, la sesión a la que le toca"""
+        priority = min(p for p, sessions in self._waiting.items() if sessions)
+        sessions = self._waiting[priority]
+        session, futures = next(iter(sessions.items()))
+        future = futures.popleft()
+        if futures:
+            # La sesión vuelve al final de la ronda
+            sessions.move_to_end(session)
+        else:
+            del sessions[session]
+        self.queued -= 1
+        return future
+
+    def _remove(self, priority, session, future):
+        futures = self._waiting.get(priority, {}).get(session)
+        if futures is None or future not in futures:
+            return
+        futures.remove(future)
+        self.queued -= 1
+        if not futures:
+            del self._waiting[priority][session]
+
+
+class Scheduler:
+    """Planificadores por recurso; sin límite configurado, slot() no espera"""
+
+    def __init__(self, limits=None, max_queue=64, max_wait=5.0):
+        self.resources = {
+            name: ResourceScheduler(name, limit, max_queue, max_wait)
+            for name, limit in (limits or {}).items()
+            if limit > 0
+        }
+
+    def slot(self, resource, session=None, priority=PRIORITY_QA):
+        scheduler = self.resources.get(resource)
+        if scheduler is None:
+            return contextlib.nullcontext()
+        return scheduler.slot(session, priority)
+
+    def stats(self):
+        result = {}
+        for name, scheduler in self.resources.items():
+            for key, value in scheduler.stats().items():
+                result[f"{name}_{key}"] = value
+        return result
+
+
+def default_llm_limit():
+    """
+    Límite de llamadas simultáneas al LLM cuando no se fija
+    MEDICHAT_MAX_CONCURRENT_LLM: al menos el tamaño de lote en uso, porque con
+    menos llamadas en vuelo los lotes nunca se llenan.
+    """
+    limit = 4
+    if float(os.environ.get("MEDICHAT_LLM_BATCH_WINDOW_MS", "0")) > 0:
+        limit = max(limit, int(os.environ.get("MEDICHAT_LLM_BATCH_SIZE", "8")))
+    if os.environ.get("MEDICHAT_LLM_BACKEND", "hub") == "local":
+        limit = max(limit, int(os.environ.get("MEDICHAT_LOCAL_BATCH_SIZE", "8")))
+    return limit
+
+
+def create_scheduler():
+    """
+    Planificador con los límites del entorno. MEDICHAT_SCHEDULER=0 lo
+    desactiva (ninguna operación espera), igual que un límite de 0.
+    """
+    if os.environ.get("MEDICHAT_SCHEDULER", "1") == "0":
+        return Scheduler()
+    return Scheduler(
+        limits={
+            "llm": int(os.environ.get("MEDICHAT_MAX_CONCURRENT_LLM", default_llm_limit())),
+            "embedding": int(os.environ.get("MEDICHAT_MAX_CONCURRENT_EMBEDDING", "2")),
+            "vector_store": int(os.environ.get("MEDICHAT_MAX_CONCURRENT_VECTOR_STORE", "4")),
+        },
+        max_queue=int(os.environ.get("MEDICHAT_SCHEDULER_MAX_QUEUE", "64")),
+        max_wait=float(os.environ.get("MEDICHAT_SCHEDULER_MAX_WAIT", "5")),
+    )
@@ -0,0 +1,128 @@
+import hashlib
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+CachedAnswer = namedtuple("CachedAnswer", ["vector", "fingerprint", "answer", "chunk_ids", "created"])
+
+
+def context_fingerprint(chunk_ids, session_state=()):
+    """
+    Huella del contexto del prompt: mismo conjunto de chunks y mismo estado de
+    la sesión (las condiciones identificadas), misma huella. Así una respuesta
+    escrita para un cuadro clínico no se sirve a una sesión con otro.
+    """
+    key = "\0".join(sorted(chunk_ids)) + "\1" + "\0".join(sorted(session_state))
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class SemanticAnswerCache:
+    """
+    Caché de respuestas por similitud semántica de la pregunta.
+
+    Una respuesta guardada se reutiliza si la nueva pregunta tiene similitud
+    coseno >= threshold con la original, se recuperó exactamente el mismo
+    contexto y la sesión tiene las mismas condiciones (misma huella). Las entradas caducan por antigüedad, se
+    descartan por LRU al superar max_entries y se invalidan individualmente
+    cuando alguno de sus chunks desaparece de la base de conocimiento.
+    """
+
+    def __init__(self, threshold=0.92, max_entries=512, ttl_seconds=3600):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # id -> CachedAnswer
+        self._by_fingerprint = {}  # huella -> ids de entradas con ese contexto
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def lookup(self, question_vector, fingerprint):
+        """Devuelve la respuesta guardada más parecida o None"""
+        vector = self._normalize(question_vector)
+        now = time.monotonic()
+        with self._lock:
+            best_id = None
+            best_score = self.threshold
+            for entry_id in list(self._by_fingerprint.get(fingerprint, ())):
+                entry = self._entries[entry_id]
+                if self.ttl_seconds and now - entry.created > self.ttl_seconds:
+                    self._remove(entry_id)
+                    continue
+                score = float(np.dot(vector, entry.vector))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+            if best_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id].answer
+
+    def store(self, question_vector, fingerprint, answer, chunk_ids=()):
+        entry = CachedAnswer(
+            vector=self._normalize(question_vector),
+            fingerprint=fingerprint,
+            answer=answer,
+            chunk_ids=frozenset(chunk_ids),
+            created=time.monotonic(),
+        )
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = entry
+            self._by_fingerprint.setdefault(fingerprint, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_chunks(self, chunk_ids):
+        """Descarta las respuestas construidas con alguno de los chunks indicados"""
+        chunk_ids = set(chunk_ids)
+        with self._lock:
+            stale = [entry_id for entry_id, entry in self._entries.items() if entry.chunk_ids & chunk_ids]
+            for entry_id in stale:
+                self._remove(entry_id)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_fingerprint.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        same_context = self._by_fingerprint.get(entry.fingerprint)
+        if same_context is not None:
+            same_context.discard(entry_id)
+            if not same_context:
+                del self._by_fingerprint[entry.fingerprint]
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+def create_answer_cache():
+    """Crea la caché de respuestas si está activada (MEDICHAT_ANSWER_CACHE=1)"""
+    if os.environ.get("MEDICHAT_ANSWER_CACHE", "0") != "1":
+        return None
+    return SemanticAnswerCache(
+        threshold=float(os.environ.get("MEDICHAT_ANSWER_CACHE_THRESHOLD", "0.92")),
+        max_entries=int(os.environ.get("MEDICHAT_ANSWER_CACHE_SIZE", "512")),
+        ttl_seconds=float(os.environ.get("MEDICHAT_ANSWER_CACHE_TTL", "3600")) or None,
+    )
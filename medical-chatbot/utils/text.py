@@ -0,0 +1,162 @@
+import unicodedata
+from collections import deque, namedtuple
+
+KeywordMatch = namedtuple("KeywordMatch", ["term", "value", "start", "end"])
+
+
+def fold_char(char):
+    """Pasa un carácter a minúsculas y le quita tildes y diéresis"""
+    decomposed = unicodedata.normalize("NFKD", char.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def normalize_text(text):
+    """Minúsculas, sin tildes y con espacios colapsados: 'Náusea  Fuerte' -> 'nausea fuerte'"""
+    return _normalize_with_offsets(text)[0].strip()
+
+
+def _normalize_with_offsets(text):
+    """
+    Normaliza el texto y devuelve, para cada carácter normalizado, la posición
+    del carácter original del que proviene.
+    """
+    chars = []
+    offsets = []
+    previous_space = False
+    for position, char in enumerate(text):
+        if char.isspace():
+            if previous_space:
+                continue
+            previous_space = True
+            chars.append(" ")
+            offsets.append(position)
+            continue
+        previous_space = False
+        for folded in fold_char(char):
+            chars.append(folded)
+            offsets.append(position)
+    return "".join(chars), offsets
+
+
+def _is_word_char(char):
+    return char.isalnum() or char == "_"
+
+
+class KeywordMatcher:
+    """
+    Buscador de múltiples términos en una sola pasada (autómata de Aho-Corasick).
+
+    Los términos y el texto se normalizan igual (minúsculas, sin tildes, espacios
+    colapsados) y solo se aceptan coincidencias de palabras completas, de modo
+    que "tos" no coincide dentro de "otros". Con allow_plurals=True también se
+    aceptan las terminaciones de plural "s"/"es" ("alergia" en "alergias").
+    """
+
+    def __init__(self, terms, allow_plurals=False):
+        # terms puede ser un dict {término: valor} o una lista de términos
+        if not isinstance(terms, dict):
+            terms = {term: term for term in terms}
+
+        self.allow_plurals = allow_plurals
+        self._terms = []
+        self._values = []
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+
+        for term, value in terms.items():
+            pattern = normalize_text(term)
+            if not pattern:
+                continue
+            self._add_pattern(pattern, len(self._terms))
+            self._terms.append(term)
+            self._values.append(value)
+
+        self._build_failure_links()
+
+    def __len__(self):
+        return len(self._terms)
+
+    def _add_pattern(self, pattern, pattern_id):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((len(pattern), pattern_id))
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                if self._fail[next_state] == next_state:
+                    self._fail[next_state] = 0
+                # Heredar las salidas del estado de fallo (sufijos que también son términos)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def _word_end(self, normalized, end):
+        """Devuelve el final de la palabra si la coincidencia termina en un límite válido"""
+        if end >= len(normalized) or not _is_word_char(normalized[end]):
+            return end
+        if self.allow_plurals:
+            for suffix in ("s", "es"):
+                plural_end = end + len(suffix)
+                if (normalized.startswith(suffix, end)
+                        and (plural_end >= len(normalized) or not _is_word_char(normalized[plural_end]))):
+                    return plural_end
+        return None
+
+    def find_all(self, text, overlapping=False):
+        """
+        Devuelve las coincidencias de palabra completa en orden de aparición.
+
+        Por defecto se eligen las coincidencias más largas sin solapamiento
+        ("tos con sangre" gana sobre "tos"); con overlapping=True se devuelven todas.
+        """
+        normalized, offsets = _normalize_with_offsets(text)
+        found = []
+        state = 0
+        for position, char in enumerate(normalized):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for length, pattern_id in self._output[state]:
+                start = position - length + 1
+                end = position + 1
+                if start > 0 and _is_word_char(normalized[start - 1]):
+                    continue
+                end = self._word_end(normalized, end)
+                if end is None:
+                    continue
+                found.append((start, end, pattern_id))
+
+        found.sort(key=lambda match: (match[0], -(match[1] - match[0])))
+        if not overlapping:
+            selected = []
+            last_end = 0
+            for start, end, pattern_id in found:
+                if start >= last_end:
+                    selected.append((start, end, pattern_id))
+                    last_end = end
+            found = selected
+
+        return [
+            KeywordMatch(
+                term=self._terms[pattern_id],
+                value=self._values[pattern_id],
+                start=offsets[start],
+                end=offsets[end - 1] + 1,
+            )
+            for start, end, pattern_id in found
+        ]
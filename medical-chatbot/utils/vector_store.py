@@ -1,51 +1,111 @@
+import logging
 import os
 from langchain.vectorstores import Chroma
 from langchain.embeddings import HuggingFaceEmbeddings
-from langchain.document_loaders import TextLoader, DirectoryLoader
-from langchain.text_splitter import CharacterTextSplitter
+from utils.ingest import KNOWLEDGE_DIRECTORY, PERSIST_DIRECTORY, sync_knowledge_base
 
-def get_vector_store():
+EMBEDDING_MODEL_NAME = "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
+
+logger = logging.getLogger(__name__)
+
+def get_embeddings():
+    """
+    Devuelve el modelo de embeddings multilingüe usado por la base vectorial.
+    Con MEDICHAT_EMBEDDING_SOCKET se usa el servidor de embeddings compartido
+    (utils/embedding_server.py) en lugar de cargar el modelo en este proceso.
+    """
+    from utils.embedding_server import create_remote_embeddings
+    remote = create_remote_embeddings()
+    if remote is not None:
+        logger.info("Embeddings desde el servidor en %s", remote.socket_path)
+        return remote
+    return load_embedding_model()
+
+def load_embedding_model():
+    """Carga el modelo de embeddings en el proceso actual"""
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+
+def get_vector_store(embeddings=None, persist_directory=None):
     """
     Configura y devuelve la base de datos vectorial con información médica.
     """
     # Directorio donde se almacenarán los datos de Chroma
-    persist_directory = "chroma_db"
-    
-    # Verificar si la base de datos ya existe
-    if os.path.exists(persist_directory) and len(os.listdir(persist_directory)) > 0:
-        # Cargar base de datos existente
-        embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
-        )
-        db = Chroma(persist_directory=persist_directory, embedding_function=embeddings)
-        return db
-    else:
-        # Crear nueva base de datos
-        # 1. Cargar documentos
-        loader = DirectoryLoader(
-            "./data/medical_knowledge/",
-            glob="**/*.txt",
-            loader_cls=TextLoader
-        )
-        documents = loader.load()
-        
-        # 2. Dividir documentos en chunks
-        text_splitter = CharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200
-        )
-        chunks = text_splitter.split_documents(documents)
-        
-        # 3. Crear embeddings
-        embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
+    persist_directory = persist_directory or PERSIST_DIRECTORY
+
+    # Reutilizar el modelo de embeddings si ya fue cargado
+    if embeddings is None:
+        embeddings = get_embeddings()
+
+    db = Chroma(persist_directory=persist_directory, embedding_function=embeddings)
+    backend = os.environ.get("MEDICHAT_VECTOR_BACKEND", "chroma")
+
+    # Embeber solo los chunks nuevos o modificados y reparar un índice incompleto
+    # (desactivable con MEDICHAT_AUTO_INGEST=0 para usar el índice tal cual)
+    if os.environ.get("MEDICHAT_AUTO_INGEST", "1") != "0":
+        sync_knowledge_base(
+            db,
+            knowledge_directory=KNOWLEDGE_DIRECTORY,
+            persist_directory=persist_directory,
+            embedding_model=EMBEDDING_MODEL_NAME,
+            # Con FAISS no se consulta el HNSW de Chroma: cargarlo en cada worker
+            # anularía el índice compartido
+            check_index=backend != "faiss",
         )
-        
-        # 4. Crear y persistir base de datos vectorial
-        db = Chroma.from_documents(
-            documents=chunks,
-            embedding=embeddings,
-            persist_directory=persist_directory
+
+    # Backend de búsqueda (MEDICHAT_VECTOR_BACKEND): Chroma directamente o un
+    # índice FAISS exportado de la colección y abierto con mmap
+    vector_store = db
+    if backend == "faiss":
+        from utils.faiss_store import create_faiss_store
+        try:
+            vector_store = create_faiss_store(db, persist_directory)
+        except ValueError:
+            logger.warning("No se pudo crear el índice FAISS; se usa Chroma", exc_info=True)
+    elif backend != "chroma":
+        raise ValueError(f"Backend de base vectorial desconocido: {backend}")
+
+    # Modo de recuperación (MEDICHAT_RETRIEVAL_MODE): solo vectorial, o
+    # combinado con un índice BM25 de los mismos chunks
+    mode = os.environ.get("MEDICHAT_RETRIEVAL_MODE", "hybrid")
+    if mode == "vector":
+        return vector_store
+    from utils.bm25_index import RETRIEVAL_MODES, create_hybrid_store
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Modo de recuperación desconocido: {mode}")
+    return create_hybrid_store(vector_store, db, persist_directory, mode)
+
+class AsyncVectorStore:
+    """
+    Envoltorio de la base vectorial que ejecuta embeddings y búsquedas en un
+    executor acotado, para no bloquear el event loop de Chainlit.
+    """
+
+    def __init__(self, vector_store, executor):
+        self.vector_store = vector_store
+        self.executor = executor
+
+    async def aretrieve(self, query, k=4, embedding=None):
+        """
+        Documentos relevantes para la consulta. Si ya se calculó su vector se
+        reutiliza; las bases híbridas usan además el texto para BM25.
+        """
+        if hasattr(self.vector_store, "retrieve"):
+            return await self.executor.run(self.vector_store.retrieve, query, k=k, embedding=embedding)
+        if embedding is not None:
+            return await self.asimilarity_search_by_vector(embedding, k=k)
+        return await self.asimilarity_search(query, k=k)
+
+    async def asimilarity_search(self, query, k=4, **kwargs):
+        return await self.executor.run(self.vector_store.similarity_search, query, k=k, **kwargs)
+
+    async def asimilarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return await self.executor.run(
+            self.vector_store.similarity_search_by_vector, embedding, k=k, **kwargs
         )
-        db.persist()
-        return db
\ No newline at end of file
+
+    async def aembed_query(self, text):
+        return await self.executor.run(self.vector_store.embeddings.embed_query, text)
+
+    def __getattr__(self, name):
+        # Cualquier otro atributo se delega a la base vectorial original
+        return getattr(self.vector_store, name)
@@ -0,0 +1,95 @@
+"""
+Calentamiento del servidor al arrancar.
+
+Carga todos los recursos compartidos, ejecuta un embedding de prueba (para que
+torch reserve sus buffers antes de la primera consulta real), abre la colección
+de Chroma con una búsqueda y compila las cadenas de prompts. La ruta /ready
+responde 503 mientras dura y también si falló, así el balanceador solo envía
+tráfico a los procesos que cargaron todo.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+from utils.resources import registry
+
+logger = logging.getLogger(__name__)
+
+WARMUP_TEXT = "dolor de cabeza y fiebre"
+
+# Fin del calentamiento, con o sin error: las sesiones dejan de esperar
+ready = threading.Event()
+timings = {}  # paso -> segundos
+error = None
+
+
+def _step(name, func):
+    start = time.perf_counter()
+    result = func()
+    timings[name] = time.perf_counter() - start
+    return result
+
+
+def _open_vector_store():
+    vector_store = registry.get("vector_store")
+    # Una búsqueda carga el índice HNSW de la colección en memoria
+    vector = registry.get("embeddings").embed_query(WARMUP_TEXT)
+    vector_store.similarity_search_by_vector(vector, k=1)
+    return vector_store
+
+
+def warm_up():
+    """Carga y calienta los recursos de forma síncrona; devuelve los tiempos de cada paso"""
+    global error
+    start = time.perf_counter()
+    try:
+        embeddings = _step("embeddings", lambda: registry.get("embeddings"))
+        # Se usa el modelo directo para que el texto de prueba no quede en la caché de consultas
+        _step("dummy_embedding", lambda: embeddings.embed_query(WARMUP_TEXT))
+        _step("vector_store", _open_vector_store)
+        _step("llm", lambda: registry.get("llm"))
+        _step("chains", lambda: registry.get("chains"))
+        # El resto de los recursos (cachés, especialistas, executor...)
+        _step("others", registry.preload)
+    except Exception as e:
+        error = e
+        logger.exception("Falló el calentamiento; los recursos se cargarán al pedirlos")
+    timings["total"] = time.perf_counter() - start
+    logger.info("Calentamiento terminado en %.1f s", timings["total"])
+    ready.set()
+    return timings
+
+
+def start_warm_up():
+    """Lanza el calentamiento en un hilo para no retrasar el arranque del servidor"""
+    thread = threading.Thread(target=warm_up, name="medichat-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def is_ready():
+    """True si el calentamiento terminó sin errores"""
+    return ready.is_set() and error is None
+
+
+async def wait_until_ready(timeout=None):
+    """Espera el fin del calentamiento sin bloquear el event loop"""
+    if ready.is_set():
+        return True
+    return await asyncio.get_running_loop().run_in_executor(None, ready.wait, timeout)
+
+
+def mount_readiness_route(app, path="/ready"):
+    """Publica la señal de disponibilidad: 200 si el calentamiento terminó bien, 503 si no"""
+    from fastapi.responses import JSONResponse
+
+    from utils.routes import add_priority_route
+
+    async def readiness_endpoint():
+        body = {"ready": is_ready(), "timings": dict(timings)}
+        if error is not None:
+            body["error"] = str(error)
+        return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+    add_priority_route(app, path, readiness_endpoint)